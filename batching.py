@@ -0,0 +1,197 @@
+"""
+动态批处理推理
+多个线程 (如多个浏览器会话) 并发提交请求, 后台工作线程在延迟预算内
+(最大批大小 / 最长等待时间) 把参数相同的请求合并成一批, 模型只前向一次,
+再把结果分发给各请求的 Future。与设备无关 (CPU/CUDA 均可)。
+
+排队策略默认先进先出; 子类可覆盖 _enqueue/_peek/_pending_count/_matching/_take 实现其他调度
+(如 scheduler.SessionScheduler 的按会话轮转)。
+
+用法:
+    worker = BatchingInferenceWorker(lambda items: [f(x) for x in items], max_batch_size=8)
+    future = worker.submit(item)
+    value = future.result()
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class _Request:
+    """排队的请求; 合并的请求 (如摄像头帧替换旧帧) 有多个等待结果的 Future"""
+
+    __slots__ = ('item', 'key', 'futures', 'enqueued')
+
+    def __init__(self, item, key):
+        self.item = item
+        self.key = key
+        self.futures = [Future()]
+        self.enqueued = time.monotonic()
+
+
+class BatchingInferenceWorker:
+    """
+    动态批处理工作线程
+
+    batch_fn 接收请求项列表, 返回等长的结果列表。只有 key 相同的请求会被合并
+    (例如推理参数不同的请求不能放进同一批); 其他请求保持先后顺序, 进入后续批次。
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10.0, name="inference-worker"):
+        """
+        Args:
+            batch_fn: 函数 (请求项列表) -> 结果列表
+            max_batch_size: 每批最多合并的请求数
+            max_wait_ms: 批中第一个请求最长等待多久 (毫秒) 以凑满批次
+            name: 工作线程名称
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.requests = 0
+        self.completed = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, key=None):
+        """
+        提交一个请求
+
+        Args:
+            item: 请求项 (传给 batch_fn)
+            key: 合批键 (只有相同键的请求会被合并)
+
+        Returns:
+            future: concurrent.futures.Future, 结果或 batch_fn 抛出的异常
+        """
+        request = _Request(item, key)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("推理工作线程已关闭")
+            self._enqueue(request)
+            self.requests += 1
+            self._cond.notify_all()
+        return request.futures[0]
+
+    def __call__(self, item, key=None):
+        """同步调用: 提交并等待结果"""
+        return self.submit(item, key).result()
+
+    def close(self, wait=True):
+        """停止接收请求; 已提交的请求仍会处理完"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self):
+        """请求数、批次数和平均批大小"""
+        with self._cond:
+            return {
+                'requests': self.requests,
+                'completed': self.completed,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'mean_batch_size': self.completed / self.batches if self.batches else 0.0,
+                'pending': self._pending_count(),
+            }
+
+    # ------------------------------------------------------------------
+    # 排队策略 (调用方持有 self._cond); 默认先进先出
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, request):
+        """加入排队"""
+        self._pending.append(request)
+
+    def _peek(self):
+        """决定下一批的请求 (其键为批次键, 其入队时间决定截止时间); 无排队请求时返回 None"""
+        return self._pending[0] if self._pending else None
+
+    def _pending_count(self):
+        """排队中的请求数"""
+        return len(self._pending)
+
+    def _matching(self, key):
+        """排队中键为 key 的请求数"""
+        return sum(1 for request in self._pending if request.key == key)
+
+    def _take(self, key, limit):
+        """取出最多 limit 个键为 key 的请求 (按提交顺序), 其余请求保持顺序"""
+        batch, rest = [], deque()
+        for request in self._pending:
+            if request.key == key and len(batch) < limit:
+                batch.append(request)
+            else:
+                rest.append(request)
+        self._pending = rest
+        return batch
+
+    def _next_batch(self):
+        """等待并取出下一批 (同键请求); 关闭且队列为空时返回 None"""
+        with self._cond:
+            while self._peek() is None and not self._closed:
+                self._cond.wait()
+            head = self._peek()
+            if head is None:
+                return None
+
+            # 以排在最前的请求为准: 凑满批次或到达截止时间 (关闭时不再等待)
+            key = head.key
+            deadline = head.enqueued + self.max_wait
+            while not self._closed and self._matching(key) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            self.batches += 1
+            return self._take(key, self.max_batch_size)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            # 所有调用方都已取消的请求不再计算
+            for request in batch:
+                request.futures = [future for future in request.futures if future.set_running_or_notify_cancel()]
+            batch = [request for request in batch if request.futures]
+            if not batch:
+                continue
+
+            try:
+                results = self.batch_fn([request.item for request in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch_fn 返回 {len(results)} 个结果, 期望 {len(batch)} 个")
+            except Exception as e:
+                with self._cond:
+                    self.failed_batches += 1
+                for request in batch:
+                    for future in request.futures:
+                        future.set_exception(e)
+                continue
+
+            with self._cond:
+                self.completed += len(batch)
+            for request, result in zip(batch, results):
+                for future in request.futures:
+                    future.set_result(result)
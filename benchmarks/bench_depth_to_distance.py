@@ -0,0 +1,231 @@
+"""
+depth_to_distance 基准测试
+对比向量化实现与原逐框实现 (1 / 50 / 500 个检测框), 并校验输出一致
+(ROI均值由积分图求得, 与逐框 np.mean 只有浮点舍入差异)
+
+用法:
+    python benchmarks/bench_depth_to_distance.py
+    python benchmarks/bench_depth_to_distance.py --height 2160 --width 3840 --repeats 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 深度值 (0.7*中位数 + 0.3*均值) 与原实现的最大允许差异 (浮点舍入)
+DEPTH_ATOL = 1e-6
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import LightLocalization3D  # noqa: E402
+
+
+def reference_depth_to_distance(depth_map, detections, camera_params=None, image_size=None):
+    """原逐框实现 (向量化之前的版本), 作为正确性和性能基准"""
+    if depth_map is None or not detections:
+        return detections
+
+    if camera_params is None:
+        camera_params = {}
+
+    results = []
+
+    for det in detections:
+        x1, y1, x2, y2 = det['box'].astype(int)
+
+        center_y = (y1 + y2) / 2
+        if image_size:
+            rel_y = center_y / image_size[1]
+        else:
+            rel_y = center_y / depth_map.shape[0]
+
+        label = det['label'].lower()
+
+        if any(kw in label for kw in ['ceiling', 'chandelier', 'pendant', 'hanging', 'recessed', 'downlight']):
+            if rel_y < 0.4:
+                min_distance = 2.0
+                max_distance = 4.5
+            else:
+                min_distance = 1.5
+                max_distance = 4.0
+        elif any(kw in label for kw in ['wall', 'sconce']):
+            min_distance = 1.0
+            max_distance = 3.5
+        elif any(kw in label for kw in ['table', 'desk', 'floor', 'standing']):
+            if rel_y > 0.6:
+                min_distance = 0.5
+                max_distance = 2.5
+            else:
+                min_distance = 1.0
+                max_distance = 3.0
+        elif any(kw in label for kw in ['spotlight', 'track', 'can', 'pot']):
+            min_distance = 1.5
+            max_distance = 4.0
+        else:
+            min_distance = 0.8
+            max_distance = 4.5
+
+        min_distance = camera_params.get('min_distance', min_distance)
+        max_distance = camera_params.get('max_distance', max_distance)
+
+        x1_clip = max(0, x1)
+        y1_clip = max(0, y1)
+        x2_clip = min(depth_map.shape[1], x2)
+        y2_clip = min(depth_map.shape[0], y2)
+
+        if x2_clip > x1_clip and y2_clip > y1_clip:
+            roi_depth = depth_map[y1_clip:y2_clip, x1_clip:x2_clip]
+
+            median_depth = np.median(roi_depth)
+            mean_depth = np.mean(roi_depth)
+            combined_depth = 0.7 * median_depth + 0.3 * mean_depth
+
+            if combined_depth < 0.3:
+                distance = min_distance + combined_depth * (max_distance - min_distance) / 0.3
+            else:
+                normalized_depth = (combined_depth - 0.3) / 0.7
+                distance = min_distance + (max_distance - min_distance) * 0.3 + \
+                          (max_distance - min_distance) * 0.7 * (np.log1p(normalized_depth * 2) / np.log1p(2))
+
+            box_area = (x2 - x1) * (y2 - y1)
+            image_area = depth_map.shape[0] * depth_map.shape[1]
+            area_ratio = box_area / image_area
+
+            if area_ratio > 0.15:
+                distance *= 0.85
+            elif area_ratio < 0.02:
+                distance *= 1.15
+
+            distance = np.clip(distance, min_distance, max_distance)
+
+            det_copy = det.copy()
+            det_copy['distance'] = distance
+            det_copy['depth_value'] = combined_depth
+            det_copy['distance_range'] = (min_distance, max_distance)
+            det_copy['position_hint'] = 'upper' if rel_y < 0.4 else 'middle' if rel_y < 0.6 else 'lower'
+            results.append(det_copy)
+        else:
+            det_copy = det.copy()
+            det_copy['distance'] = None
+            results.append(det_copy)
+
+    return results
+
+
+def make_detections(num_boxes, height, width, labels, seed=0):
+    """生成随机检测框 (含部分越界框, 覆盖裁剪分支)"""
+    rng = np.random.default_rng(seed)
+    detections = []
+    for _ in range(num_boxes):
+        box_w = rng.uniform(4, width * 0.5)
+        box_h = rng.uniform(4, height * 0.5)
+        x1 = rng.uniform(-0.05 * width, width - box_w * 0.5)
+        y1 = rng.uniform(-0.05 * height, height - box_h * 0.5)
+        detections.append({
+            'box': np.array([x1, y1, x1 + box_w, y1 + box_h], dtype=np.float32),
+            'confidence': float(rng.uniform(0.1, 1.0)),
+            'label': labels[rng.integers(len(labels))]
+        })
+    return detections
+
+
+def assert_close(expected, actual, depth_atol=DEPTH_ATOL):
+    """
+    逐字段校验输出一致: 深度值在容差内, 距离按相同的映射换算后一致, 其余字段完全相同
+
+    Returns:
+        max_diff: 深度值的最大差异
+    """
+    assert len(expected) == len(actual)
+    max_diff = 0.0
+    for exp, act in zip(expected, actual):
+        assert exp.keys() == act.keys(), (exp.keys(), act.keys())
+        for key in exp:
+            a, b = exp[key], act[key]
+            if key == 'depth_value':
+                assert abs(a - b) <= depth_atol, (key, a, b)
+                max_diff = max(max_diff, abs(a - b))
+            elif key == 'distance':
+                assert (a is None) == (b is None), (key, a, b)
+                if a is not None:
+                    low, high = exp['distance_range']
+                    assert abs(a - b) <= depth_atol * (high - low) / 0.3 * 1.15 + 1e-6, (key, a, b)
+            elif isinstance(a, np.ndarray):
+                assert np.array_equal(a, b), key
+            else:
+                assert a == b, (key, a, b)
+    return max_diff
+
+
+def time_call(fn, repeats):
+    """返回多次调用的中位耗时 (毫秒)"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="depth_to_distance 基准测试")
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    pipeline = object.__new__(LightLocalization3D)
+    labels = [
+        "chandelier", "ceiling light", "wall sconce", "table lamp", "floor lamp",
+        "spotlight", "track light", "LED panel", "light fixture", "light"
+    ]
+
+    rng = np.random.default_rng(42)
+    depth_map = cv_smooth(rng.random((args.height, args.width), dtype=np.float32))
+    image_size = (args.width, args.height)
+
+    print("=" * 60)
+    print(f"depth_to_distance 基准测试 ({args.width}x{args.height}, 重复 {args.repeats} 次)")
+    print("=" * 60)
+    print(f"{'框数':>6} | {'原实现 (ms)':>12} | {'向量化 (ms)':>12} | {'加速比':>6} | {'深度最大差异':>10}")
+
+    for num_boxes in args.boxes:
+        detections = make_detections(num_boxes, args.height, args.width, labels, seed=num_boxes)
+
+        expected = reference_depth_to_distance(depth_map, detections, image_size=image_size)
+        actual = pipeline.depth_to_distance(depth_map, detections, image_size=image_size)
+        max_diff = assert_close(expected, actual)
+
+        overrides = {'min_distance': 1.0, 'max_distance': 5.0}
+        assert_close(
+            reference_depth_to_distance(depth_map, detections, camera_params=overrides),
+            pipeline.depth_to_distance(depth_map, detections, camera_params=overrides)
+        )
+
+        ref_ms = time_call(
+            lambda: reference_depth_to_distance(depth_map, detections, image_size=image_size),
+            args.repeats
+        )
+        vec_ms = time_call(
+            lambda: pipeline.depth_to_distance(depth_map, detections, image_size=image_size),
+            args.repeats
+        )
+        print(f"{num_boxes:>6} | {ref_ms:>12.3f} | {vec_ms:>12.3f} | {ref_ms / vec_ms:>5.2f}x | {max_diff:>10.2e}")
+
+    print("=" * 60)
+    print(f"✓ 输出与原实现一致 (深度值差异 <{DEPTH_ATOL})")
+
+
+def cv_smooth(depth_map):
+    """平滑随机深度图并归一化到 [0, 1], 使ROI统计更接近真实深度图"""
+    import cv2
+    depth_map = cv2.GaussianBlur(depth_map, (31, 31), 0)
+    return (depth_map - depth_map.min()) / (depth_map.max() - depth_map.min() + 1e-8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+流水线基准测试
+在微型随机模型 (CPU, 离线) 上测量各阶段和完整流水线的耗时:
+detect_lights / extract_features / estimate_depth / depth_to_distance / process_image,
+遍历 分辨率 × 提示词策略 (PROMPT_STRATEGIES) × 批大小 × 线程数, 每个组合先预热再重复计时,
+结果写入JSON, 可与之前的结果对比找出性能回退。
+
+说明:
+- batch_size > 1 时各阶段调用对应的批量实现 (_detect_lights_batch 等), process_image 调用 process_batch
+- 提示词只影响 detect_lights 和 process_image, 其余阶段每个组合只测一次
+- depth_to_distance 使用 estimate_depth 的输出和随机检测框 (--boxes 个)
+- 计时前先检查该阶段没有失败 (流水线内部会捕获异常并返回空结果, 否则测到的是失败路径)
+- 每个组合同时记录流水线的子阶段耗时 (pipeline.metrics: 处理器/前向/后处理/插值等) 的中位数
+
+用法:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --quick          # 单一组合的快速检查 (CI)
+    python benchmarks/bench_pipeline.py --resolutions 640x480 1920x1080 --batch-sizes 1 4 --threads 1 4
+    python benchmarks/bench_pipeline.py --baseline results/bench_pipeline.json --output results/bench_new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import transformers  # noqa: E402
+
+from bench_depth_to_distance import make_detections  # noqa: E402
+from config_multi_lights import PROMPT_STRATEGIES  # noqa: E402
+from pipeline import LightLocalization3D  # noqa: E402
+from tiny_models import build_tiny_models  # noqa: E402
+
+STAGES = ("detect_lights", "extract_features", "estimate_depth", "depth_to_distance", "process_image")
+
+# 受提示词影响的阶段
+PROMPT_STAGES = ("detect_lights", "process_image")
+
+
+def parse_resolution(text):
+    """'640x480' → (640, 480)"""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def make_images(resolution, count, seed=0):
+    """生成平滑随机图像 (BGR uint8), 避免纯噪声下处理器/检测行为过于特殊"""
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        noise = rng.random((height, width, 3), dtype=np.float32)
+        image = cv2.GaussianBlur(noise, (0, 0), sigmaX=max(width, height) / 64)
+        image = (image - image.min()) / (image.max() - image.min() + 1e-8)
+        images.append((image * 255).astype(np.uint8))
+    return images
+
+
+def measure(fn, warmup, repeats, on_start=None):
+    """
+    预热后重复计时
+
+    Args:
+        on_start: 预热结束、计时开始前调用 (如清空流水线指标)
+
+    Returns:
+        stats: {'median_ms', 'mean_ms', 'min_ms', 'p95_ms', 'std_ms', 'samples_ms'}
+    """
+    for _ in range(warmup):
+        fn()
+    if on_start is not None:
+        on_start()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - start) / 1e6)
+    samples = np.array(samples)
+    return {
+        'median_ms': float(np.median(samples)),
+        'mean_ms': float(samples.mean()),
+        'min_ms': float(samples.min()),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'std_ms': float(samples.std()),
+        'samples_ms': [round(float(s), 4) for s in samples],
+    }
+
+
+def stage_fn(pipeline, stage, images, args):
+    """某个阶段在一批图像上的一次调用"""
+    if stage == "detect_lights":
+        return lambda: pipeline._try_detect_lights_batch(images, confidence_threshold=args.confidence)
+    if stage == "extract_features":
+        return lambda: pipeline._extract_features_batch(images)
+    if stage == "estimate_depth":
+        return lambda: pipeline._estimate_depth_batch(images)
+    if stage == "depth_to_distance":
+        height, width = images[0].shape[:2]
+        depth_maps = pipeline._estimate_depth_batch(images)
+        detections = [
+            make_detections(args.boxes, height, width, PROMPT_STRATEGIES['indoor'], seed=i)
+            for i in range(len(images))
+        ]
+        return lambda: [
+            pipeline.depth_to_distance(depth_map, dets, image_size=(width, height))
+            for depth_map, dets in zip(depth_maps, detections)
+        ]
+    if stage == "process_image":
+        return lambda: pipeline.process_batch(
+            images, confidence_threshold=args.confidence, batch_size=len(images)
+        )
+    raise ValueError(f"未知阶段: {stage}")
+
+
+def check_stage(pipeline, stage, fn, images, args):
+    """运行一次并确认阶段没有失败 (失败时流水线只打印警告并返回空结果)"""
+    output = fn()
+    if stage == "detect_lights":
+        failed = output is None
+    elif stage in ("extract_features", "estimate_depth"):
+        failed = any(value is None for value in output)
+    elif stage == "process_image":
+        failed = (
+            pipeline._try_detect_lights_batch(images, confidence_threshold=args.confidence) is None
+            or any(result['depth_map'] is None for result in output)
+        )
+    else:
+        failed = False
+    if failed:
+        raise RuntimeError(f"{stage} 运行失败 (见上方警告), 基准结果无效")
+
+
+def result_key(result):
+    """对比时用于匹配两次运行结果的键"""
+    return (
+        result['stage'], tuple(result['resolution']), result['prompt_set'],
+        result['batch_size'], result['threads']
+    )
+
+
+def compare_results(results, baseline_path, tolerance):
+    """
+    与之前的JSON结果对比 (按中位耗时)
+
+    Returns:
+        regressions: 变慢超过 tolerance 的组合数
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+
+    print(f"\n对比基线: {baseline_path} (容差 {tolerance:.0%})")
+    regressions = 0
+    for result in results:
+        reference = baseline.get(result_key(result))
+        if reference is None:
+            continue
+        ratio = result['median_ms'] / reference['median_ms'] if reference['median_ms'] else float('inf')
+        result['baseline_median_ms'] = reference['median_ms']
+        result['ratio'] = ratio
+        if ratio > 1 + tolerance:
+            regressions += 1
+            width, height = result['resolution']
+            print(
+                f"  ⚠️ {result['stage']} {width}x{height} prompts={result['prompt_set']} "
+                f"batch={result['batch_size']} threads={result['threads']}: "
+                f"{reference['median_ms']:.2f}ms → {result['median_ms']:.2f}ms ({ratio:.2f}x)"
+            )
+    if regressions:
+        print(f"✗ {regressions} 个组合性能回退")
+    else:
+        print("✓ 无性能回退")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流水线基准测试 (微型随机模型, CPU)")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720"], help="宽x高")
+    parser.add_argument("--prompt-sets", nargs="+", default=list(PROMPT_STRATEGIES),
+                        choices=list(PROMPT_STRATEGIES), help="config_multi_lights.PROMPT_STRATEGIES 中的策略")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}),
+                        help="torch/OpenCV 线程数")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--confidence", type=float, default=0.15)
+    parser.add_argument("--boxes", type=int, default=50, help="depth_to_distance 每张图像的检测框数")
+    parser.add_argument("--seed", type=int, default=0, help="微型模型权重的随机种子")
+    parser.add_argument("--models-dir", default=None, help="微型模型目录 (默认系统临时目录, 生成后复用)")
+    parser.add_argument("--output", default="results/bench_pipeline.json")
+    parser.add_argument("--baseline", default=None, help="之前的结果JSON, 对比中位耗时")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="判定回退的变慢比例")
+    parser.add_argument("--quick", action="store_true",
+                        help="快速检查: 640x480, simple 提示词, 批大小1, 单线程, 预热1次, 重复3次")
+    args = parser.parse_args()
+    if args.quick:
+        args.resolutions, args.prompt_sets = ["640x480"], ["simple"]
+        args.batch_sizes, args.threads = [1], [1]
+        args.warmup, args.repeats = 1, 3
+
+    models_dir = args.models_dir or Path(tempfile.gettempdir()) / "light3d_tiny_models"
+    paths = build_tiny_models(models_dir, seed=args.seed)
+
+    pipeline = LightLocalization3D(
+        detection_model=paths['detection'],
+        feature_model=paths['features'],
+        depth_model=paths['depth'],
+        device="cpu",
+        enable_fallback=False,
+        lazy_features=False,
+        amp=False
+    )
+
+    resolutions = [parse_resolution(text) for text in args.resolutions]
+    default_threads = torch.get_num_threads()
+    results = []
+
+    print("=" * 80)
+    print(f"流水线基准测试 (微型随机模型, 预热 {args.warmup} 次, 重复 {args.repeats} 次)")
+    print("=" * 80)
+    print(f"{'阶段':<18} {'分辨率':>10} {'提示词':>11} {'批大小':>6} {'线程':>4} "
+          f"{'中位(ms)':>10} {'p95(ms)':>10} {'每图(ms)':>10}")
+
+    try:
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            cv2.setNumThreads(threads)
+            for resolution in resolutions:
+                for batch_size in args.batch_sizes:
+                    images = make_images(resolution, batch_size, seed=batch_size)
+                    for stage in args.stages:
+                        prompt_sets = args.prompt_sets if stage in PROMPT_STAGES else [None]
+                        for prompt_set in prompt_sets:
+                            if prompt_set is not None:
+                                pipeline.light_prompts = list(PROMPT_STRATEGIES[prompt_set])
+
+                            fn = stage_fn(pipeline, stage, images, args)
+                            check_stage(pipeline, stage, fn, images, args)
+                            stats = measure(fn, args.warmup, args.repeats, on_start=pipeline.metrics.reset)
+                            substages = {
+                                name: round(values['p50'] * 1e3, 4)
+                                for name, values in pipeline.metrics.snapshot()['stages'].items()
+                            }
+                            result = {
+                                'stage': stage,
+                                'resolution': list(resolution),
+                                'prompt_set': prompt_set,
+                                'num_prompts': len(PROMPT_STRATEGIES[prompt_set]) if prompt_set else None,
+                                'batch_size': batch_size,
+                                'threads': threads,
+                                'warmup': args.warmup,
+                                'repeats': args.repeats,
+                                'per_image_ms': stats['median_ms'] / batch_size,
+                                **stats,
+                                'substages_p50_ms': substages,
+                            }
+                            results.append(result)
+                            print(
+                                f"{stage:<18} {resolution[0]:>5}x{resolution[1]:<4} {prompt_set or '-':>11} "
+                                f"{batch_size:>6} {threads:>4} {stats['median_ms']:>10.2f} "
+                                f"{stats['p95_ms']:>10.2f} {result['per_image_ms']:>10.2f}"
+                            )
+    finally:
+        torch.set_num_threads(default_threads)
+
+    regressions = compare_results(results, args.baseline, args.tolerance) if args.baseline else 0
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'transformers': transformers.__version__,
+            'models': {name: Path(path).name for name, path in paths.items()},
+            'model_seed': args.seed,
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ 结果已保存: {output_path}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+基准测试用的微型随机模型 (离线, CPU)
+
+按流水线使用的三种架构 (OWLv2 / DINOv2 / Depth Anything) 构造极小的随机初始化配置,
+连同图像处理器和分词器一起 save_pretrained 到本地目录, 流水线像加载 Hub 模型一样
+从目录加载, 完整走一遍真实的加载、预处理、前向和后处理代码路径。
+
+分词器为字节级CLIP词表 (无BPE合并), 任意提示词都能编码, 不需要下载。
+
+用法:
+    paths = build_tiny_models("/tmp/light3d_tiny_models")
+    pipeline = LightLocalization3D(
+        detection_model=paths['detection'], feature_model=paths['features'],
+        depth_model=paths['depth'], device="cpu"
+    )
+"""
+
+import json
+from pathlib import Path
+
+import torch
+
+# 版本号: 配置变化时递增, 已生成的旧目录不会被误用
+TINY_MODELS_VERSION = 1
+
+# 检测器输入边长 (OWLv2处理器把图像填充为正方形后缩放到此尺寸)
+DETECTION_IMAGE_SIZE = 64
+# 字节级分词每个字符一个词元, 需容纳最长的提示词 (如 "recessed ceiling light") 加起止符
+TEXT_MAX_LENGTH = 64
+
+
+def _bytes_to_unicode():
+    """CLIP/GPT-2 字节级BPE使用的 字节 → 可见字符 映射"""
+    bs = (
+        list(range(ord("!"), ord("~") + 1))
+        + list(range(ord("¡"), ord("¬") + 1))
+        + list(range(ord("®"), ord("ÿ") + 1))
+    )
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return [chr(c) for c in cs]
+
+
+def _build_tokenizer(directory):
+    """字节级CLIP分词器 (每个字节一个词元)"""
+    from transformers import CLIPTokenizer
+
+    vocab = {}
+    characters = _bytes_to_unicode()
+    for suffix in ("", "</w>"):
+        for character in characters:
+            vocab[character + suffix] = len(vocab)
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "vocab.json", "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    (directory / "merges.txt").write_text("#version: 0.2\n", encoding="utf-8")
+    return CLIPTokenizer(
+        str(directory / "vocab.json"), str(directory / "merges.txt"), model_max_length=TEXT_MAX_LENGTH
+    )
+
+
+def _build_detection(directory, tokenizer_dir):
+    from transformers import Owlv2Config, Owlv2ForObjectDetection, Owlv2ImageProcessor, Owlv2Processor
+
+    tokenizer = _build_tokenizer(tokenizer_dir)
+    vocab_size = len(tokenizer)
+    config = Owlv2Config(
+        text_config=dict(
+            vocab_size=vocab_size, hidden_size=32, intermediate_size=64,
+            num_hidden_layers=1, num_attention_heads=2, max_position_embeddings=TEXT_MAX_LENGTH,
+            bos_token_id=vocab_size - 2, eos_token_id=vocab_size - 1, pad_token_id=vocab_size - 1
+        ),
+        vision_config=dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+            image_size=DETECTION_IMAGE_SIZE, patch_size=16
+        ),
+        projection_dim=32
+    )
+    Owlv2ForObjectDetection(config).save_pretrained(directory)
+    processor = Owlv2Processor(
+        image_processor=Owlv2ImageProcessor(size={"height": DETECTION_IMAGE_SIZE, "width": DETECTION_IMAGE_SIZE}),
+        tokenizer=tokenizer
+    )
+    processor.save_pretrained(directory)
+
+
+def _build_features(directory):
+    from transformers import BitImageProcessor, Dinov2Config, Dinov2Model
+
+    config = Dinov2Config(
+        hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64,
+        image_size=32, patch_size=8
+    )
+    Dinov2Model(config).save_pretrained(directory)
+    BitImageProcessor(
+        size={"shortest_edge": 32}, crop_size={"height": 32, "width": 32}
+    ).save_pretrained(directory)
+
+
+def _build_depth(directory):
+    from transformers import DepthAnythingConfig, DepthAnythingForDepthEstimation, Dinov2Config, DPTImageProcessor
+
+    backbone = Dinov2Config(
+        hidden_size=32, num_hidden_layers=4, num_attention_heads=2, intermediate_size=64,
+        image_size=28, patch_size=14, out_features=["stage1", "stage2", "stage3", "stage4"],
+        reshape_hidden_states=False
+    )
+    config = DepthAnythingConfig(
+        backbone_config=backbone, reassemble_hidden_size=32, neck_hidden_sizes=[8, 16, 32, 32],
+        fusion_hidden_size=16, head_hidden_size=8
+    )
+    DepthAnythingForDepthEstimation(config).save_pretrained(directory)
+    DPTImageProcessor(
+        size={"height": 28, "width": 28}, keep_aspect_ratio=True, ensure_multiple_of=14
+    ).save_pretrained(directory)
+
+
+def build_tiny_models(root, seed=0):
+    """
+    生成 (或复用已生成的) 微型随机模型目录
+
+    Args:
+        root: 输出根目录
+        seed: 随机初始化种子 (同一种子权重相同, 基准结果可比)
+
+    Returns:
+        paths: {'detection': 目录, 'features': 目录, 'depth': 目录}
+    """
+    root = Path(root) / f"v{TINY_MODELS_VERSION}-seed{seed}"
+    paths = {name: root / name for name in ("detection", "features", "depth")}
+    marker = root / "complete"
+    if marker.exists():
+        return {name: str(path) for name, path in paths.items()}
+
+    torch.manual_seed(seed)
+    _build_detection(paths['detection'], root / "tokenizer")
+    _build_features(paths['features'])
+    _build_depth(paths['depth'])
+    marker.write_text("ok\n", encoding="utf-8")
+    return {name: str(path) for name, path in paths.items()}
@@ -0,0 +1,176 @@
+"""
+INT8量化校准/评估
+在 data/ 下的测试图像上分别用FP32和动态INT8量化运行流水线, 报告精度变化和加速比:
+- 检测数量变化 (每张图像)
+- 按IoU匹配的检测框距离误差
+- 未匹配 (漏检/新增) 的检测数
+- 各阶段耗时
+
+用法:
+    python calibrate_quantization.py --images 20
+    python calibrate_quantization.py --models detection depth --output results/quantization_report.json
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from torchvision.ops import box_iou
+
+from pipeline import LightLocalization3D, find_test_images
+
+
+def run_pass(pipeline, images, confidence_threshold):
+    """运行一遍流水线, 返回每张图像的检测结果和耗时"""
+    outputs = []
+    for image in images:
+        result = pipeline.process_image(image, confidence_threshold=confidence_threshold)
+        outputs.append({
+            'detections': [
+                {'box': det['box'].astype(np.float32), 'label': det['label'], 'distance': det.get('distance')}
+                for det in result['detections']
+            ],
+            'timing': result['timing'],
+        })
+    return outputs
+
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """
+    贪心IoU匹配 (按IoU从高到低)
+
+    Returns:
+        pairs: [(reference_index, candidate_index, iou), ...]
+    """
+    if not reference or not candidate:
+        return []
+    ious = box_iou(
+        torch.from_numpy(np.stack([det['box'] for det in reference])),
+        torch.from_numpy(np.stack([det['box'] for det in candidate]))
+    ).numpy()
+
+    pairs = []
+    used_ref, used_cand = set(), set()
+    for flat in np.argsort(-ious, axis=None):
+        i, j = np.unravel_index(flat, ious.shape)
+        if ious[i, j] < iou_threshold:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        pairs.append((int(i), int(j), float(ious[i, j])))
+    return pairs
+
+
+def compare(reference_outputs, candidate_outputs, iou_threshold=0.5):
+    """汇总两遍结果的差异"""
+    count_deltas, distance_errors, label_changes = [], [], 0
+    unmatched_reference, unmatched_candidate, matched = 0, 0, 0
+
+    for ref, cand in zip(reference_outputs, candidate_outputs):
+        ref_dets, cand_dets = ref['detections'], cand['detections']
+        count_deltas.append(len(cand_dets) - len(ref_dets))
+
+        pairs = match_detections(ref_dets, cand_dets, iou_threshold)
+        matched += len(pairs)
+        unmatched_reference += len(ref_dets) - len(pairs)
+        unmatched_candidate += len(cand_dets) - len(pairs)
+        for i, j, _ in pairs:
+            label_changes += ref_dets[i]['label'] != cand_dets[j]['label']
+            if ref_dets[i]['distance'] is not None and cand_dets[j]['distance'] is not None:
+                distance_errors.append(abs(cand_dets[j]['distance'] - ref_dets[i]['distance']))
+
+    def mean_timing(outputs, key):
+        return float(np.mean([out['timing'][key] for out in outputs]))
+
+    timing = {
+        key: {'fp32': mean_timing(reference_outputs, key), 'int8': mean_timing(candidate_outputs, key)}
+        for key in ('detection', 'features', 'depth', 'total')
+    }
+    return {
+        'images': len(reference_outputs),
+        'detections_fp32': sum(len(out['detections']) for out in reference_outputs),
+        'detections_int8': sum(len(out['detections']) for out in candidate_outputs),
+        'count_delta_mean_abs': float(np.mean(np.abs(count_deltas))) if count_deltas else 0.0,
+        'count_delta_max_abs': int(np.max(np.abs(count_deltas))) if count_deltas else 0,
+        'matched': matched,
+        'missed': unmatched_reference,
+        'extra': unmatched_candidate,
+        'label_changes': int(label_changes),
+        'distance_error_mean': float(np.mean(distance_errors)) if distance_errors else None,
+        'distance_error_max': float(np.max(distance_errors)) if distance_errors else None,
+        'timing': timing,
+        'speedup': timing['total']['fp32'] / timing['total']['int8'] if timing['total']['int8'] else None,
+    }
+
+
+def main():
+    """命令行: FP32 vs INT8 精度/速度对比"""
+    parser = argparse.ArgumentParser(description="INT8动态量化校准与评估")
+    parser.add_argument("--images", type=int, default=20, help="使用的图像数")
+    parser.add_argument("--dirs", nargs="+", default=None, help="图像目录 (默认与 pipeline.main 相同)")
+    parser.add_argument("--models", nargs="+", default=["detection", "features", "depth"],
+                        choices=["detection", "features", "depth"], help="需要量化的模型")
+    parser.add_argument("--confidence", type=float, default=0.15)
+    parser.add_argument("--iou", type=float, default=0.5, help="检测框匹配的IoU阈值")
+    parser.add_argument("--output", default="results/quantization_report.json")
+    args = parser.parse_args()
+
+    paths = find_test_images(args.dirs, limit=args.images)
+    images = [image for image in (cv2.imread(str(path)) for path in paths) if image is not None]
+    if not images:
+        print("⚠️ 未找到测试图像")
+        return
+    print(f"校准图像: {len(images)} 张")
+
+    # 同一个流水线先跑FP32, 再原地量化跑INT8 (避免同时驻留两份大模型)
+    pipeline = LightLocalization3D(device="cpu", lazy_features=False)
+    run_pass(pipeline, images[:1], args.confidence)  # 预热
+
+    print("\n运行 FP32...")
+    start_time = time.time()
+    reference = run_pass(pipeline, images, args.confidence)
+    print(f"✓ FP32 完成: {time.time() - start_time:.1f}s")
+
+    if not pipeline.enable_int8_quantization(args.models):
+        return
+    run_pass(pipeline, images[:1], args.confidence)  # 预热 (已加载的模型在启用时已原地量化)
+
+    print("\n运行 INT8...")
+    start_time = time.time()
+    quantized = run_pass(pipeline, images, args.confidence)
+    print(f"✓ INT8 完成: {time.time() - start_time:.1f}s")
+
+    report = compare(reference, quantized, args.iou)
+    report['models'] = args.models
+    report['confidence_threshold'] = args.confidence
+
+    print(f"\n{'='*60}")
+    print("INT8 量化评估")
+    print(f"{'='*60}")
+    print(f"  检测数: FP32 {report['detections_fp32']} → INT8 {report['detections_int8']} "
+          f"(每图平均变化 {report['count_delta_mean_abs']:.2f}, 最大 {report['count_delta_max_abs']})")
+    print(f"  匹配 {report['matched']} | 漏检 {report['missed']} | 新增 {report['extra']} | "
+          f"标签变化 {report['label_changes']}")
+    if report['distance_error_mean'] is not None:
+        print(f"  距离误差: 平均 {report['distance_error_mean']:.3f}m, 最大 {report['distance_error_max']:.3f}m")
+    for key, values in report['timing'].items():
+        print(f"  {key}: {values['fp32']:.3f}s → {values['int8']:.3f}s")
+    if report['speedup']:
+        print(f"  加速比: {report['speedup']:.2f}x")
+    print(f"{'='*60}")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✓ 报告已保存: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,9 @@ DETECTION_CONFIG = {
     'use_sliding_window': False,
     'window_size': (640, 480),
     'stride': 320,
+    
+    # 分块检测时每次前向的最大检测块数 (控制显存)
+    'tile_batch_size': 16,
 }
 
 # 提示词策略
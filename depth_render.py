@@ -0,0 +1,179 @@
+"""
+深度图可视化 (查找表着色 + 预渲染的标题/色条模板)
+
+与原先每次调用都用matplotlib画图 (imshow + colorbar + 整个画布绘制 + 复制RGBA缓冲) 的效果一致:
+- 颜色: 与imshow的自动缩放相同, 按深度图自身的最小/最大值归一化后, 从matplotlib色图取出的
+  256项查找表按matplotlib的量化方式 (floor(x*256)) 用NumPy索引着色
+- 版式: 标题、色条、刻度和标签只与深度图宽高比有关, 每种宽高比用matplotlib渲染一次并缓存,
+  之后每帧只需缩放深度图、查表着色、贴进模板
+
+用法:
+    renderer = DepthRenderer(title='Depth Map', colorbar_label='Depth (normalized)')
+    depth_image = renderer.render(depth_map)   # [H, W, 3] uint8, 与原matplotlib图尺寸相同
+    colored = renderer.colorize(depth_map)     # 只着色, 不加标题/色条
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def colormap_lut(cmap='plasma'):
+    """
+    matplotlib色图的256项RGB查找表
+
+    Returns:
+        lut: [256, 3] uint8
+    """
+    import matplotlib
+
+    # 与 imshow 绘制时的转换相同 (Colormap(..., bytes=True) 截断而非四舍五入)
+    return matplotlib.colormaps[cmap].resampled(256)(np.arange(256), bytes=True)[:, :3]
+
+
+def autoscale(depth_map):
+    """
+    按最小/最大值把深度图缩放到 [0, 1] (同 matplotlib.colors.Normalize 的自动缩放)
+
+    非有限值不参与计算最小/最大值, 缩放后置为0; 常数图 (最小值等于最大值) 全部为0
+
+    Returns:
+        depth: [H, W] float32
+    """
+    depth = np.asarray(depth_map, dtype=np.float32)
+    finite = np.isfinite(depth)
+    if not finite.all():
+        if not finite.any():
+            return np.zeros(depth.shape, dtype=np.float32)
+        depth = np.where(finite, depth, np.nan)
+    vmin, vmax = np.nanmin(depth), np.nanmax(depth)
+    if vmax <= vmin:
+        return np.zeros(depth.shape, dtype=np.float32)
+    return np.nan_to_num((depth - vmin) / (vmax - vmin))
+
+
+class DepthRenderer:
+    """深度图渲染器 (线程安全, 模板按宽高比缓存)"""
+
+    def __init__(
+        self,
+        cmap='plasma',
+        title='Depth Map',
+        title_fontsize=14,
+        colorbar_label='Depth (normalized)',
+        figsize=(8, 6),
+        dpi=100,
+        max_templates=8
+    ):
+        """
+        Args:
+            cmap: matplotlib色图名称
+            title: 图标题
+            title_fontsize: 标题字号 (None 使用matplotlib默认)
+            colorbar_label: 色条标签
+            figsize: 图尺寸 (英寸), 输出尺寸为 figsize * dpi
+            dpi: 分辨率
+            max_templates: 最多缓存的模板数 (每种宽高比一个)
+        """
+        self.cmap = cmap
+        self.title = title
+        self.title_fontsize = title_fontsize
+        self.colorbar_label = colorbar_label
+        self.figsize = figsize
+        self.dpi = dpi
+        self.max_templates = max_templates
+
+        self.lut = colormap_lut(cmap)
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def colorize(self, depth_map, size=None):
+        """
+        查表着色 (颜色范围取深度图的最小/最大值, 与 imshow 默认的自动缩放一致)
+
+        Args:
+            depth_map: 深度图 [H, W], 任意取值范围 (NaN/Inf 不参与缩放, 按最小值着色)
+            size: 输出尺寸 (宽, 高), None 表示与深度图相同
+
+        Returns:
+            colored: [H, W, 3] uint8 RGB
+        """
+        depth = autoscale(depth_map)
+        if size is not None and (depth.shape[1], depth.shape[0]) != tuple(size):
+            shrink = size[0] < depth.shape[1] or size[1] < depth.shape[0]
+            depth = cv2.resize(
+                depth, tuple(size), interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR
+            )
+
+        # matplotlib Colormap: 索引 = floor(x * N), x=1.0 落在最后一项
+        index = np.clip(depth * 256.0, 0, 255).astype(np.uint8)
+        return self.lut[index]
+
+    def render(self, depth_map):
+        """
+        渲染带标题和色条的深度图
+
+        Args:
+            depth_map: 深度图 [H, W] (按自身最小/最大值着色, 色条刻度为归一化后的 0~1)
+
+        Returns:
+            image: [figsize[1]*dpi, figsize[0]*dpi, 3] uint8 RGB
+        """
+        height, width = depth_map.shape[:2]
+        template, (x0, y0, x1, y1) = self._template(round(height / width, 3))
+
+        image = template.copy()
+        image[y0:y1, x0:x1] = self.colorize(depth_map, (x1 - x0, y1 - y0))
+        return image
+
+    def _template(self, aspect):
+        """某宽高比 (高/宽) 的模板和图像区域 (x0, y0, x1, y1), 首次使用时渲染"""
+        with self._lock:
+            cached = self._templates.get(aspect)
+            if cached is not None:
+                self._templates.move_to_end(aspect)
+                return cached
+
+            cached = self._render_template(aspect)
+            self._templates[aspect] = cached
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+            return cached
+
+    def _render_template(self, aspect):
+        """
+        用matplotlib渲染一次版式 (与原 imshow + colorbar 相同), 记录图像所在的像素区域
+
+        深度图着色前已缩放到 [0, 1], 色条固定为 0~1; 流水线输出的深度图本身即按最小/最大值归一化,
+        与原先自动缩放得到的刻度相同
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        # 不经过pyplot (非线程安全, 且会注册全局图窗)
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+
+        placeholder = np.zeros((max(1, round(1000 * aspect)), 1000), dtype=np.float32)
+        im = ax.imshow(placeholder, cmap=self.cmap, vmin=0.0, vmax=1.0)
+        if self.title_fontsize is None:
+            ax.set_title(self.title)
+        else:
+            ax.set_title(self.title, fontsize=self.title_fontsize)
+        ax.axis('off')
+        fig.colorbar(im, ax=ax, label=self.colorbar_label)
+
+        canvas.draw()
+        template = np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+        # 显示坐标原点在左下, 缓冲区原点在左上
+        bbox = im.get_window_extent(canvas.get_renderer())
+        canvas_height = template.shape[0]
+        x0, x1 = int(round(bbox.x0)), int(round(bbox.x1))
+        y0, y1 = int(round(canvas_height - bbox.y1)), int(round(canvas_height - bbox.y0))
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(max(x1, x0 + 1), template.shape[1]), min(max(y1, y0 + 1), canvas_height)
+        return template, (x0, y0, x1, y1)
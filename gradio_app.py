@@ -6,79 +6,59 @@ Gradio Web UI - 灯具3D定位实时检测
 import gradio as gr
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import torch
 from pipeline import LightLocalization3D
+from scheduler import SessionScheduler, SchedulerOverloaded
+from depth_render import DepthRenderer
+from overlay_render import OverlayRenderer
+import threading
 import time
 
 # 全局变量存储pipeline实例
 pipeline = None
+scheduler = None
+_pipeline_lock = threading.Lock()
+_scheduler_lock = threading.Lock()
+# 深度图渲染器 (查找表着色 + 缓存的标题/色条模板)
+depth_renderer = DepthRenderer(title='深度估计', title_fontsize=None, colorbar_label='深度 (归一化)')
+# 检测标注渲染器 (字体只加载一次, 标签贴图按文本缓存)
+overlay_renderer = OverlayRenderer()
 
 def initialize_pipeline():
-    """初始化检测流水线"""
+    """初始化检测流水线 (线程安全: 多个会话同时首次访问时只加载一次)"""
     global pipeline
-    if pipeline is None:
-        print("🚀 初始化灯具检测流水线...")
-        pipeline = LightLocalization3D(
-            detection_model="google/owlv2-large-patch14-ensemble",
-            feature_model="facebook/dinov2-large",
-            depth_model="depth-anything/Depth-Anything-V2-Large-hf"
-        )
-        print("✅ 流水线初始化完成!")
+    with _pipeline_lock:
+        if pipeline is None:
+            print("🚀 初始化灯具检测流水线...")
+            pipeline = LightLocalization3D(
+                detection_model="google/owlv2-large-patch14-ensemble",
+                feature_model="facebook/dinov2-large",
+                depth_model="depth-anything/Depth-Anything-V2-Large-hf",
+                retain_last=4  # 同一张图调整阈值时只重做后处理, 不重新推理
+            )
+            # 分阶段耗时指标 (Prometheus): http://127.0.0.1:9464/metrics
+            pipeline.start_metrics_server(port=9464)
+            print("✅ 流水线初始化完成!")
     return pipeline
 
+def get_scheduler():
+    """推理调度器: 各浏览器会话的请求按会话轮转、合批执行, 排队过多时拒绝"""
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = SessionScheduler(initialize_pipeline, max_batch_size=4, max_wait_ms=20)
+    return scheduler
+
 def draw_detections(image, detections):
     """在图像上绘制检测结果"""
-    # 转换为PIL图像
     if isinstance(image, np.ndarray):
-        image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    
-    draw = ImageDraw.Draw(image)
-    
-    # 尝试加载字体
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-        font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 12)
-    except:
-        font = ImageFont.load_default()
-        font_small = font
-    
-    # 颜色方案
-    colors = [
-        (255, 0, 0), (0, 255, 0), (0, 0, 255),
-        (255, 255, 0), (255, 0, 255), (0, 255, 255)
-    ]
-    
-    for idx, det in enumerate(detections):
-        box = det['box']
-        x1, y1, x2, y2 = map(int, box)
-        
-        # 选择颜色
-        color = colors[idx % len(colors)]
-        
-        # 绘制边界框
-        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
-        
-        # 准备标签文本
-        label = det['label']
-        confidence = det['confidence']
-        distance = det.get('distance', None)
-        
-        if distance:
-            text = f"{label}\n{confidence:.1%}\n{distance:.2f}m"
-        else:
-            text = f"{label}\n{confidence:.1%}"
-        
-        # 绘制背景框
-        bbox = draw.textbbox((x1, y1-60), text, font=font_small)
-        draw.rectangle([bbox[0]-2, bbox[1]-2, bbox[2]+2, bbox[3]+2], fill=(0, 0, 0, 200))
-        
-        # 绘制文本
-        draw.text((x1, y1-60), text, fill=color, font=font_small)
-    
-    return np.array(image)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    else:
+        image = np.array(image.convert('RGB'))
+    return overlay_renderer.draw(image, detections)
 
-def process_image(image, confidence_threshold, show_depth):
+def process_image(image, confidence_threshold, show_depth, request: gr.Request = None):
     """处理单张图像"""
     try:
         # 检查输入
@@ -87,8 +67,8 @@ def process_image(image, confidence_threshold, show_depth):
         
         start_time = time.time()
         
-        # 初始化pipeline
-        pipe = initialize_pipeline()
+        # 推理经调度器执行 (各会话公平排队, 模型调用不交错)
+        session_id = request.session_hash if request is not None else None
         
         # 转换为numpy数组
         if isinstance(image, Image.Image):
@@ -103,8 +83,9 @@ def process_image(image, confidence_threshold, show_depth):
         print(f"处理图像: shape={image.shape}, dtype={image.dtype}, threshold={confidence_threshold}")
         
         # 执行检测
-        result = pipe.process_image(
+        result = get_scheduler().process_image(
             image,
+            session_id=session_id,
             confidence_threshold=confidence_threshold,
             compute_depth=show_depth,
             compute_distance=show_depth
@@ -142,43 +123,35 @@ def process_image(image, confidence_threshold, show_depth):
         # 深度图可视化
         depth_image = None
         if show_depth and depth_map is not None:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            matplotlib.use('Agg')
-            
-            fig, ax = plt.subplots(figsize=(8, 6))
-            im = ax.imshow(depth_map, cmap='plasma')
-            ax.set_title('深度估计')
-            ax.axis('off')
-            plt.colorbar(im, ax=ax, label='深度 (归一化)')
-            
-            # 转换为numpy数组 (使用新API)
-            fig.canvas.draw()
-            # 使用 buffer_rgba() 代替已弃用的 tostring_rgb()
-            buf = fig.canvas.buffer_rgba()
-            depth_image = np.asarray(buf)
-            # 转换RGBA到RGB
-            depth_image = depth_image[:, :, :3]
-            plt.close(fig)
+            depth_image = depth_renderer.render(depth_map)
         
         return output_image, depth_image, stats + "\n" + details
         
+    except SchedulerOverloaded as e:
+        return image, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
         return image, None, error_msg
 
-def process_video_frame(frame, confidence_threshold):
-    """处理视频帧(用于实时摄像头)"""
-    pipe = initialize_pipeline()
-    
-    # 执行检测
-    result = pipe.process_image(
-        frame,
-        confidence_threshold=confidence_threshold,
-        compute_depth=False,  # 实时模式关闭深度计算以提高速度
-        compute_distance=False
-    )
+def process_image_without_depth(image, confidence_threshold, request: gr.Request = None):
+    """处理单张图像 (不计算深度)"""
+    return process_image(image, confidence_threshold, False, request)
+
+def process_video_frame(frame, confidence_threshold, request: gr.Request = None):
+    """处理视频帧(用于实时摄像头), 返回 (标注后的帧, 状态文本)"""
+    try:
+        # 执行检测 (同一会话排队中的旧帧被新帧替换; 全局排队已满时仍会拒绝)
+        result = get_scheduler().process_image(
+            frame,
+            session_id=request.session_hash if request is not None else None,
+            coalesce=True,
+            confidence_threshold=confidence_threshold,
+            compute_depth=False,  # 实时模式关闭深度计算以提高速度
+            compute_distance=False
+        )
+    except SchedulerOverloaded as e:
+        return frame, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     
     # 绘制结果
     output = draw_detections(frame, result['detections'])
@@ -190,7 +163,7 @@ def process_video_frame(frame, confidence_threshold):
     cv2.putText(output, f"Lights: {len(result['detections'])}", (10, 70),
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
     
-    return output
+    return output, f"✅ 检测到 {len(result['detections'])} 个灯具 | {fps:.1f} FPS"
 
 # 创建Gradio界面
 with gr.Blocks(title="灯具3D定位检测系统", theme=gr.themes.Soft()) as demo:
@@ -262,7 +235,7 @@ with gr.Blocks(title="灯具3D定位检测系统", theme=gr.themes.Soft()) as de
                     video_stats = gr.Markdown(label="统计信息")
             
             process_btn.click(
-                fn=lambda img, conf: process_image(img, conf, False),
+                fn=process_image_without_depth,
                 inputs=[video_input, video_confidence],
                 outputs=[video_output, gr.Image(visible=False), video_stats]
             )
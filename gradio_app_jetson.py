@@ -8,107 +8,84 @@ Jetson 优化版 Gradio Web UI - 灯具3D定位实时检测
 import gradio as gr
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import torch
 from pipeline import LightLocalization3D
+from streaming import StreamingPipeline
+from tracking import TrackedLocalizer
+from scheduler import SessionScheduler, SchedulerOverloaded
+from depth_render import DepthRenderer
+from overlay_render import OverlayRenderer
+import threading
 import time
 
 # 全局变量
 pipeline = None
+scheduler = None
+_pipeline_lock = threading.Lock()
+_scheduler_lock = threading.Lock()
+depth_renderer = DepthRenderer(title='Depth Map', colorbar_label='Depth (normalized)')  # 英文避免中文字体问题
+overlay_renderer = OverlayRenderer()
 
 def initialize_pipeline():
-    """初始化检测流水线"""
+    """初始化检测流水线 (线程安全: 多个会话同时首次访问时只加载一次)"""
     global pipeline
-    if pipeline is None:
-        print("🚀 初始化灯具检测流水线...")
-        pipeline = LightLocalization3D(
-            detection_model="google/owlv2-large-patch14-ensemble",
-            feature_model="facebook/dinov2-large",
-            depth_model="depth-anything/Depth-Anything-V2-Large-hf"
-        )
+    with _pipeline_lock:
+        if pipeline is None:
+            print("🚀 初始化灯具检测流水线...")
+            pipeline = LightLocalization3D(
+                detection_model="google/owlv2-large-patch14-ensemble",
+                feature_model="facebook/dinov2-large",
+                depth_model="depth-anything/Depth-Anything-V2-Large-hf",
+                lazy_loading=True,   # 首次使用时加载, 仅检测的请求无需等待深度模型
+                idle_timeout=600,    # 空闲10分钟卸载, 控制峰值内存
+                native_depth=True    # 在深度模型原生分辨率上算距离, 仅显示深度图时才生成全分辨率图
+            )
         
-        # 尝试启用TensorRT加速
-        try:
-            if hasattr(pipeline, 'enable_tensorrt'):
-                pipeline.enable_tensorrt()
-                print("✅ TensorRT加速已启用")
-        except Exception as e:
-            print(f"⚠️ TensorRT加速启用失败: {e}")
+            # 编译推理加速 (CUDA + torch_tensorrt 时使用TensorRT, 否则 inductor)
+            # 按需加载: 各模型加载后在后台预热编译, 编译完成前的请求以eager执行
+            try:
+                backend = pipeline.enable_compiled_inference(backend="tensorrt", warmup_sizes=[(640, 480)])
+                print(f"✅ 编译推理已启用 ({backend})")
+            except Exception as e:
+                print(f"⚠️ 编译推理启用失败: {e}")
         
-        print("✅ 流水线初始化完成!")
+            # 分阶段耗时指标 (Prometheus): http://127.0.0.1:9464/metrics
+            pipeline.start_metrics_server(port=9464)
+            print("✅ 流水线初始化完成!")
     return pipeline
 
+def get_scheduler():
+    """推理调度器: 各浏览器会话的请求按会话轮转、合批执行, 排队过多时拒绝"""
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = SessionScheduler(initialize_pipeline, max_batch_size=4, max_wait_ms=20)
+    return scheduler
+
 def draw_detections(image, detections):
     """在图像上绘制检测结果"""
     if isinstance(image, np.ndarray):
-        image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    
-    draw = ImageDraw.Draw(image)
-    
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-        font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 12)
-    except:
-        font = ImageFont.load_default()
-        font_small = font
-    
-    colors = [
-        (255, 0, 0), (0, 255, 0), (0, 0, 255),
-        (255, 255, 0), (255, 0, 255), (0, 255, 255)
-    ]
-    
-    for idx, det in enumerate(detections):
-        box = det['box']
-        x1, y1, x2, y2 = map(int, box)
-        color = colors[idx % len(colors)]
-        
-        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
-        
-        label = det['label']
-        confidence = det['confidence']
-        distance = det.get('distance', None)
-        
-        if distance:
-            text = f"{label}\n{confidence:.1%}\n{distance:.2f}m"
-        else:
-            text = f"{label}\n{confidence:.1%}"
-        
-        bbox = draw.textbbox((x1, y1-60), text, font=font_small)
-        draw.rectangle([bbox[0]-2, bbox[1]-2, bbox[2]+2, bbox[3]+2], fill=(0, 0, 0, 200))
-        draw.text((x1, y1-60), text, fill=color, font=font_small)
-    
-    return np.array(image)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    else:
+        image = np.array(image.convert('RGB'))
+    return overlay_renderer.draw(image, detections)
 
 def generate_depth_image(depth_map):
     """生成深度图可视化"""
     if depth_map is None:
         return None
     
-    import matplotlib.pyplot as plt
-    import matplotlib
-    matplotlib.use('Agg')
-    
-    fig, ax = plt.subplots(figsize=(8, 6))
-    im = ax.imshow(depth_map, cmap='plasma')
-    ax.set_title('Depth Map', fontsize=14)
-    ax.axis('off')
-    plt.colorbar(im, ax=ax, label='Depth (normalized)')
-    
-    fig.canvas.draw()
-    buf = fig.canvas.buffer_rgba()
-    depth_image = np.asarray(buf)[:, :, :3]
-    plt.close(fig)
-    
-    return depth_image
+    return depth_renderer.render(depth_map)
 
-def process_image(image, confidence_threshold, show_depth):
+def process_image(image, confidence_threshold, show_depth, request: gr.Request = None):
     """处理单张图像"""
     try:
         if image is None:
             return None, None, "❌ 请先上传图片!"
         
         start_time = time.time()
-        pipe = initialize_pipeline()
+        pipe = get_scheduler().session(request.session_hash if request is not None else None)
         
         # 标准化图像格式
         if isinstance(image, Image.Image):
@@ -154,20 +131,88 @@ def process_image(image, confidence_threshold, show_depth):
         
         return output_image, depth_image, stats
         
+    except SchedulerOverloaded as e:
+        return image, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
         return image, None, error_msg
 
-def process_webcam_frame(frame, confidence_threshold, show_depth):
-    """处理摄像头帧 - Jetson 直接使用本地摄像头"""
+def render_webcam_frame(webcam_stream, depth_cache, frame, result_packet):
+    """渲染线程: 在最新摄像头帧上叠加最近一次的检测结果"""
+    if result_packet is None:
+        return frame, None, "⏳ 正在进行首次检测..."
+    
+    result = result_packet['result']
+    detections = result['detections']
+    
+    # 绘制检测结果
+    output_frame = draw_detections(frame.copy(), detections)
+    
+    # 添加性能信息到画面 (推理帧率由硬件决定, 画面按采集帧率刷新)
+    stream_stats = webcam_stream.stats()
+    fps = stream_stats.get('inference_fps', 0.0)
+    cv2.putText(output_frame, f"FPS: {fps:.1f}", (10, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.putText(output_frame, f"Detections: {len(detections)}", (10, 70),
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    
+    # 生成统计信息
+    stats = f"""
+### 📊 实时检测统计
+- **检测数量**: {len(detections)} 个灯具
+- **检测延迟**: {result_packet['latency']:.2f}秒
+- **推理FPS**: {fps:.2f}
+- **检测模式**: {'完整检测' if result['tracking']['keyframe'] else '跟踪复用'}
+- **丢弃过期帧**: {stream_stats.get('frames_dropped', 0)}
+- **置信度阈值**: {webcam_stream.params['confidence_threshold']:.2f}
+
+### 🔍 检测详情
+"""
+    
+    for i, det in enumerate(detections[:5], 1):  # 只显示前5个
+        stats += f"\n**目标 {i}**: {det['label']} ({det['confidence']:.1%})"
+        if det.get('distance'):
+            stats += f" - {det['distance']:.2f}m"
+    
+    # 深度图可视化较慢, 每张深度图只生成一次 (跟踪帧沿用关键帧的深度图)
+    depth_map = result.get('depth_map')
+    if depth_cache['depth_map'] is not depth_map:
+        depth_cache['depth_map'] = depth_map
+        depth_cache['image'] = generate_depth_image(depth_map) if depth_map is not None else None
+    
+    return output_frame, depth_cache['image'], stats
+
+def create_webcam_stream(session_id):
+    """
+    为一个浏览器会话创建摄像头流式流水线 (推理和渲染在后台线程运行, 不阻塞网页回调)
+    
+    每个会话独立的流水线: 帧队列、跟踪状态、参数和最新渲染结果互不干扰
+    
+    Args:
+        session_id: 浏览器会话标识 (gr.Request.session_hash)
+    """
+    # 固定摄像头: 每10帧 (或场景变化时) 才运行完整检测, 其余帧跟踪复用
+    # 推理请求计入调用方会话, 与其他会话按轮转公平排队
+    tracker = TrackedLocalizer(get_scheduler().session(session_id, coalesce=True), detect_every=10)
+    depth_cache = {'depth_map': None, 'image': None}
+    webcam_stream = StreamingPipeline(
+        tracker,
+        render_fn=lambda frame, packet: render_webcam_frame(webcam_stream, depth_cache, frame, packet)
+    )
+    return webcam_stream.start()
+
+def close_webcam_stream(webcam_stream):
+    """会话结束 (浏览器关闭/状态过期) 时停止该会话的流式流水线"""
+    if webcam_stream is not None:
+        webcam_stream.stop()
+
+def process_webcam_frame(frame, confidence_threshold, show_depth, webcam_stream, request: gr.Request = None):
+    """处理摄像头帧 - 推送到本会话的流式流水线, 立即返回最新渲染结果 (最后一个返回值为会话状态)"""
     if frame is None:
-        return None, None, "⏳ 等待摄像头输入..."
+        return None, None, "⏳ 等待摄像头输入...", webcam_stream
     
     try:
-        start_time = time.time()
-        pipe = initialize_pipeline()
-        
         # 标准化图像格式
         if isinstance(frame, Image.Image):
             frame = np.array(frame)
@@ -177,52 +222,28 @@ def process_webcam_frame(frame, confidence_threshold, show_depth):
         elif frame.shape[2] == 4:
             frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
         
-        # 执行检测
-        result = pipe.process_image(
-            frame,
+        # 推送帧: 推理跟不上时旧帧被丢弃, 渲染线程用最新结果叠加最新帧
+        if webcam_stream is None or not webcam_stream.running:
+            webcam_stream = create_webcam_stream(request.session_hash if request is not None else None)
+        webcam_stream.set_params(
             confidence_threshold=confidence_threshold,
             compute_depth=show_depth,
             compute_distance=True
         )
+        webcam_stream.submit(frame)
         
-        detections = result['detections']
-        depth_map = result.get('depth_map')
-        
-        # 绘制检测结果
-        output_frame = draw_detections(frame.copy(), detections)
-        
-        # 添加性能信息到画面
-        process_time = time.time() - start_time
-        fps = 1.0 / process_time if process_time > 0 else 0
-        cv2.putText(output_frame, f"FPS: {fps:.1f}", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(output_frame, f"Detections: {len(detections)}", (10, 70),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        
-        # 生成统计信息
-        stats = f"""
-### 📊 实时检测统计
-- **检测数量**: {len(detections)} 个灯具
-- **处理时间**: {process_time:.2f}秒
-- **FPS**: {fps:.2f}
-- **置信度阈值**: {confidence_threshold:.2f}
-
-### 🔍 检测详情
-"""
-        
-        for i, det in enumerate(detections[:5], 1):  # 只显示前5个
-            stats += f"\n**目标 {i}**: {det['label']} ({det['confidence']:.1%})"
-            if det.get('distance'):
-                stats += f" - {det['distance']:.2f}m"
-        
-        depth_image = generate_depth_image(depth_map) if show_depth else None
-        
-        return output_frame, depth_image, stats
+        packet = webcam_stream.latest()
+        if packet is None:
+            return frame, None, "⏳ 正在进行首次检测...", webcam_stream
+        output_frame, depth_image, stats = packet['output']
+        return output_frame, depth_image if show_depth else None, stats, webcam_stream
         
+    except SchedulerOverloaded as e:
+        return frame, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}", webcam_stream
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
-        return frame, None, error_msg
+        return frame, None, error_msg, webcam_stream
 
 # 创建Gradio界面
 with gr.Blocks(title="灯具3D定位检测系统 (Jetson)", theme=gr.themes.Soft()) as demo:
@@ -280,12 +301,12 @@ with gr.Blocks(title="灯具3D定位检测系统 (Jetson)", theme=gr.themes.Soft
             **Jetson 本地摄像头**:
             - ✅ USB 摄像头: /dev/video0, /dev/video1
             - ✅ CSI 摄像头: Jetson 板载摄像头接口
-            - ✅ 自动间隔采样 (每5秒检测一次)
+            - ✅ 流式处理: 画面流畅刷新, 检测按硬件能力持续运行 (自动丢弃过期帧)
             - ✅ 完整功能: 检测 + 距离 + 深度
             
             **使用方法**:
             1. 点击摄像头图标启动 (Docker 已映射 /dev/video0)
-            2. 自动每5秒检测一次
+            2. 画面实时刷新, 检测结果叠加在最新画面上
             3. 调整参数实时生效
             
             **性能提示**:
@@ -297,7 +318,7 @@ with gr.Blocks(title="灯具3D定位检测系统 (Jetson)", theme=gr.themes.Soft
             with gr.Row():
                 with gr.Column():
                     webcam_input = gr.Image(
-                        label="📹 本地摄像头 (自动每5秒检测)",
+                        label="📹 本地摄像头 (实时检测)",
                         sources=["webcam"],
                         type="numpy",
                         streaming=True
@@ -322,15 +343,18 @@ with gr.Blocks(title="灯具3D定位检测系统 (Jetson)", theme=gr.themes.Soft
             with gr.Row():
                 webcam_stats = gr.Markdown(
                     label="实时统计", 
-                    value="📹 **启动摄像头后会自动每5秒检测一次...**"
+                    value="📹 **启动摄像头后自动开始实时检测...**"
                 )
             
-            # 视频流自动检测 (每5秒)
+            # 每个浏览器会话一条流式流水线, 会话结束时停止其后台线程
+            webcam_stream_state = gr.State(None, delete_callback=close_webcam_stream)
+            
+            # 视频流实时检测 (回调只推送帧, 推理在后台线程运行)
             webcam_input.stream(
                 fn=process_webcam_frame,
-                inputs=[webcam_input, webcam_confidence, webcam_depth_check],
-                outputs=[webcam_output, webcam_depth, webcam_stats],
-                stream_every=5
+                inputs=[webcam_input, webcam_confidence, webcam_depth_check, webcam_stream_state],
+                outputs=[webcam_output, webcam_depth, webcam_stats, webcam_stream_state],
+                stream_every=0.1
             )
         
         # Tab 3: 系统信息
@@ -7,90 +7,94 @@
 import gradio as gr
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import torch
 from pipeline import LightLocalization3D
+from tracking import TrackedLocalizer, SceneChangeGate
+from result_cache import ResultCache
+from scheduler import SessionScheduler, SchedulerOverloaded
+from depth_render import DepthRenderer
+from overlay_render import OverlayRenderer
 import time
 import threading
 import queue
 
 # 全局变量
 pipeline = None
+scheduler = None
+_pipeline_lock = threading.Lock()
+_scheduler_lock = threading.Lock()
+depth_renderer = DepthRenderer(title='Depth Map', colorbar_label='Depth (normalized)')  # 英文避免中文字体问题
+overlay_renderer = OverlayRenderer()
 last_detection_time = 0
 detection_interval = 10  # 每10秒检测一次
 processing_queue = queue.Queue(maxsize=1)
 
 def initialize_pipeline():
-    """初始化检测流水线"""
+    """初始化检测流水线 (线程安全: 多个会话同时首次访问时只加载一次)"""
     global pipeline
-    if pipeline is None:
-        print("🚀 初始化灯具检测流水线...")
-        pipeline = LightLocalization3D(
-            detection_model="google/owlv2-large-patch14-ensemble",
-            feature_model="facebook/dinov2-large",
-            depth_model="depth-anything/Depth-Anything-V2-Large-hf"
-        )
+    with _pipeline_lock:
+        if pipeline is None:
+            print("🚀 初始化灯具检测流水线...")
+            pipeline = LightLocalization3D(
+                detection_model="google/owlv2-large-patch14-ensemble",
+                feature_model="facebook/dinov2-large",
+                depth_model="depth-anything/Depth-Anything-V2-Large-hf",
+                parallel_loading=True,  # 并行加载各模型, 缩短冷启动时间
+                result_cache=ResultCache(max_detection_mb=64, max_depth_mb=512),  # 同一张图重复检测时直接复用结果
+                retain_last=4  # 保留最近4张图的候选框和深度图, 调整阈值时无需重新推理
+            )
         
-        # 尝试启用TensorRT加速
-        try:
-            if hasattr(pipeline, 'enable_tensorrt'):
-                pipeline.enable_tensorrt()
-                print("✅ TensorRT加速已启用")
-        except Exception as e:
-            print(f"⚠️ TensorRT加速启用失败: {e}")
+            # 编译推理加速 (CUDA + torch_tensorrt 时使用TensorRT, 否则 inductor), 启动时预热
+            try:
+                backend = pipeline.enable_compiled_inference(backend="tensorrt", warmup_sizes=[(640, 480)])
+                print(f"✅ 编译推理已启用 ({backend})")
+            except Exception as e:
+                print(f"⚠️ 编译推理启用失败: {e}")
         
-        print("✅ 流水线初始化完成!")
+            # 分阶段耗时指标 (Prometheus): http://127.0.0.1:9464/metrics
+            pipeline.start_metrics_server(port=9464)
+            print("✅ 流水线初始化完成!")
     return pipeline
 
+def get_scheduler():
+    """推理调度器: 各浏览器会话的请求按会话轮转、合批执行, 排队过多时拒绝"""
+    global scheduler
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = SessionScheduler(initialize_pipeline, max_batch_size=4, max_wait_ms=20)
+    return scheduler
+
+def get_scene_gate(session_id):
+    """间隔采样的场景变化门控 (每个会话一个): 画面未变化时直接复用上次结果"""
+    state = get_scheduler().session_state(session_id)
+    if 'scene_gate' not in state:
+        state.setdefault('scene_gate', SceneChangeGate(get_scheduler().session(session_id)))
+    return state['scene_gate']
+
+def get_tracker(session_id):
+    """摄像头跟踪层 (每个会话一个): 固定摄像头下每10帧 (或场景变化时) 才运行完整检测"""
+    state = get_scheduler().session_state(session_id)
+    if 'tracker' not in state:
+        state.setdefault('tracker', TrackedLocalizer(get_scheduler().session(session_id, coalesce=True), detect_every=10))
+    return state['tracker']
+
 def draw_detections(image, detections):
     """在图像上绘制检测结果"""
     if isinstance(image, np.ndarray):
-        image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    
-    draw = ImageDraw.Draw(image)
-    
-    try:
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-        font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 12)
-    except:
-        font = ImageFont.load_default()
-        font_small = font
-    
-    colors = [
-        (255, 0, 0), (0, 255, 0), (0, 0, 255),
-        (255, 255, 0), (255, 0, 255), (0, 255, 255)
-    ]
-    
-    for idx, det in enumerate(detections):
-        box = det['box']
-        x1, y1, x2, y2 = map(int, box)
-        color = colors[idx % len(colors)]
-        
-        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
-        
-        label = det['label']
-        confidence = det['confidence']
-        distance = det.get('distance', None)
-        
-        if distance:
-            text = f"{label}\n{confidence:.1%}\n{distance:.2f}m"
-        else:
-            text = f"{label}\n{confidence:.1%}"
-        
-        bbox = draw.textbbox((x1, y1-60), text, font=font_small)
-        draw.rectangle([bbox[0]-2, bbox[1]-2, bbox[2]+2, bbox[3]+2], fill=(0, 0, 0, 200))
-        draw.text((x1, y1-60), text, fill=color, font=font_small)
-    
-    return np.array(image)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    else:
+        image = np.array(image.convert('RGB'))
+    return overlay_renderer.draw(image, detections)
 
-def process_image(image, confidence_threshold, show_depth):
+def process_image(image, confidence_threshold, show_depth, request: gr.Request = None):
     """处理单张图像"""
     try:
         if image is None:
             return None, None, "❌ 请先上传图片!"
         
         start_time = time.time()
-        pipe = initialize_pipeline()
+        pipe = get_scheduler().session(request.session_hash if request is not None else None)
         
         if isinstance(image, Image.Image):
             image = np.array(image)
@@ -136,29 +140,18 @@ def process_image(image, confidence_threshold, show_depth):
         
         depth_image = None
         if show_depth and depth_map is not None:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            matplotlib.use('Agg')
-            
-            fig, ax = plt.subplots(figsize=(8, 6))
-            im = ax.imshow(depth_map, cmap='plasma')
-            ax.set_title('Depth Map', fontsize=14)  # 英文避免中文字体问题
-            ax.axis('off')
-            plt.colorbar(im, ax=ax, label='Depth (normalized)')
-            
-            fig.canvas.draw()
-            buf = fig.canvas.buffer_rgba()
-            depth_image = np.asarray(buf)[:, :, :3]
-            plt.close(fig)
+            depth_image = depth_renderer.render(depth_map)
         
         return output_image, depth_image, stats + "\n" + details
         
+    except SchedulerOverloaded as e:
+        return image, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
         return image, None, error_msg
 
-def process_frame_interval(frame, confidence_threshold, interval_seconds, show_depth):
+def process_frame_interval(frame, confidence_threshold, interval_seconds, show_depth, request: gr.Request = None):
     """间隔采样处理视频帧 - 完整功能版本"""
     global last_detection_time
     
@@ -169,10 +162,10 @@ def process_frame_interval(frame, confidence_threshold, interval_seconds, show_d
         current_time = time.time()
         time_since_last = current_time - last_detection_time
         
-        # 执行完整检测(包含距离)
-        pipe = initialize_pipeline()
+        # 执行完整检测(包含距离), 画面未变化时直接返回上次结果
+        gate = get_scene_gate(request.session_hash if request is not None else None)
         
-        result = pipe.process_image(
+        result = gate.process_image(
             frame,
             confidence_threshold=confidence_threshold,
             compute_depth=show_depth,
@@ -192,6 +185,8 @@ def process_frame_interval(frame, confidence_threshold, interval_seconds, show_d
         - **置信度阈值**: {confidence_threshold:.2f}
         - **检测间隔**: {interval_seconds}秒
         - **下次检测**: {interval_seconds}秒后
+        - **场景变化**: {'未变化, 复用上次结果' if result['scene_gate']['hit'] else '已重新推理'}
+        - **缓存命中**: {gate.stats()['hits']} 次 / 未命中 {gate.stats()['misses']} 次
         
         ### 🔍 检测详情
         """
@@ -206,36 +201,25 @@ def process_frame_interval(frame, confidence_threshold, interval_seconds, show_d
         # 生成深度图
         depth_image = None
         if show_depth and depth_map is not None:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            matplotlib.use('Agg')
-            
-            fig, ax = plt.subplots(figsize=(8, 6))
-            im = ax.imshow(depth_map, cmap='plasma')
-            ax.set_title('Depth Map', fontsize=14)
-            ax.axis('off')
-            plt.colorbar(im, ax=ax, label='Depth (normalized)')
-            
-            fig.canvas.draw()
-            buf = fig.canvas.buffer_rgba()
-            depth_image = np.asarray(buf)[:, :, :3]
-            plt.close(fig)
+            depth_image = depth_renderer.render(depth_map)
         
         return output_frame, depth_image, stats
         
+    except SchedulerOverloaded as e:
+        return frame, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
         return frame, None, error_msg
 
-def process_webcam_frame(frame, confidence_threshold, show_depth):
+def process_webcam_frame(frame, confidence_threshold, show_depth, request: gr.Request = None):
     """实时处理摄像头帧 - 完整功能版本"""
     if frame is None:
         return None, None, "⏳ 等待摄像头输入..."
     
     try:
         start_time = time.time()
-        pipe = initialize_pipeline()
+        frame_tracker = get_tracker(request.session_hash if request is not None else None)
         
         # 确保图像格式正确
         if isinstance(frame, Image.Image):
@@ -246,8 +230,8 @@ def process_webcam_frame(frame, confidence_threshold, show_depth):
         elif frame.shape[2] == 4:
             frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
         
-        # 执行完整检测
-        result = pipe.process_image(
+        # 执行检测 (关键帧完整检测, 其余帧跟踪复用上次结果)
+        result = frame_tracker.process_image(
             frame,
             confidence_threshold=confidence_threshold,
             compute_depth=show_depth,
@@ -274,6 +258,7 @@ def process_webcam_frame(frame, confidence_threshold, show_depth):
         - **检测数量**: {len(detections)} 个灯具
         - **处理时间**: {process_time:.2f}秒
         - **FPS**: {fps:.2f}
+        - **检测模式**: {'完整检测' if result['tracking']['keyframe'] else '跟踪复用'}
         - **置信度阈值**: {confidence_threshold:.2f}
         
         ### 🔍 检测详情
@@ -289,35 +274,24 @@ def process_webcam_frame(frame, confidence_threshold, show_depth):
         # 生成深度图
         depth_image = None
         if show_depth and depth_map is not None:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            matplotlib.use('Agg')
-            
-            fig, ax = plt.subplots(figsize=(8, 6))
-            im = ax.imshow(depth_map, cmap='plasma')
-            ax.set_title('Depth Map', fontsize=14)
-            ax.axis('off')
-            plt.colorbar(im, ax=ax, label='Depth (normalized)')
-            
-            fig.canvas.draw()
-            buf = fig.canvas.buffer_rgba()
-            depth_image = np.asarray(buf)[:, :, :3]
-            plt.close(fig)
+            depth_image = depth_renderer.render(depth_map)
         
         return output_frame, depth_image, stats
         
+    except SchedulerOverloaded as e:
+        return frame, None, f"⏳ 服务器繁忙, 请稍后重试\n\n{e}"
     except Exception as e:
         import traceback
         error_msg = f"❌ 处理失败: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
         return frame, None, error_msg
 
-def process_webcam_continuous(frame, confidence_threshold, show_depth, is_running):
+def process_webcam_continuous(frame, confidence_threshold, show_depth, is_running, request: gr.Request = None):
     """连续处理摄像头帧 - 用于自动间隔采样"""
     if not is_running or frame is None:
         return None, None, "⏸️ 检测已停止", is_running
     
     # 调用标准处理函数
-    output_frame, depth_image, stats = process_webcam_frame(frame, confidence_threshold, show_depth)
+    output_frame, depth_image, stats = process_webcam_frame(frame, confidence_threshold, show_depth, request)
     
     return output_frame, depth_image, stats, is_running
 
@@ -0,0 +1,210 @@
+"""
+流水线性能指标 (分阶段计时 + 滚动分位数 + Prometheus 文本格式导出)
+
+- span(name): 用 perf_counter_ns 计时的上下文管理器, 阶段名用点号分层
+  (如 'detection.processor', 'detection.forward', 'depth.interpolate')
+- 每个阶段保留最近 window 次耗时, 快照时计算 p50/p95/p99; 另累计总次数和总耗时
+- prometheus_text(): Prometheus 文本格式 (summary 类型, 分位数来自滚动窗口)
+- MetricsServer: 在本地端口提供 /metrics (Prometheus) 和 /metrics.json
+
+用法:
+    metrics = StageMetrics()
+    with metrics.span('depth.forward'):
+        ...
+    metrics.report()                         # 打印各阶段耗时分布
+    server = MetricsServer(metrics, port=9464).start()
+    # curl http://127.0.0.1:9464/metrics
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Stage:
+    __slots__ = ('recent', 'count', 'total_ns', 'last_ns')
+
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.total_ns = 0
+        self.last_ns = 0
+
+
+class StageMetrics:
+    """分阶段耗时统计 (线程安全)"""
+
+    def __init__(self, window=1024, namespace="light3d"):
+        """
+        Args:
+            window: 每个阶段用于计算分位数的最近样本数
+            namespace: Prometheus 指标名前缀
+        """
+        self.window = window
+        self.namespace = namespace
+        self.enabled = True
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """计时一个阶段 (异常时同样记录)"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter_ns() - start)
+
+    def record(self, name, duration_ns):
+        """记录一次耗时 (纳秒)"""
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage(self.window)
+            stage.recent.append(duration_ns)
+            stage.count += 1
+            stage.total_ns += duration_ns
+            stage.last_ns = duration_ns
+
+    def increment(self, name, value=1):
+        """累加计数器 (如处理的图像数)"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        """清空全部统计"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        当前统计快照
+
+        Returns:
+            {'stages': {name: {'count', 'sum', 'last', 'p50', 'p95', 'p99'}}, 'counters': {name: value}}
+            (耗时单位为秒; 分位数基于最近 window 个样本)
+        """
+        with self._lock:
+            stages = {
+                name: (np.array(stage.recent, dtype=np.float64), stage.count, stage.total_ns, stage.last_ns)
+                for name, stage in self._stages.items()
+            }
+            counters = dict(self._counters)
+
+        report = {}
+        for name, (recent, count, total_ns, last_ns) in sorted(stages.items()):
+            quantiles = np.quantile(recent, QUANTILES) / 1e9 if recent.size else [0.0] * len(QUANTILES)
+            report[name] = {
+                'count': count,
+                'sum': total_ns / 1e9,
+                'last': last_ns / 1e9,
+                **{f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles)},
+            }
+        return {'stages': report, 'counters': counters}
+
+    def prometheus_text(self):
+        """Prometheus 文本格式 (0.0.4)"""
+        snapshot = self.snapshot()
+        metric = f"{self.namespace}_stage_seconds"
+        lines = [
+            f"# HELP {metric} Pipeline stage latency (quantiles over the most recent {self.window} samples).",
+            f"# TYPE {metric} summary",
+        ]
+        for name, stats in snapshot['stages'].items():
+            stage = name.replace('\\', '\\\\').replace('"', '\\"')
+            for q in QUANTILES:
+                lines.append(f'{metric}{{stage="{stage}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]:.9f}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {stats["sum"]:.9f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {stats["count"]}')
+
+        for name, value in sorted(snapshot['counters'].items()):
+            counter = f"{self.namespace}_{name}_total"
+            lines.append(f"# TYPE {counter} counter")
+            lines.append(f"{counter} {value}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """打印各阶段耗时分布 (毫秒)"""
+        stages = self.snapshot()['stages']
+        if not stages:
+            print("⚠️ 暂无性能指标")
+            return
+        width = max(len(name) for name in stages)
+        print(f"{'阶段':<{width}}  {'次数':>6}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'总计':>9}")
+        for name, stats in stages.items():
+            print(
+                f"{name:<{width}}  {stats['count']:>6}  {stats['p50'] * 1e3:>7.2f}ms  "
+                f"{stats['p95'] * 1e3:>7.2f}ms  {stats['p99'] * 1e3:>7.2f}ms  {stats['sum']:>8.2f}s"
+            )
+
+
+class MetricsServer:
+    """在本地提供指标的HTTP服务 (后台线程)"""
+
+    def __init__(self, metrics, port=9464, host="127.0.0.1"):
+        """
+        Args:
+            metrics: StageMetrics 实例
+            port: 端口 (0 表示自动分配)
+            host: 监听地址 (默认只监听本机)
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """启动服务 (端口被占用时抛出 OSError)"""
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path in ('/', '/metrics'):
+                    body = metrics.prometheus_text().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def stop(self):
+        """停止服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,201 @@
+"""
+模型驻留管理
+按需加载模型, 空闲超时后自动卸载, 并统计每个模型的常驻内存
+
+用法:
+    manager = ModelResidencyManager(idle_timeout=600)
+    manager.register('detection', loader=load_fn, unloader=unload_fn, get_model=lambda: model)
+
+    with manager.use('detection') as available:
+        if available:
+            ...  # 推理期间模型不会被卸载
+"""
+
+import gc
+import threading
+import time
+from contextlib import contextmanager
+
+import torch
+from torch.ao.nn.quantized.modules.linear import LinearPackedParams
+
+
+def module_memory_bytes(model):
+    """
+    统计 nn.Module 参数、缓冲区和量化打包权重占用的字节数 (非 nn.Module 返回0)
+
+    动态INT8量化的 Linear 把权重打包在 LinearPackedParams 中, 不属于 parameters()/buffers()
+    """
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        if isinstance(module, LinearPackedParams):
+            tensors.extend(tensor for tensor in module._weight_bias() if tensor is not None)
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class _ModelEntry:
+    """单个模型的驻留状态"""
+
+    def __init__(self, name, loader, unloader, get_model):
+        self.name = name
+        self.loader = loader
+        self.unloader = unloader
+        self.get_model = get_model
+        self.resident = False
+        self.failed = False
+        self.last_used = 0.0
+        self.load_time = 0.0
+        self.in_use = 0
+        self.lock = threading.RLock()
+
+
+class ModelResidencyManager:
+    """
+    模型驻留管理器
+
+    特性:
+    - 首次使用时加载 (loader 返回是否加载成功, 失败后不再重试)
+    - 空闲超过 idle_timeout 秒的模型自动卸载, 下次使用时重新加载
+    - 推理期间 (use 上下文内) 的模型不会被卸载
+    - 报告每个模型当前的常驻内存
+    """
+
+    def __init__(self, idle_timeout=None, check_interval=None):
+        """
+        Args:
+            idle_timeout: 空闲卸载超时 (秒), None 表示从不自动卸载
+            check_interval: 后台检查空闲模型的间隔 (秒), None 时取 min(30, idle_timeout / 2)
+        """
+        self.idle_timeout = idle_timeout
+        if check_interval is None:
+            check_interval = 30.0 if idle_timeout is None else min(30.0, idle_timeout / 2)
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop_event = threading.Event()
+
+    def register(self, name, loader, unloader, get_model):
+        """
+        注册模型
+
+        Args:
+            name: 模型名称 (如 'detection')
+            loader: 加载函数, 返回是否加载成功
+            unloader: 卸载函数, 释放模型引用
+            get_model: 返回当前模型对象的函数 (用于统计内存)
+        """
+        with self._lock:
+            self._entries[name] = _ModelEntry(name, loader, unloader, get_model)
+
+    def ensure(self, name, **loader_kwargs):
+        """确保模型已加载, 返回是否可用 (loader_kwargs 透传给加载函数)"""
+        entry = self._entries[name]
+        with entry.lock:
+            if not entry.resident and not entry.failed:
+                start_time = time.time()
+                loaded = bool(entry.loader(**loader_kwargs))
+                entry.load_time = time.time() - start_time
+                entry.resident = loaded
+                entry.failed = not loaded
+            entry.last_used = time.time()
+            return entry.resident
+
+    @contextmanager
+    def use(self, name):
+        """
+        使用模型的上下文: 按需加载, 并在上下文期间阻止卸载
+
+        Yields:
+            available: 模型是否可用
+        """
+        entry = self._entries[name]
+        with entry.lock:
+            available = self.ensure(name)
+            entry.in_use += 1
+        try:
+            yield available
+        finally:
+            with entry.lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def is_resident(self, name):
+        """模型当前是否已加载"""
+        return self._entries[name].resident
+
+    def unload(self, name):
+        """卸载模型 (使用中的模型不会被卸载), 返回是否执行了卸载"""
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.in_use > 0 or not entry.resident:
+                return False
+            entry.unloader()
+            entry.resident = False
+            entry.failed = False
+        self._release_memory()
+        print(f"♻️ 已卸载模型: {name}")
+        return True
+
+    def unload_idle(self):
+        """卸载所有空闲超时的模型, 返回被卸载的模型名称列表"""
+        if self.idle_timeout is None:
+            return []
+        now = time.time()
+        unloaded = []
+        for name, entry in list(self._entries.items()):
+            with entry.lock:
+                idle = entry.resident and entry.in_use == 0 and now - entry.last_used > self.idle_timeout
+                if idle and self.unload(name):
+                    unloaded.append(name)
+        return unloaded
+
+    def start_idle_reaper(self):
+        """启动后台线程, 定期卸载空闲模型"""
+        if self.idle_timeout is None or self._reaper is not None:
+            return
+        self._stop_event.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name="model-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_idle_reaper(self):
+        """停止后台卸载线程"""
+        if self._reaper is None:
+            return
+        self._stop_event.set()
+        self._reaper.join()
+        self._reaper = None
+
+    def _reap_loop(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.unload_idle()
+            except Exception as e:
+                print(f"⚠️ 空闲模型卸载失败: {e}")
+
+    def memory_report(self):
+        """
+        报告每个模型的驻留状态和常驻内存
+
+        Returns:
+            report: {name: {'resident', 'memory_mb', 'idle_seconds', 'load_time'}}
+        """
+        now = time.time()
+        report = {}
+        for name, entry in self._entries.items():
+            model = entry.get_model() if entry.resident else None
+            report[name] = {
+                'resident': entry.resident,
+                'memory_mb': module_memory_bytes(model) / (1024 ** 2),
+                'idle_seconds': now - entry.last_used if entry.last_used else None,
+                'load_time': entry.load_time,
+            }
+        return report
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,216 @@
+"""
+ONNX Runtime 推理后端
+把模型主干 (OWLv2图像塔, DINOv3, Depth Anything V2) 导出为ONNX, 用ONNX Runtime执行
+(CPU执行提供器, 全部图优化, 可控制算子内线程数)
+
+- 每个模型 + 输入空间尺寸导出一次 (batch维动态), 文件缓存在 models/onnx/ 下, 重启后直接加载
+- 创建会话时用当前输入对比PyTorch输出, 超出容差则报错 (调用方回退到PyTorch)
+
+依赖 (可选):
+    pip install onnx onnxruntime
+
+用法:
+    pipeline = LightLocalization3D(device="cpu")
+    pipeline.enable_onnx_runtime(intra_op_threads=4)
+"""
+
+import hashlib
+import inspect
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+
+def onnx_runtime_available():
+    """onnx 和 onnxruntime 是否都已安装"""
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _FirstOutput(torch.nn.Module):
+    """
+    只输出模型的第一个张量 (HuggingFace ModelOutput 的第一个非空字段)
+
+    绑定方法 (如OWLv2的 image_embedder) 按 所属模型 + 方法名 保存: 所属模型注册为子模块,
+    导出时权重是图的参数; 直接保存绑定方法时权重不属于任何子模块, 追踪时会被当作常量导致导出失败。
+    """
+
+    def __init__(self, module):
+        super().__init__()
+        owner = getattr(module, '__self__', None)
+        if isinstance(owner, torch.nn.Module):
+            self.module = owner
+            self.method = module.__name__
+        else:
+            self.module = module
+            self.method = None
+
+    def forward(self, pixel_values):
+        forward = getattr(self.module, self.method) if self.method is not None else self.module
+        return forward(pixel_values=pixel_values)[0]
+
+
+def export_onnx(module, pixel_values, path, opset=17):
+    """
+    把 module(pixel_values=...)[0] 导出为ONNX (batch维动态, 空间尺寸固定)
+
+    Args:
+        module: nn.Module 或其绑定方法 (接受 pixel_values 关键字参数)
+        pixel_values: 示例输入 [B, 3, H, W]
+        path: 输出文件路径
+        opset: ONNX opset 版本
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+    # 旧版导出器支持 dynamic_axes, 对ViT位置编码插值等追踪更稳定; torch>=2.5 需显式关闭 dynamo
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+
+    # 导出期间关闭参数梯度 (推理图不需要), 导出后恢复
+    wrapper = _FirstOutput(module).eval()
+    requires_grad = [(param, param.requires_grad) for param in wrapper.parameters()]
+    wrapper.requires_grad_(False)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                wrapper,
+                (pixel_values,),
+                str(tmp_path),
+                input_names=['pixel_values'],
+                output_names=['output'],
+                dynamic_axes={'pixel_values': {0: 'batch'}, 'output': {0: 'batch'}},
+                opset_version=opset,
+                do_constant_folding=True,
+                **export_kwargs
+            )
+    finally:
+        for param, flag in requires_grad:
+            param.requires_grad_(flag)
+    os.replace(tmp_path, path)
+
+
+class OnnxRuntimeBackend:
+    """
+    ONNX Runtime 会话管理: 按 (模型槽位, 模型名称, 输入空间尺寸) 导出/加载/验证会话
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        cache_dir="models/onnx",
+        intra_op_threads=None,
+        validate=True,
+        atol=1e-3,
+        rtol=1e-3,
+        opset=17
+    ):
+        """
+        Args:
+            cache_dir: ONNX文件缓存目录
+            intra_op_threads: 算子内线程数 (None 表示ONNX Runtime默认, 通常为物理核数)
+            validate: 创建会话时是否对比PyTorch输出
+            atol: 验证的绝对容差
+            rtol: 验证的相对容差 (相对于PyTorch输出的最大绝对值)
+            opset: 导出用的 ONNX opset 版本
+        """
+        import onnxruntime as ort
+
+        self._ort = ort
+        self.cache_dir = Path(cache_dir) / f"v{self.VERSION}"
+        self.intra_op_threads = intra_op_threads
+        self.validate = validate
+        self.atol = atol
+        self.rtol = rtol
+        self.opset = opset
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session_options(self):
+        options = self._ort.SessionOptions()
+        options.graph_optimization_level = self._ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads is not None:
+            options.intra_op_num_threads = int(self.intra_op_threads)
+        return options
+
+    def model_path(self, name, model_id, spatial_size):
+        """ONNX文件路径 (按模型及其数值精度、输入尺寸、opset、torch版本区分)"""
+        key = repr((name, model_id, tuple(spatial_size), self.opset, torch.__version__))
+        digest = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+        return self.cache_dir / f"{name}-{spatial_size[0]}x{spatial_size[1]}-{digest}.onnx"
+
+    def session(self, name, model_id, module, pixel_values):
+        """
+        获取 (必要时导出并验证) 某个模型在该输入尺寸下的会话
+
+        Args:
+            name: 模型槽位名称 ('detection', 'features', 'depth')
+            model_id: 模型标识 (区分不同权重和数值精度)
+            module: 对应的 PyTorch 模块 (导出和验证用)
+            pixel_values: 当前输入 [B, 3, H, W]
+
+        Raises:
+            ValueError: 验证时ONNX Runtime输出与PyTorch差异超出容差
+        """
+        spatial_size = tuple(pixel_values.shape[-2:])
+        key = (name, model_id, spatial_size)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                return session
+
+            path = self.model_path(name, model_id, spatial_size)
+            if not path.exists():
+                start_time = time.time()
+                export_onnx(module, pixel_values.cpu(), path, opset=self.opset)
+                print(f"✓ 已导出ONNX: {path.name} ({time.time() - start_time:.1f}s)")
+
+            session = self._ort.InferenceSession(
+                str(path), sess_options=self._session_options(), providers=['CPUExecutionProvider']
+            )
+            if self.validate:
+                self._validate(name, session, module, pixel_values)
+            self._sessions[key] = session
+            return session
+
+    def run(self, name, model_id, module, pixel_values):
+        """
+        用ONNX Runtime执行 module(pixel_values=...)[0]
+
+        Returns:
+            output: torch.Tensor (与输入同设备)
+        """
+        session = self.session(name, model_id, module, pixel_values)
+        inputs = {'pixel_values': pixel_values.detach().cpu().numpy().astype(np.float32, copy=False)}
+        output = session.run(None, inputs)[0]
+        return torch.from_numpy(output).to(pixel_values.device)
+
+    def _validate(self, name, session, module, pixel_values):
+        """对比ONNX Runtime与PyTorch输出"""
+        with torch.no_grad():
+            reference = module(pixel_values=pixel_values)[0].detach().cpu().numpy()
+        output = session.run(None, {'pixel_values': pixel_values.detach().cpu().numpy()})[0]
+        max_diff = float(np.abs(output - reference).max()) if output.size else 0.0
+        tolerance = self.atol + self.rtol * float(np.abs(reference).max() if reference.size else 0.0)
+        if output.shape != reference.shape or max_diff > tolerance:
+            raise ValueError(
+                f"{name} ONNX Runtime输出与PyTorch不一致 (最大差异 {max_diff:.2e}, 容差 {tolerance:.2e})"
+            )
+        print(f"✓ {name} ONNX Runtime验证通过 (最大差异 {max_diff:.2e})")
+
+    def clear(self, name=None):
+        """释放会话 (name 为 None 时释放全部), ONNX文件保留"""
+        with self._lock:
+            for key in [k for k in self._sessions if name is None or k[0] == name]:
+                del self._sessions[key]
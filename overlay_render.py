@@ -0,0 +1,243 @@
+"""
+检测结果标注渲染 (边界框 + 标签)
+
+原 draw_detections 每次调用都要经PIL转换整帧、从磁盘加载字体、用 ImageDraw 逐框绘制文本。这里:
+- 字体只加载一次, 每个字符栅格化一次 (字形贴图缓存), 文本行和标签由字形贴图用NumPy拼出并缓存
+- 拼好的标签按 (文本, 颜色) 缓存 (LRU), 跟踪帧的标签文本不变, 直接复用
+- 边界框和标签直接写入NumPy帧 (原地, 不经过PIL), 超出画面的部分裁剪
+
+外观与原实现一致: 3像素宽的彩色边框, 标签 (类型/置信度/距离) 位于框左上角上方60像素,
+不透明黑色背景 + 彩色文字。
+
+用法:
+    renderer = OverlayRenderer()
+    renderer.draw(frame, detections)  # frame: [H, W, 3] uint8, 原地绘制并返回
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+DEFAULT_COLORS = (
+    (255, 0, 0), (0, 255, 0), (0, 0, 255),
+    (255, 255, 0), (255, 0, 255), (0, 255, 255)
+)
+
+
+def label_text(det):
+    """检测结果的标签文本 (类型 / 置信度 / 距离)"""
+    distance = det.get('distance', None)
+    if distance:
+        return f"{det['label']}\n{det['confidence']:.1%}\n{distance:.2f}m"
+    return f"{det['label']}\n{det['confidence']:.1%}"
+
+
+class OverlayRenderer:
+    """检测结果标注渲染器 (线程安全)"""
+
+    def __init__(
+        self,
+        font_path=DEFAULT_FONT,
+        font_size=12,
+        colors=DEFAULT_COLORS,
+        box_width=3,
+        label_offset=60,
+        padding=2,
+        max_labels=512
+    ):
+        """
+        Args:
+            font_path: TrueType字体路径 (加载失败时使用PIL默认字体)
+            font_size: 字号
+            colors: 按检测序号轮流使用的RGB颜色
+            box_width: 边框宽度 (像素, 向框内绘制)
+            label_offset: 标签文本在框上方的距离 (像素)
+            padding: 标签背景相对文本的外扩像素
+            max_labels: 最多缓存的标签贴图数 (文本行缓存上限相同)
+        """
+        try:
+            self.font = ImageFont.truetype(font_path, font_size)
+        except (OSError, ValueError):
+            print(f"⚠️ 字体加载失败 ({font_path}), 使用默认字体")
+            self.font = ImageFont.load_default()
+
+        self.colors = [np.array(color, dtype=np.uint8) for color in colors]
+        self.box_width = box_width
+        self.label_offset = label_offset
+        self.padding = padding
+        self.max_labels = max_labels
+
+        # 多行文本的行距与 ImageDraw.multiline_text 相同
+        measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+        self.line_spacing = (
+            measure.multiline_textbbox((0, 0), "A\nA", font=self.font)[3]
+            - measure.textbbox((0, 0), "A", font=self.font)[3]
+        )
+
+        self._glyphs = {}
+        self._lines = OrderedDict()
+        self._labels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def draw(self, frame, detections):
+        """
+        在帧上绘制检测结果 (原地)
+
+        Args:
+            frame: [H, W, 3] uint8 (颜色按RGB顺序写入)
+            detections: 检测结果列表 (box, label, confidence, 可选 distance)
+
+        Returns:
+            frame: 同一个数组
+        """
+        for idx, det in enumerate(detections):
+            x1, y1, x2, y2 = map(int, det['box'])
+            color = self.colors[idx % len(self.colors)]
+
+            self._draw_box(frame, x1, y1, x2, y2, color)
+
+            patch, (dx, dy) = self._label(label_text(det), idx % len(self.colors))
+            self._blit(frame, patch, x1 + dx, y1 - self.label_offset + dy)
+        return frame
+
+    def cache_info(self):
+        """缓存的字形、文本行和标签贴图数"""
+        with self._lock:
+            return {'glyphs': len(self._glyphs), 'lines': len(self._lines), 'labels': len(self._labels)}
+
+    def _draw_box(self, frame, x1, y1, x2, y2, color):
+        """边框 (与 ImageDraw.rectangle(width=...) 相同: 包含端点, 向内绘制)"""
+        w = self.box_width
+        self._fill(frame, x1, y1, x2 + 1, min(y1 + w, y2 + 1), color)
+        self._fill(frame, x1, max(y2 + 1 - w, y1), x2 + 1, y2 + 1, color)
+        self._fill(frame, x1, y1, min(x1 + w, x2 + 1), y2 + 1, color)
+        self._fill(frame, max(x2 + 1 - w, x1), y1, x2 + 1, y2 + 1, color)
+
+    @staticmethod
+    def _fill(frame, x0, y0, x1, y1, color):
+        """填充 [y0:y1, x0:x1] (裁剪到画面内)"""
+        height, width = frame.shape[:2]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width), min(y1, height)
+        if x0 < x1 and y0 < y1:
+            frame[y0:y1, x0:x1] = color
+
+    @staticmethod
+    def _blit(frame, patch, x, y):
+        """把贴图复制到 (x, y) (裁剪到画面内)"""
+        height, width = frame.shape[:2]
+        h, w = patch.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, width), min(y + h, height)
+        if x0 < x1 and y0 < y1:
+            frame[y0:y1, x0:x1] = patch[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    def _label(self, text, color_index):
+        """
+        标签贴图 (黑色背景 + 彩色文字) 及其相对文本原点的偏移
+
+        Returns:
+            patch: [h, w, 3] uint8
+            offset: (dx, dy)
+        """
+        key = (text, color_index)
+        with self._lock:
+            cached = self._labels.get(key)
+            if cached is not None:
+                self._labels.move_to_end(key)
+                return cached
+
+            coverage, offset = self._text_mask(text)
+            # 黑色背景上的文字: 颜色 * 覆盖度 / 255 (四舍五入, 与PIL混合结果相同)
+            color = self.colors[color_index].astype(np.uint16)
+            patch = ((coverage[:, :, None].astype(np.uint16) * color + 127) // 255).astype(np.uint8)
+
+            cached = (patch, offset)
+            self._labels[key] = cached
+            while len(self._labels) > self.max_labels:
+                self._labels.popitem(last=False)
+            return cached
+
+    def _glyph(self, char):
+        """字形贴图: (覆盖度 [h, w] uint8, 左偏移, 上偏移, 步进宽度), 每个字符只栅格化一次"""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            left, top, right, bottom = self.font.getbbox(char)
+            mask = np.zeros((max(bottom - top, 0), max(right - left, 0)), dtype=np.uint8)
+            if mask.size:
+                image = Image.new('L', (right - left, bottom - top), 0)
+                ImageDraw.Draw(image).text((-left, -top), char, fill=255, font=self.font)
+                mask = np.asarray(image)
+            glyph = (mask, left, top, self.font.getlength(char))
+            self._glyphs[char] = glyph
+        return glyph
+
+    def _line_mask(self, line):
+        """
+        单行文本的覆盖度 (按行文本缓存, 如重复出现的类型名称)
+
+        Returns:
+            (coverage [h, w] uint8, 左偏移, 上偏移), 空白行为 (None, 0, 0)
+        """
+        cached = self._lines.get(line)
+        if cached is not None:
+            self._lines.move_to_end(line)
+            return cached
+
+        placed = []
+        x = 0.0
+        for char in line:
+            mask, left, top, advance = self._glyph(char)
+            if mask.size:
+                placed.append((mask, int(round(x)) + left, top))
+            x += advance
+
+        cached = (None, 0, 0)
+        if placed:
+            cached = self._compose(placed, 0)
+        self._lines[line] = cached
+        while len(self._lines) > self.max_labels:
+            self._lines.popitem(last=False)
+        return cached
+
+    def _text_mask(self, text):
+        """
+        多行文本的覆盖度 (含背景外扩)
+
+        Returns:
+            coverage: [h, w] uint8, 0 为背景, 255 为文字
+            offset: 贴图左上角相对文本原点的偏移 (dx, dy)
+        """
+        placed = []
+        for row, line in enumerate(text.split('\n')):
+            coverage, left, top = self._line_mask(line)
+            if coverage is not None:
+                placed.append((coverage, left, row * self.line_spacing + top))
+
+        pad = self.padding
+        if not placed:
+            return np.zeros((2 * pad + 1, 2 * pad + 1), dtype=np.uint8), (-pad, -pad)
+
+        # 背景矩形与 ImageDraw.rectangle 相同, 包含右下端点
+        coverage, left, top = self._compose(placed, pad, inclusive=True)
+        return coverage, (left, top)
+
+    @staticmethod
+    def _compose(placed, pad, inclusive=False):
+        """把若干 (覆盖度, x, y) 合成到一张贴图上, 返回 (覆盖度, 左上角x, 左上角y)"""
+        x_min = min(x for _, x, _ in placed)
+        y_min = min(y for _, _, y in placed)
+        x_max = max(x + mask.shape[1] for mask, x, _ in placed)
+        y_max = max(y + mask.shape[0] for mask, _, y in placed)
+
+        extra = 2 * pad + int(inclusive)
+        coverage = np.zeros((y_max - y_min + extra, x_max - x_min + extra), dtype=np.uint8)
+        for mask, x, y in placed:
+            top, left = y - y_min + pad, x - x_min + pad
+            region = coverage[top:top + mask.shape[0], left:left + mask.shape[1]]
+            np.maximum(region, mask, out=region)
+        return coverage, x_min - pad, y_min - pad
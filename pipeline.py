@@ -27,11 +27,248 @@ from transformers import (
     AutoModelForDepthEstimation,
     DPTImageProcessor
 )
+from transformers.modeling_outputs import BaseModelOutput, DepthEstimatorOutput
+from transformers.models.owlv2.modeling_owlv2 import Owlv2ObjectDetectionOutput
 from torchvision.ops import nms  # 使用 torchvision 的 NMS 实现
+from model_residency import ModelResidencyManager, module_memory_bytes
+from result_cache import ResultCache, RecentResults
+from tiled_detection import plan_tiles, render_tile, inner_edge_mask
+from tensorrt_utils import resolve_compile_backend, compile_module, CompiledArtifactCache
+from onnx_backend import OnnxRuntimeBackend, onnx_runtime_available
+from metrics import StageMetrics, MetricsServer
+from config_multi_lights import DETECTION_CONFIG
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import List, Dict, Tuple, Optional
 
 
+# 灯具类型 → 距离范围表 (米)
+# 每项: (关键词, 位置条件, 条件满足时的范围, 否则的范围)
+# 位置条件: 0=无, 1=位于上方 (rel_y < 0.4), 2=位于下方 (rel_y > 0.6)
+_DISTANCE_RANGE_RULES = [
+    # 吸顶灯/吊灯 (通常在上方)
+    (('ceiling', 'chandelier', 'pendant', 'hanging', 'recessed', 'downlight'), 1, (2.0, 4.5), (1.5, 4.0)),
+    # 壁灯 (中等高度)
+    (('wall', 'sconce'), 0, (1.0, 3.5), (1.0, 3.5)),
+    # 台灯/落地灯 (较低位置)
+    (('table', 'desk', 'floor', 'standing'), 2, (0.5, 2.5), (1.0, 3.0)),
+    # 射灯/筒灯
+    (('spotlight', 'track', 'can', 'pot'), 0, (1.5, 4.0), (1.5, 4.0)),
+]
+# 其他通用灯具
+_DEFAULT_DISTANCE_RANGE = (0.8, 4.5)
+
+_RANGE_TABLE = np.array(
+    [[rule[2], rule[3]] for rule in _DISTANCE_RANGE_RULES]
+    + [[_DEFAULT_DISTANCE_RANGE, _DEFAULT_DISTANCE_RANGE]]
+)
+_RANGE_CONDITIONS = np.array([rule[1] for rule in _DISTANCE_RANGE_RULES] + [0])
+
+
+@lru_cache(maxsize=None)
+def _label_distance_category(label):
+    """标签 → 距离范围表的行号 (按关键词匹配, 每个标签只匹配一次)"""
+    label = label.lower()
+    for idx, (keywords, _, _, _) in enumerate(_DISTANCE_RANGE_RULES):
+        if any(kw in label for kw in keywords):
+            return idx
+    return len(_DISTANCE_RANGE_RULES)
+
+
+# 精确ROI中位数的批处理参数:
+# 不超过 _ROI_BATCH_PIXELS 像素的小ROI按尺寸分组, 拼成填充数组一次 np.partition (省去逐框调用开销);
+# 更大的ROI逐个 np.partition (单次调用开销相对其像素数可忽略, 填充反而增加开销)
+_ROI_BATCH_PIXELS = 1024
+_ROI_BUCKET_MIN = 32  # 分组窗口的最小边长 (边长不超过它的ROI共用一组)
+_ROI_CHUNK_PIXELS = 1 << 15  # 每次排序的像素数上限 (约128KB, 留在缓存内)
+
+
+def _roi_bucket(length):
+    """ROI边长 → 分组窗口边长 (每个二进制数量级4档, 填充不超过约25%)"""
+    if length <= _ROI_BUCKET_MIN:
+        return _ROI_BUCKET_MIN
+    step = 1 << max(0, length.bit_length() - 3)
+    return -(-length // step) * step
+
+
+def _roi_median(stat_map, x1, y1, x2, y2):
+    """
+    批量计算ROI深度的精确中位数 (与逐框 np.median 一致)
+
+    小ROI按分组窗口尺寸 (gh, gw) 分组, 每组从深度图的滑动窗口视图中一次取出所有窗口;
+    窗口中ROI以外的位置一半填 -inf、一半填 +inf (多出的一个填 +inf),
+    这样每行ROI像素的中间两个值恰好落在排序后的固定位置附近, 整组只需一次 np.partition。
+
+    Args:
+        stat_map: 深度图 (h, w)
+        x1, y1, x2, y2: 非空ROI的整数坐标数组 (已裁剪到深度图范围内)
+
+    Returns:
+        median: float64 数组
+    """
+    heights, widths = y2 - y1, x2 - x1
+    counts = heights * widths
+    median = np.empty(len(x1))
+
+    # 大ROI: 逐个选择 (axis=None 展平为副本, 不修改深度图)
+    large = counts > _ROI_BATCH_PIXELS
+    for i in np.flatnonzero(large):
+        count = counts[i]
+        middle = ((count - 1) // 2, count // 2)
+        values = np.partition(stat_map[y1[i]:y2[i], x1[i]:x2[i]], middle, axis=None)
+        median[i] = (np.float64(values[middle[0]]) + values[middle[1]]) / 2
+
+    small = np.flatnonzero(~large)
+    if not len(small):
+        return median
+
+    # 小ROI: 按分组窗口尺寸分组, 窗口超出深度图的部分先补零 (随后被 ±inf 覆盖)
+    bucket_h = np.array([_roi_bucket(h) for h in heights[small].tolist()])
+    bucket_w = np.array([_roi_bucket(w) for w in widths[small].tolist()])
+    height, width = stat_map.shape[:2]
+    pad_y = max(0, int((y1[small] + bucket_h).max()) - height)
+    pad_x = max(0, int((x1[small] + bucket_w).max()) - width)
+    padded = np.pad(stat_map, ((0, pad_y), (0, pad_x))) if pad_y or pad_x else stat_map
+
+    keys = bucket_h * (bucket_w.max() + 1) + bucket_w
+    order = np.argsort(keys, kind='stable')
+    for group in np.split(order, np.flatnonzero(np.diff(keys[order])) + 1):
+        gh, gw = int(bucket_h[group[0]]), int(bucket_w[group[0]])
+        windows = sliding_window_view(padded, (gh, gw))
+        size = gh * gw
+        # ±inf 各占一半时ROI的中间两个值位于 size 的中间位置或其前一位
+        kth = sorted({max((size - 1) // 2 - 1, 0), (size - 1) // 2, size // 2})
+        rows, cols = np.arange(gh)[None, :], np.arange(gw)
+        chunk = max(1, _ROI_CHUNK_PIXELS // size)
+        for start in range(0, len(group), chunk):
+            index = small[group[start:start + chunk]]
+            values = windows[y1[index], x1[index]]  # 副本 [n, gh, gw]
+            h, w = heights[index][:, None], widths[index][:, None]
+            count = counts[index]
+            low = (size - count) // 2  # 填 -inf 的个数
+
+            # 填充位置按行优先的序号: ROI行右侧的 gw-w 个, 之后是ROI下方的整行
+            inside_rows = rows < h
+            row_rank = np.where(inside_rows, rows * (gw - w) - w, h * (gw - w) + (rows - h) * gw)
+            outside = ~inside_rows[:, :, None] | (cols >= w[:, :, None])
+            values[outside] = np.inf
+            values[outside & (cols < (low[:, None] - row_rank)[:, :, None])] = -np.inf
+
+            values = values.reshape(len(index), size)
+            values.partition(kth, axis=1)
+            n = np.arange(len(index))
+            median[index] = (
+                values[n, low + (count - 1) // 2].astype(np.float64) + values[n, low + count // 2]
+            ) / 2
+    return median
+
+
+def _roi_statistics(stat_map, x1, y1, x2, y2):
+    """
+    批量计算ROI深度的中位数和均值 (与逐框 np.median / np.mean 一致)
+
+    - 均值: 在所有ROI的外接区域上建 float64 积分图, 每个框 O(1) 求和 (与逐框 np.mean 差异 <1e-6)
+    - 中位数: 精确中位数, 小ROI分组批量选择 (见 _roi_median)
+
+    Args:
+        stat_map: 深度图 (h, w)
+        x1, y1, x2, y2: 非空ROI的整数坐标数组 (已裁剪到深度图范围内)
+
+    Returns:
+        (median, mean): float64 数组
+    """
+    heights, widths = y2 - y1, x2 - x1
+
+    # 均值: 外接区域的积分图
+    ux1, uy1 = x1.min(), y1.min()
+    region = np.ascontiguousarray(stat_map[uy1:y2.max(), ux1:x2.max()])
+    if region.dtype not in (np.float32, np.float64):
+        region = region.astype(np.float32)
+    integral = cv2.integral(region, sdepth=cv2.CV_64F)
+    ax1, ay1, ax2, ay2 = x1 - ux1, y1 - uy1, x2 - ux1, y2 - uy1
+    sums = integral[ay2, ax2] - integral[ay1, ax2] - integral[ay2, ax1] + integral[ay1, ax1]
+    mean = sums / (heights * widths)
+
+    return _roi_median(stat_map, x1, y1, x2, y2), mean
+
+
+class LazyDepthMap:
+    """
+    原生分辨率深度图 (全分辨率深度图按需生成)
+
+    深度模型输出的网格远小于输入图像 (如 4K 照片), 距离计算只需要在原生网格上
+    取ROI统计; 全分辨率深度图仅在调用方真正使用时 (如深度可视化) 才插值生成并缓存。
+
+    支持 np.asarray(depth_map) / plt.imshow(depth_map), shape 为全分辨率 (H, W)。
+    """
+
+    def __init__(self, native, size, upsample):
+        """
+        Args:
+            native: 原生网格上的归一化深度图 (h, w), 值域 [0, 1]
+            size: 原图尺寸 (width, height)
+            upsample: 无参可调用对象, 返回全分辨率归一化深度图 (H, W)
+                      (使用 functools.partial 以便结果缓存持久化时可序列化)
+        """
+        self.native = native
+        self.size = tuple(size)
+        self._upsample = upsample
+        self._full = None
+
+    @property
+    def shape(self):
+        """全分辨率深度图的形状 (H, W)"""
+        return (self.size[1], self.size[0])
+
+    @property
+    def nbytes(self):
+        """当前占用的字节数 (原生网格 + 已生成的全分辨率图)"""
+        return self.native.nbytes + (self._full.nbytes if self._full is not None else 0)
+
+    @property
+    def max_nbytes(self):
+        """全分辨率图生成后占用的字节数 (缓存按此计量, 之后生成全分辨率图不会超出预算)"""
+        return self.native.nbytes + self.size[0] * self.size[1] * self.native.itemsize
+
+    @property
+    def is_materialized(self):
+        """全分辨率深度图是否已生成"""
+        return self._full is not None
+
+    def materialize(self):
+        """生成 (并缓存) 全分辨率深度图"""
+        if self._full is None:
+            self._full = self._upsample()
+            self._upsample = None
+        return self._full
+
+    def __array__(self, dtype=None, copy=None):
+        full = self.materialize()
+        return full if dtype is None else full.astype(dtype, copy=False)
+
+    def map_boxes(self, x1, y1, x2, y2):
+        """
+        全分辨率像素坐标 → 原生网格坐标 (向外取整, 每个框至少覆盖一个网格单元)
+
+        Args:
+            x1, y1, x2, y2: 已裁剪到图像范围内的整数坐标数组
+
+        Returns:
+            (nx1, ny1, nx2, ny2): 原生网格上的整数坐标数组
+        """
+        native_h, native_w = self.native.shape[:2]
+        scale_x = native_w / self.size[0]
+        scale_y = native_h / self.size[1]
+        nx1 = np.clip(np.floor(x1 * scale_x).astype(int), 0, native_w - 1)
+        ny1 = np.clip(np.floor(y1 * scale_y).astype(int), 0, native_h - 1)
+        nx2 = np.clip(np.ceil(x2 * scale_x).astype(int), nx1 + 1, native_w)
+        ny2 = np.clip(np.ceil(y2 * scale_y).astype(int), ny1 + 1, native_h)
+        return nx1, ny1, nx2, ny2
+
+
 class LightLocalization3D:
     """基于OWLv2 + DINOv3 + Depth Anything V2的灯具3D定位系统"""
     
@@ -41,7 +278,17 @@ class LightLocalization3D:
         feature_model="facebook/dinov3-vitl16-pretrain-lvd1689m",
         depth_model="depth-anything/Depth-Anything-V2-Large-hf",
         device=None,
-        enable_fallback=True
+        enable_fallback=True,
+        lazy_features=True,
+        lazy_loading=False,
+        idle_timeout=None,
+        parallel_loading=False,
+        native_depth=False,
+        detection_config=None,
+        result_cache=None,
+        retain_last=0,
+        retain_max_mb=256,
+        amp=None
     ):
         """
         初始化3D定位流水线
@@ -52,6 +299,26 @@ class LightLocalization3D:
             depth_model: Depth Anything V2深度估计模型
             device: 运行设备 ('cuda', 'cpu', 或 None自动选择)
             enable_fallback: 是否启用降级策略
+            lazy_features: 按需加载DINOv3 (仅在深度降级或调用方显式请求特征时加载/运行)
+            lazy_loading: 所有模型都推迟到首次使用时加载 (启动更快, 未用到的模型不占内存)
+            idle_timeout: 空闲多少秒后自动卸载模型 (None 表示常驻), 卸载后下次使用时重新加载
+            parallel_loading: 启动时并行加载各模型 (降级顺序不变, 日志按固定顺序输出)
+            native_depth: 在深度模型原生分辨率上计算距离, 返回 LazyDepthMap,
+                          全分辨率深度图仅在被访问时生成 (适合 4K 等大图)
+            detection_config: 检测配置 (覆盖 config_multi_lights.DETECTION_CONFIG),
+                              控制多尺度 (multi_scale/scales) 和滑动窗口
+                              (use_sliding_window/window_size/stride) 分块检测;
+                              其中 confidence_threshold/use_nms/nms_threshold/min_area_ratio
+                              是检测接口未指定这些参数时的默认值
+                              (如 get_optimized_config('dense')['detection'])
+            result_cache: ResultCache 实例 (可选), 按图像内容缓存检测结果和深度图
+            retain_last: 保留最近K张图像的原始候选框和深度图 (0 表示不保留),
+                         交互调整阈值/NMS时无需重新前向
+            retain_max_mb: 保留结果的内存上限 (MB), 深度图按全分辨率大小计量
+            amp: 混合精度 (模型前向在autocast下运行, 后处理保持fp32):
+                 None 读取 config.yaml 的 PERFORMANCE.use_amp/amp_dtype/amp_models;
+                 True/False, 'auto' (CPU bf16, GPU fp16), 'bf16', 'fp16',
+                 或按模型配置 {'detection': 'bf16', 'depth': False, ...}
         """
         if device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -63,15 +330,94 @@ class LightLocalization3D:
         print(f"{'='*60}")
         print(f"使用设备: {self.device}")
         
-        # 1. 加载OWLv2检测模型
         self.enable_fallback = enable_fallback
-        self._load_detection_model(detection_model)
+        self.lazy_features = lazy_features
+        self.lazy_loading = lazy_loading
+        self.native_depth = native_depth
+        self.detection_config = {**DETECTION_CONFIG, **(detection_config or {})}
+        self.result_cache = result_cache
+        self._requested_models = {'detection': detection_model, 'features': feature_model, 'depth': depth_model}
+        # 实际加载的模型路径 (降级链可能加载了与请求不同的模型, 全部失败为None), 首次加载后记录
+        self._resolved_models = {}
+        self._recent = RecentResults(retain_last, retain_max_mb) if retain_last > 0 else None
+        self.amp_dtypes = self._resolve_amp(amp)
+        if self.amp_dtypes:
+            print(f"混合精度: " + ", ".join(
+                f"{name} {str(dtype).replace('torch.', '')}" for name, dtype in self.amp_dtypes.items()
+            ))
         
-        # 2. 加载DINOv3特征提取模型
-        self._load_feature_model(feature_model)
+        # 编译推理 (enable_compiled_inference 启用后才编译)
+        self._compile_options = None
+        self._compiled_forwards = {}
+        self._compile_failed = set()
+        self._compile_cache = None
+        self._compile_cache_key = None
+        self._compiled_signatures = set()
+        # 按需加载的模型加载后在后台线程预热编译, 编译完成前该模型的请求以eager执行
+        self._compile_warmup_sizes = ()
+        self._background_compiling = set()
+        self._warmup_thread_state = threading.local()
         
-        # 3. 加载Depth Anything V2深度估计模型
-        self._load_depth_model(depth_model)
+        # ONNX Runtime 后端 (enable_onnx_runtime 启用)
+        self._onnx = None
+        self._onnx_failed = set()
+        
+        # 动态INT8量化 (enable_int8_quantization 启用): 需要量化的模型槽位
+        self._quantize_models = set()
+        self._quantize_lock = threading.Lock()
+        
+        # 分阶段性能指标 (start_metrics_server 在本地导出)
+        self.metrics = StageMetrics()
+        self._metrics_server = None
+        
+        # 模型驻留管理: 首次使用时加载, 空闲超时后卸载
+        self.residency = ModelResidencyManager(idle_timeout=idle_timeout)
+        self._init_model_slots()
+        self.residency.register(
+            'detection',
+            loader=lambda log=print: self._after_model_load(
+                'detection', self._load_detection_model(detection_model, log=log)
+            ),
+            unloader=lambda: self._unload_model_slot('detection'),
+            get_model=lambda: self.detection_model
+        )
+        self.residency.register(
+            'features',
+            loader=lambda log=print: self._after_model_load(
+                'features', self._load_feature_model(feature_model, log=log)
+            ),
+            unloader=lambda: self._unload_model_slot('features'),
+            get_model=lambda: self.feature_model
+        )
+        self.residency.register(
+            'depth',
+            loader=lambda log=print: self._after_model_load(
+                'depth', self._load_depth_model(depth_model, log=log)
+            ),
+            unloader=lambda: self._unload_model_slot('depth'),
+            get_model=lambda: self.depth_model
+        )
+        
+        if lazy_loading:
+            print(f"\n模型按需加载: 首次使用时加载")
+        elif parallel_loading:
+            startup_models = ['detection', 'depth'] if lazy_features else ['detection', 'features', 'depth']
+            self._load_models_parallel(startup_models)
+        else:
+            # 1. 加载OWLv2检测模型
+            self.residency.ensure('detection')
+            
+            # 2. 加载DINOv3特征提取模型 (按需模式下推迟到首次使用)
+            if lazy_features:
+                print(f"\n2. DINOv3特征模型: 按需加载 (首次需要特征时加载)")
+            else:
+                self.residency.ensure('features')
+            
+            # 3. 加载Depth Anything V2深度估计模型
+            self.residency.ensure('depth')
+        
+        if idle_timeout is not None:
+            self.residency.start_idle_reaper()
         
         # 4. 灯具检测提示词 (针对室内场景优化)
         self.light_prompts = [
@@ -93,6 +439,9 @@ class LightLocalization3D:
             "light fixture", "lighting", "lamp", "bulb", "light"
         ]
         
+        # 5. 文本查询嵌入缓存 (提示词不变时无需每帧重跑文本塔)
+        self._text_query_cache = {}
+        
         print(f"\n{'='*60}")
         print(f"✓ 流水线初始化完成!")
         print(f"  检测模型: {self.detection_model_name}")
@@ -101,6 +450,59 @@ class LightLocalization3D:
         print(f"  灯具类别: {len(self.light_prompts)} 种")
         print(f"{'='*60}\n")
 
+    # 混合精度名称 → dtype ('auto' 按设备选择)
+    _AMP_DTYPES = {'bf16': torch.bfloat16, 'bfloat16': torch.bfloat16, 'fp16': torch.float16, 'float16': torch.float16}
+    
+    def _resolve_amp(self, amp):
+        """
+        解析混合精度配置
+        
+        Args:
+            amp: 见 __init__ 的 amp 参数
+        
+        Returns:
+            amp_dtypes: {模型槽位: torch.dtype}, 不启用的模型不在其中
+        """
+        models = list(self._MODEL_SLOTS)
+        if amp is None:
+            performance = self._load_performance_config()
+            if not performance.get('use_amp', False):
+                return {}
+            amp = performance.get('amp_dtype', 'auto')
+            models = performance.get('amp_models') or models
+        
+        if isinstance(amp, dict):
+            settings = {name: amp.get(name, False) for name in self._MODEL_SLOTS}
+        else:
+            settings = {name: amp if name in models else False for name in self._MODEL_SLOTS}
+        
+        on_cuda = str(self.device).startswith('cuda')
+        amp_dtypes = {}
+        for name, setting in settings.items():
+            if setting is False or setting is None:
+                continue
+            if setting is True or setting == 'auto':
+                amp_dtypes[name] = torch.float16 if on_cuda else torch.bfloat16
+            elif setting in self._AMP_DTYPES:
+                amp_dtypes[name] = self._AMP_DTYPES[setting]
+            else:
+                raise ValueError(f"未知混合精度设置: {name}={setting!r} (可选 True/False/'auto'/'bf16'/'fp16')")
+        return amp_dtypes
+    
+    @staticmethod
+    def _load_performance_config(config_path=Path(__file__).parent / "config.yaml"):
+        """读取 config.yaml 的 PERFORMANCE 配置 (文件不存在或无法解析时返回空字典)"""
+        if not Path(config_path).exists():
+            return {}
+        try:
+            import yaml
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f) or {}
+        except Exception as e:
+            print(f"⚠️ 读取配置失败 ({config_path}): {e}")
+            return {}
+        return config.get('PERFORMANCE') or {}
+    
     def _to_pil(self, image):
         """Convert an image (numpy BGR or PIL) to a PIL Image in RGB.
 
@@ -115,9 +517,430 @@ class LightLocalization3D:
                 return Image.fromarray(image)
         return image
     
-    def _load_detection_model(self, model_name):
+    # 模型槽位: 名称 → (模型属性, 处理器属性, 可用标志属性, 模型描述属性)
+    _MODEL_SLOTS = {
+        'detection': ('detection_model', 'detection_processor', 'use_detection', 'detection_model_name'),
+        'features': ('feature_model', 'feature_processor', 'use_features', 'feature_model_name'),
+        'depth': ('depth_model', 'depth_processor', 'use_depth_anything_v2', 'depth_model_name'),
+    }
+    
+    def _init_model_slots(self):
+        """初始化所有模型槽位为未加载状态"""
+        for name in self._MODEL_SLOTS:
+            self._unload_model_slot(name)
+    
+    def _unload_model_slot(self, name):
+        """释放模型槽位中的模型和处理器引用"""
+        model_attr, processor_attr, flag_attr, desc_attr = self._MODEL_SLOTS[name]
+        self._compiled_forwards.pop(name, None)
+        if self._onnx is not None:
+            self._onnx.clear(name)
+        setattr(self, model_attr, None)
+        setattr(self, processor_attr, None)
+        setattr(self, flag_attr, False)
+        setattr(self, desc_attr, "按需加载")
+    
+    def _load_models_parallel(self, names):
+        """
+        并行加载多个模型
+        
+        各模型的权重读取和反序列化互相独立, 用线程池重叠I/O。
+        每个模型的降级链仍在各自线程内按顺序尝试; 日志先缓存,
+        全部完成后按 names 顺序输出, 保证日志确定。
+        
+        Args:
+            names: 模型名称列表 ('detection', 'features', 'depth')
+        """
+        print(f"\n并行加载模型: {', '.join(names)}")
+        start_time = time.time()
+        
+        logs = {name: [] for name in names}
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="model-loader") as executor:
+            futures = {
+                name: executor.submit(self.residency.ensure, name, log=logs[name].append)
+                for name in names
+            }
+        
+        # 按固定顺序输出日志; 不允许降级时, 按顺序抛出第一个加载异常
+        for name in names:
+            for line in logs[name]:
+                print(line)
+            futures[name].result()
+        
+        print(f"\n✓ 并行加载完成: {time.time() - start_time:.1f}s")
+    
+    def enable_compiled_inference(
+        self,
+        backend="auto",
+        mode=None,
+        warmup=True,
+        warmup_sizes=((640, 480),),
+        cache_dir="models/compile_cache"
+    ):
+        """
+        启用编译推理 (torch.compile; CUDA且安装了torch_tensorrt时使用TensorRT后端)
+        
+        编译各模型的主干前向 (OWLv2图像塔, DINOv3, Depth Anything V2), 静态形状:
+        每种 batch/输入尺寸组合首次出现时编译一次。编译或运行失败的模型自动回退到eager。
+        未加载的模型 (lazy_loading) 加载后在后台线程用 warmup_sizes 预热编译, 编译完成前
+        该模型的请求以eager执行, 首个请求不必等待编译; 空闲卸载后重新加载时同样处理。
+        
+        Args:
+            backend: 'auto', 'tensorrt', 'inductor' 或其他 torch.compile 后端 (CPU上 'auto' 即 inductor)
+            mode: torch.compile 模式 (None, 'reduce-overhead', 'max-autotune' 等)
+            warmup: 是否用空白图像预热 (编译耗时发生在启动/加载时而非首个请求):
+                    已加载的模型立即预热, 之后加载的模型在后台预热
+            warmup_sizes: 预热图像尺寸 (width, height) 列表;
+                          深度模型输入尺寸随长宽比变化, 应包含实际摄像头分辨率
+            cache_dir: 编译产物磁盘缓存目录 (None 表示不缓存); 重启后直接复用,
+                       跳过内核生成和自动调优
+        
+        Returns:
+            backend: 实际使用的 torch.compile 后端
+        """
+        backend = resolve_compile_backend(backend, self.device)
+        self._compile_cache = CompiledArtifactCache(cache_dir) if cache_dir else None
+        options = None
+        if self._compile_cache is not None:
+            self._compile_cache_key = self._compile_cache.make_key(**self._compile_cache_parts(backend, mode))
+            if backend == "torch_tensorrt":
+                options = self._compile_cache.tensorrt_options()
+            else:
+                self._compile_cache.load(self._compile_cache_key)
+        
+        self._compile_options = {'backend': backend, 'mode': mode, 'options': options}
+        self._compile_warmup_sizes = tuple(tuple(size) for size in warmup_sizes) if warmup else ()
+        self._compiled_forwards.clear()
+        self._compile_failed.clear()
+        self._compiled_signatures.clear()
+        print(f"✓ 编译推理已启用 (后端: {backend}, 模式: {mode or 'default'})")
+        
+        if warmup:
+            self.warmup(warmup_sizes)
+        return backend
+    
+    def enable_onnx_runtime(
+        self,
+        cache_dir="models/onnx",
+        intra_op_threads=None,
+        validate=True,
+        atol=1e-3,
+        warmup=True,
+        warmup_sizes=((640, 480),)
+    ):
+        """
+        启用ONNX Runtime后端 (CPU执行提供器)
+        
+        各模型主干首次遇到某个输入尺寸时导出ONNX (缓存到 cache_dir, 重启后复用),
+        并与PyTorch输出对比验证; 导出、验证或执行失败的模型回退到PyTorch。
+        预处理和后处理 (NMS、深度插值、距离映射) 不变。
+        
+        Args:
+            cache_dir: ONNX文件缓存目录
+            intra_op_threads: 算子内线程数 (None 表示ONNX Runtime默认)
+            validate: 创建会话时是否对比PyTorch输出
+            atol: 验证容差 (另加1e-3倍输出最大绝对值的相对容差)
+            warmup: 是否立即用空白图像预热已加载的模型 (导出发生在启动时而非首个请求)
+            warmup_sizes: 预热图像尺寸 (width, height) 列表
+        
+        Returns:
+            enabled: 是否启用成功 (未安装 onnx/onnxruntime 时为 False)
+        """
+        if not onnx_runtime_available():
+            print("⚠️ onnx/onnxruntime未安装,继续使用PyTorch")
+            print("   安装命令: pip install onnx onnxruntime")
+            return False
+        if str(self.device).startswith("cuda"):
+            print("⚠️ ONNX Runtime后端只使用CPU执行提供器, 推理将在CPU上运行")
+        
+        self._onnx = OnnxRuntimeBackend(
+            cache_dir=cache_dir, intra_op_threads=intra_op_threads, validate=validate, atol=atol
+        )
+        self._onnx_failed.clear()
+        print(f"✓ ONNX Runtime后端已启用 (线程数: {intra_op_threads or '默认'})")
+        
+        if warmup:
+            self.warmup(warmup_sizes)
+        return True
+    
+    def enable_int8_quantization(self, models=('detection', 'features', 'depth')):
+        """
+        启用动态INT8量化 (仅CPU)
+        
+        各模型主干 (OWLv2图像塔和检测头, DINOv3, Depth Anything V2) 的 nn.Linear 权重量化为int8,
+        激活在运行时按batch动态量化; ViT的计算量几乎都在线性层, 权重内存约降为1/4。
+        OWLv2文本塔保持fp32 (每组提示词只编码一次, 量化收益很小), 已缓存的文本查询嵌入继续有效。
+        已加载的模型立即量化, 之后加载的模型 (按需加载/空闲卸载后重新加载) 加载后立即量化,
+        首次前向即使用量化权重。精度影响可用 calibrate_quantization.py 在 data/ 图像上评估。
+        
+        Args:
+            models: 需要量化的模型槽位 ('detection', 'features', 'depth')
+        
+        Returns:
+            enabled: 是否启用 (非CPU设备时为 False)
+        """
+        if not str(self.device).startswith("cpu"):
+            print(f"⚠️ 动态INT8量化仅支持CPU (当前设备: {self.device}), 跳过")
+            return False
+        
+        unknown = set(models) - set(self._MODEL_SLOTS)
+        if unknown:
+            raise ValueError(f"未知模型槽位: {sorted(unknown)}")
+        
+        self._quantize_models = set(models)
+        print(f"✓ 动态INT8量化已启用: {', '.join(sorted(self._quantize_models))}")
+        for name in sorted(self._quantize_models):
+            if self.residency.is_resident(name):
+                with self.residency.use(name) as available:
+                    if available:
+                        self._quantize_module(name, getattr(self, self._MODEL_SLOTS[name][0]))
+        return True
+    
+    # 各模型需要量化的子模块 (未列出的模型量化全部 nn.Linear);
+    # OWLv2只量化逐帧运行的图像塔和检测头, 文本塔保持fp32
+    _QUANTIZE_SUBMODULES = {
+        'detection': ('owlv2.vision_model', 'class_head', 'box_head', 'objectness_head'),
+    }
+    
+    def _quantize_module(self, name, module):
+        """对模块 (或其 _QUANTIZE_SUBMODULES 子模块) 的 nn.Linear 做原地动态INT8量化 (每个模块只量化一次)"""
+        with self._quantize_lock:
+            if getattr(module, '_int8_quantized', False):
+                return
+            before = module_memory_bytes(module)
+            start_time = time.time()
+            torch.ao.quantization.quantize_dynamic(
+                module,
+                set(self._QUANTIZE_SUBMODULES.get(name, ())) or {torch.nn.Linear},
+                dtype=torch.qint8,
+                mapping={torch.nn.Linear: torch.ao.nn.quantized.dynamic.Linear},
+                inplace=True
+            )
+            after = module_memory_bytes(module)
+            module._int8_quantized = True
+            # 模块结构已改变, 已编译的前向作废
+            self._compiled_forwards.pop(name, None)
+            print(f"✓ {name} 已量化为INT8: 权重 {before / 1024**2:.0f}MB → {after / 1024**2:.0f}MB "
+                  f"({time.time() - start_time:.1f}s)")
+    
+    def _model_cache_id(self, name, resolve=True):
+        """
+        区分模型权重和数值精度的标识 (结果缓存/编译缓存的键)
+        
+        Args:
+            name: 模型槽位名称
+            resolve: 使用实际加载的模型 (降级后可能不同于请求的模型, 尚未加载过时先加载一次);
+                     False 时使用请求的模型 (编译缓存在启用时确定键, 不应触发按需加载)
+        """
+        if name in self._quantize_models:
+            precision = 'int8'
+        else:
+            precision = str(self.amp_dtypes.get(name, torch.float32)).replace('torch.', '')
+        if not resolve:
+            return (self._requested_models[name], precision)
+        if name not in self._resolved_models:
+            self.residency.ensure(name)
+        model = self._resolved_models.get(name)
+        if name == 'depth' and model is None:
+            # 深度模型不可用时深度图由特征模型估计
+            return ('features', self._model_cache_id('features'))
+        return (model, precision)
+    
+    def _compile_cache_parts(self, backend, mode):
+        """决定编译产物能否复用的条件 (输入形状由各编译图在缓存内部区分)"""
+        return {
+            'models': tuple((name, self._model_cache_id(name, resolve=False)) for name in sorted(self._requested_models)),
+            'device': str(self.device),
+            'backend': backend,
+            'mode': mode,
+            'detection_config': tuple(sorted((k, repr(v)) for k, v in self.detection_config.items())),
+        }
+    
+    def warmup(self, sizes=((640, 480),), names=None):
+        """
+        用空白图像预热已加载的模型 (触发编译/内核选择, 未加载的模型跳过)
+        
+        Args:
+            sizes: 预热图像尺寸 (width, height) 列表
+            names: 只预热这些模型 (None 表示全部)
+        """
+        stages = [
+            ('detection', lambda image: self._run_detection_candidates([image])),
+            ('features', lambda image: self._run_features_batch([image])),
+            ('depth', lambda image: self._depth_anything_batch([image]) if self.use_depth_anything_v2 else None),
+        ]
+        for size in sizes:
+            image = Image.new("RGB", tuple(size), (128, 128, 128))
+            for name, run in stages:
+                if names is not None and name not in names:
+                    continue
+                if not self.residency.is_resident(name):
+                    continue
+                start_time = time.time()
+                with self.residency.use(name) as available:
+                    if available:
+                        run(image)
+                print(f"  ✓ 预热 {name} ({size[0]}x{size[1]}): {time.time() - start_time:.1f}s")
+    
+    def _after_model_load(self, name, loaded):
+        """模型加载后: 已启用INT8量化时立即量化, 已启用编译推理时启动后台预热编译, 返回 loaded"""
+        if loaded and name in self._quantize_models:
+            self._quantize_module(name, getattr(self, self._MODEL_SLOTS[name][0]))
+        if (loaded and self._compile_options is not None and self._compile_warmup_sizes
+                and name not in self._compile_failed and name not in self._background_compiling):
+            self._background_compiling.add(name)
+            threading.Thread(
+                target=self._background_compile, args=(name,), name=f"compile-{name}", daemon=True
+            ).start()
+        return loaded
+    
+    def _background_compile(self, name):
+        """后台预热编译 (等待加载完成后开始; 期间其他线程的请求以eager执行)"""
+        self._warmup_thread_state.active = True
+        start_time = time.time()
+        try:
+            # use() 等待加载线程完成 (加载函数返回后模型才标记为已加载)
+            with self.residency.use(name) as available:
+                if available:
+                    self.warmup(self._compile_warmup_sizes, names=(name,))
+            print(f"✓ {name} 后台编译完成: {time.time() - start_time:.1f}s")
+        except Exception as e:
+            print(f"⚠️ {name} 后台编译失败: {e}")
+        finally:
+            self._background_compiling.discard(name)
+    
+    # ONNX Runtime 输出 (第一个张量) → 调用方期望的输出结构
+    _ONNX_OUTPUT_WRAPPERS = {
+        'detection': lambda output: (output,),
+        'features': lambda output: BaseModelOutput(last_hidden_state=output),
+        'depth': lambda output: DepthEstimatorOutput(predicted_depth=output),
+    }
+    
+    def _forward_module(self, name, module):
+        """
+        返回模块的前向函数
+        
+        依次应用: 执行后端 (ONNX Runtime / 编译 / eager) → 混合精度 (输出转回fp32, 量化模型不使用)
+        (INT8量化在启用时或模型加载后完成, 见 enable_int8_quantization)
+        
+        Args:
+            name: 模型槽位名称 ('detection', 'features', 'depth')
+            module: 要执行的 nn.Module 或其绑定方法 (以 pixel_values 关键字参数调用)
+        """
+        forward = self._backend_forward(name, module)
+        dtype = self.amp_dtypes.get(name)
+        if dtype is None or name in self._quantize_models:
+            return forward
+        return partial(self._call_autocast, forward, dtype)
+    
+    def _backend_forward(self, name, module):
+        """返回执行后端的前向函数 (启用ONNX Runtime时返回ORT版本, 启用编译推理时返回编译版本)"""
+        if self._onnx is not None and name not in self._onnx_failed:
+            return partial(self._call_onnx, name, module)
+        if self._compile_options is None or name in self._compile_failed:
+            return module
+        if name in self._background_compiling and not getattr(self._warmup_thread_state, 'active', False):
+            return module
+        
+        entry = self._compiled_forwards.get(name)
+        if entry is None or entry[0] != module:  # 绑定方法每次访问都是新对象, 按相等比较
+            try:
+                entry = (module, compile_module(module, **self._compile_options))
+            except Exception as e:
+                print(f"⚠️ {name} 编译失败,使用eager执行: {e}")
+                self._compile_failed.add(name)
+                return module
+            self._compiled_forwards[name] = entry
+        return partial(self._call_compiled, name, module, entry[1])
+    
+    def _call_autocast(self, forward, dtype, *args, **kwargs):
+        """在autocast下执行前向, 浮点输出转回fp32 (NMS、插值和距离映射保持fp32)"""
+        device_type = 'cuda' if str(self.device).startswith('cuda') else 'cpu'
+        with torch.autocast(device_type=device_type, dtype=dtype):
+            outputs = forward(*args, **kwargs)
+        return self._outputs_to_float32(outputs)
+    
+    @staticmethod
+    def _outputs_to_float32(outputs):
+        """把模型输出 (张量 / tuple / ModelOutput) 中的低精度浮点张量转为fp32"""
+        if isinstance(outputs, torch.Tensor):
+            return outputs.float() if outputs.is_floating_point() else outputs
+        if isinstance(outputs, dict):
+            return type(outputs)(**{
+                key: LightLocalization3D._outputs_to_float32(value) for key, value in outputs.items()
+            })
+        if isinstance(outputs, tuple):
+            return tuple(LightLocalization3D._outputs_to_float32(value) for value in outputs)
+        return outputs
+    
+    def _call_onnx(self, name, module, pixel_values=None, **kwargs):
+        """用ONNX Runtime执行前向, 失败时该模型永久回退到PyTorch"""
+        if kwargs:
+            return module(pixel_values=pixel_values, **kwargs)
+        # 导出的图随权重和数值精度变化 (INT8量化/混合精度前后不能复用同一个ONNX文件)
+        model_id = self._model_cache_id(name)
+        try:
+            output = self._onnx.run(name, model_id, module, pixel_values)
+        except Exception as e:
+            # 只记录异常消息的首行 (导出错误的消息可能附带完整的权重张量)
+            message = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+            print(f"⚠️ {name} ONNX Runtime失败,回退到PyTorch: {message}")
+            self._onnx_failed.add(name)
+            self._onnx.clear(name)
+            return module(pixel_values=pixel_values)
+        return self._ONNX_OUTPUT_WRAPPERS[name](output)
+    
+    def _call_compiled(self, name, module, compiled, *args, **kwargs):
+        """执行编译后的前向, 失败时该模型永久回退到eager; 新输入形状编译后写入磁盘缓存"""
+        try:
+            outputs = compiled(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ {name} 编译执行失败,回退到eager: {e}")
+            self._compile_failed.add(name)
+            self._compiled_forwards.pop(name, None)
+            return module(*args, **kwargs)
+        
+        if self._compile_cache is not None:
+            tensors = list(args) + list(kwargs.values())
+            signature = (name,) + tuple(tuple(t.shape) for t in tensors if isinstance(t, torch.Tensor))
+            if signature not in self._compiled_signatures:
+                self._compiled_signatures.add(signature)
+                self._compile_cache.save(self._compile_cache_key)
+        return outputs
+    
+    def start_metrics_server(self, port=9464, host="127.0.0.1"):
+        """
+        在本地提供性能指标 (Prometheus 文本格式 /metrics, JSON /metrics.json)
+        
+        Args:
+            port: 端口 (0 表示自动分配)
+            host: 监听地址 (默认只监听本机)
+        
+        Returns:
+            server: MetricsServer, 端口被占用时返回 None
+        """
+        if self._metrics_server is not None:
+            return self._metrics_server
+        try:
+            self._metrics_server = MetricsServer(self.metrics, port=port, host=host).start()
+        except OSError as e:
+            print(f"⚠️ 指标服务启动失败 ({host}:{port}): {e}")
+            return None
+        print(f"✓ 性能指标: {self._metrics_server.url}")
+        return self._metrics_server
+    
+    def model_memory_report(self):
+        """
+        报告各模型的驻留状态和常驻内存
+        
+        Returns:
+            report: {'detection'|'features'|'depth': {'resident', 'memory_mb', 'idle_seconds', 'load_time'}}
+        """
+        return self.residency.memory_report()
+    
+    def _load_detection_model(self, model_name, log=print):
         """加载OWLv2检测模型 (支持降级)"""
-        print(f"\n1. 加载OWLv2检测模型...")
+        log(f"\n1. 加载OWLv2检测模型...")
         
         # 模型选择顺序: Large → Base
         model_configs = [
@@ -130,7 +953,7 @@ class LightLocalization3D:
         
         for model_path, model_desc in model_configs:
             try:
-                print(f"   尝试加载: {model_desc}")
+                log(f"   尝试加载: {model_desc}")
                 self.detection_processor = AutoProcessor.from_pretrained(model_path)
                 self.detection_model = AutoModelForZeroShotObjectDetection.from_pretrained(
                     model_path
@@ -139,23 +962,27 @@ class LightLocalization3D:
                 self.detection_model.eval()
                 
                 self.detection_model_name = model_desc
-                print(f"   ✓ {model_desc} 加载成功!")
+                self._resolved_models['detection'] = model_path
+                log(f"   ✓ {model_desc} 加载成功!")
                 self.use_detection = True
                 break
                 
             except Exception as e:
-                print(f"   ✗ {model_desc} 加载失败: {e}")
+                log(f"   ✗ {model_desc} 加载失败: {e}")
                 if not self.enable_fallback:
                     raise
                 continue
         else:
-            print("   ✗ 所有检测模型加载失败!")
+            log("   ✗ 所有检测模型加载失败!")
             self.use_detection = False
             self.detection_model_name = "None"
+            self._resolved_models['detection'] = None
+        
+        return self.use_detection
     
-    def _load_feature_model(self, model_name):
+    def _load_feature_model(self, model_name, log=print):
         """加载DINOv3特征提取模型 (支持降级)"""
-        print(f"\n2. 加载DINOv3特征模型...")
+        log(f"\n2. 加载DINOv3特征模型...")
         
         # 模型选择顺序: Large → Base → Small → DINOv2
         model_configs = [
@@ -170,30 +997,34 @@ class LightLocalization3D:
         
         for model_path, model_desc in model_configs:
             try:
-                print(f"   尝试加载: {model_desc}")
+                log(f"   尝试加载: {model_desc}")
                 self.feature_processor = AutoImageProcessor.from_pretrained(model_path)
                 self.feature_model = AutoModel.from_pretrained(model_path)
                 self.feature_model.to(self.device)
                 self.feature_model.eval()
                 
                 self.feature_model_name = model_desc
-                print(f"   ✓ {model_desc} 加载成功!")
+                self._resolved_models['features'] = model_path
+                log(f"   ✓ {model_desc} 加载成功!")
                 self.use_features = True
                 break
                 
             except Exception as e:
-                print(f"   ✗ {model_desc} 加载失败: {e}")
+                log(f"   ✗ {model_desc} 加载失败: {e}")
                 if not self.enable_fallback:
                     raise
                 continue
         else:
-            print("   ✗ 所有特征模型加载失败!")
+            log("   ✗ 所有特征模型加载失败!")
             self.use_features = False
             self.feature_model_name = "None"
+            self._resolved_models['features'] = None
+        
+        return self.use_features
     
-    def _load_depth_model(self, model_name):
+    def _load_depth_model(self, model_name, log=print):
         """加载Depth Anything V2深度估计模型 (支持降级)"""
-        print(f"\n3. 加载Depth Anything V2深度模型...")
+        log(f"\n3. 加载Depth Anything V2深度模型...")
         
         # 模型选择顺序: Large → Base → Small → DINOv3特征方法
         model_configs = [
@@ -207,34 +1038,111 @@ class LightLocalization3D:
         
         for model_path, model_desc in model_configs:
             try:
-                print(f"   尝试加载: {model_desc}")
+                log(f"   尝试加载: {model_desc}")
                 self.depth_processor = DPTImageProcessor.from_pretrained(model_path)
                 self.depth_model = AutoModelForDepthEstimation.from_pretrained(model_path)
                 self.depth_model.to(self.device)
                 self.depth_model.eval()
                 
                 self.depth_model_name = model_desc
-                print(f"   ✓ {model_desc} 加载成功!")
+                self._resolved_models['depth'] = model_path
+                log(f"   ✓ {model_desc} 加载成功!")
                 self.use_depth_anything_v2 = True
                 break
                 
             except Exception as e:
-                print(f"   ✗ {model_desc} 加载失败: {e}")
+                log(f"   ✗ {model_desc} 加载失败: {e}")
                 if not self.enable_fallback:
                     raise
                 continue
         else:
-            print("   ⚠️ Depth Anything V2加载失败,将使用DINOv3特征方法")
+            log("   ⚠️ Depth Anything V2加载失败,将使用DINOv3特征方法")
             self.use_depth_anything_v2 = False
             self.depth_model_name = "DINOv3 Feature-based"
+            self._resolved_models['depth'] = None
+        
+        return self.use_depth_anything_v2
+    
+    def _get_text_query_embeds(self, text_queries):
+        """
+        获取文本查询嵌入 (按 提示词元组 + 模型 缓存)
+        
+        OWLv2的文本塔输出只取决于提示词, 同一组提示词只需编码一次,
+        之后每帧只运行图像塔和检测头。
+        
+        Args:
+            text_queries: 提示词列表
+        
+        Returns:
+            (query_embeds, query_mask): [num_queries, dim] 归一化嵌入, [num_queries] 有效掩码
+        """
+        cache_key = (tuple(text_queries), self.detection_model_name, str(self.device))
+        cached = self._text_query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        text_inputs = self.detection_processor(text=list(text_queries), return_tensors="pt")
+        input_ids = text_inputs["input_ids"].to(self.device)
+        attention_mask = text_inputs["attention_mask"].to(self.device)
+        
+        owl_model = self.detection_model.owlv2
+        with torch.no_grad():
+            text_outputs = owl_model.text_model(input_ids=input_ids, attention_mask=attention_mask)
+            query_embeds = owl_model.text_projection(text_outputs[1])
+            query_embeds = query_embeds / torch.linalg.norm(query_embeds, ord=2, dim=-1, keepdim=True)
+        
+        # 与模型forward一致: 首个token为0表示填充查询
+        query_mask = input_ids[:, 0] > 0
+        
+        self._text_query_cache[cache_key] = (query_embeds, query_mask)
+        return query_embeds, query_mask
+    
+    def clear_text_query_cache(self):
+        """清空文本查询嵌入缓存 (更换检测模型或提示词后调用)"""
+        self._text_query_cache.clear()
+    
+    def _detect_with_query_embeds(self, pixel_values, query_embeds, query_mask):
+        """
+        使用预计算的文本查询嵌入运行OWLv2 (仅图像塔 + 分类/回归头)
+        
+        Args:
+            pixel_values: [B, 3, H, W] 预处理后的图像
+            query_embeds: [num_queries, dim] 文本查询嵌入
+            query_mask: [num_queries] 查询有效掩码
+        
+        Returns:
+            outputs: Owlv2ObjectDetectionOutput (含 logits, pred_boxes)
+        """
+        model = self.detection_model
+        feature_map = self._forward_module('detection', model.image_embedder)(pixel_values=pixel_values)[0]
+        
+        batch_size, num_patches_height, num_patches_width, hidden_dim = feature_map.shape
+        image_feats = torch.reshape(
+            feature_map, (batch_size, num_patches_height * num_patches_width, hidden_dim)
+        )
+        
+        # 同一组查询广播到整个batch
+        batch_query_embeds = query_embeds.unsqueeze(0).expand(batch_size, -1, -1)
+        batch_query_mask = query_mask.unsqueeze(0).expand(batch_size, -1)
+        
+        pred_logits, class_embeds = model.class_predictor(image_feats, batch_query_embeds, batch_query_mask)
+        pred_boxes = model.box_predictor(image_feats, feature_map)
+        
+        return Owlv2ObjectDetectionOutput(
+            image_embeds=feature_map,
+            text_embeds=batch_query_embeds,
+            pred_boxes=pred_boxes,
+            logits=pred_logits,
+            class_embeds=class_embeds
+        )
     
     def detect_lights(
         self,
         image,
-        confidence_threshold=0.15,
-        use_nms=True,
-        nms_threshold=0.5,
-        min_area_ratio=0.001
+        confidence_threshold=None,
+        use_nms=None,
+        nms_threshold=None,
+        min_area_ratio=None
     ):
         """
         使用OWLv2检测灯具 (针对室内场景优化)
@@ -245,99 +1153,311 @@ class LightLocalization3D:
             use_nms: 是否使用NMS去除重复检测
             nms_threshold: NMS的IoU阈值
             min_area_ratio: 最小检测框面积比例 (相对于图像)
+            (以上参数为 None 时取 detection_config 中的同名配置)
         
         Returns:
             detections: list of dict with keys: box, confidence, label
         """
-        if not self.use_detection:
-            print("⚠️ 检测模型未加载")
-            return []
+        return self._detect_lights_batch(
+            [image],
+            confidence_threshold=confidence_threshold,
+            use_nms=use_nms,
+            nms_threshold=nms_threshold,
+            min_area_ratio=min_area_ratio
+        )[0]
+    
+    def _detect_lights_batch(
+        self,
+        images,
+        confidence_threshold=None,
+        use_nms=None,
+        nms_threshold=None,
+        min_area_ratio=None
+    ):
+        """
+        批量检测灯具 (一次前向处理整个batch)
         
-        # Convert to PIL Image (centralized)
-        pil_image = self._to_pil(image)
+        OWLv2处理器会把每张图像填充为正方形并缩放到固定尺寸,
+        因此不同尺寸的图像可以直接组成一个batch。
+        
+        Args:
+            images: 图像列表 (numpy BGR 或 PIL Image, 尺寸可不同)
+            其余参数同 detect_lights
+        
+        Returns:
+            batch_detections: 与输入一一对应的检测结果列表
+        """
+        batch_detections = self._try_detect_lights_batch(
+            images, confidence_threshold, use_nms, nms_threshold, min_area_ratio
+        )
+        if batch_detections is None:
+            return [[] for _ in images]
+        return batch_detections
+    
+    def _try_detect_lights_batch(
+        self,
+        images,
+        confidence_threshold=None,
+        use_nms=None,
+        nms_threshold=None,
+        min_area_ratio=None,
+        image_keys=None
+    ):
+        """
+        同 _detect_lights_batch, 但模型不可用或推理失败时返回 None (区分"无检测"和"失败")
+        
+        保留最近 retain_last 张图像的全部候选框 (阈值过滤前):
+        同一张图像只改变置信度阈值/NMS参数时, 只重做后处理, 不再前向。
+        
+        Args:
+            image_keys: 图像内容哈希列表 (可选, 调用方已计算时传入避免重复哈希)
+        """
+        confidence_threshold, use_nms, nms_threshold, min_area_ratio = self._detection_thresholds(
+            confidence_threshold, use_nms, nms_threshold, min_area_ratio
+        )
+        if self._recent is not None and image_keys is None:
+            image_keys = [ResultCache.image_key(image) for image in images]
+        
+        slot = ('candidates',) + self._detection_cache_params()
+        candidates = [None] * len(images)
+        if self._recent is not None:
+            candidates = [self._recent.get(image_key, slot) for image_key in image_keys]
+        
+        missing = [i for i, c in enumerate(candidates) if c is None]
+        if missing:
+            # 按需加载, 推理期间模型不会被空闲卸载
+            with self.residency.use('detection') as available:
+                if not available:
+                    print("⚠️ 检测模型未加载")
+                    return None
+                computed = self._run_detection_candidates([images[i] for i in missing])
+            if computed is None:
+                return None
+            for i, c in zip(missing, computed):
+                candidates[i] = c
+                if self._recent is not None:
+                    self._recent.put(image_keys[i], slot, c)
         
         try:
-            # 准备输入
-            text_queries = self.light_prompts
-            inputs = self.detection_processor(
-                images=pil_image,
-                text=text_queries,
-                return_tensors="pt"
+            return [
+                self._select_detections(c, confidence_threshold, use_nms, nms_threshold, min_area_ratio)
+                for c in candidates
+            ]
+        except Exception as e:
+            print(f"⚠️ 检测后处理失败: {e}")
+            return None
+    
+    # detection_config 中决定检测块划分的键 (其余键为后处理参数的默认值, 见 _detection_thresholds)
+    _TILING_CONFIG_KEYS = ('multi_scale', 'scales', 'use_sliding_window', 'window_size', 'stride')
+    
+    def _detection_thresholds(self, confidence_threshold=None, use_nms=None, nms_threshold=None, min_area_ratio=None):
+        """未指定 (None) 的检测后处理参数取 detection_config 中的同名配置"""
+        config = self.detection_config
+        return (
+            config['confidence_threshold'] if confidence_threshold is None else confidence_threshold,
+            config['use_nms'] if use_nms is None else use_nms,
+            config['nms_threshold'] if nms_threshold is None else nms_threshold,
+            config['min_area_ratio'] if min_area_ratio is None else min_area_ratio,
+        )
+    
+    def _detection_cache_params(self):
+        """影响候选框的参数 (提示词, 检测模型, 分块配置), 不含阈值/NMS等后处理参数"""
+        return (
+            tuple(self.light_prompts),
+            self._model_cache_id('detection'),
+            tuple((key, repr(self.detection_config.get(key))) for key in self._TILING_CONFIG_KEYS)
+        )
+    
+    def _select_detections(self, candidates, confidence_threshold, use_nms, nms_threshold, min_area_ratio):
+        """由候选框得到检测结果: 置信度过滤 + 面积过滤 + NMS + 排序 (不需要模型前向)"""
+        with self.metrics.span('detection.select'):
+            keep = candidates['scores'] > confidence_threshold
+            return self._postprocess_detections(
+                {key: candidates[key][keep] for key in ('boxes', 'scores', 'labels')},
+                candidates['image_size'], candidates['text_queries'],
+                use_nms, nms_threshold, min_area_ratio
             )
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # 推理
-            with torch.no_grad():
-                outputs = self.detection_model(**inputs)
-            
-            # 后处理
-            target_sizes = torch.tensor([pil_image.size[::-1]]).to(self.device)
-            results = self.detection_processor.post_process_object_detection(
-                outputs=outputs,
-                target_sizes=target_sizes,
-                threshold=confidence_threshold
-            )[0]
-            
-            # 提取检测结果
-            detections = []
-            boxes_list = []
-            scores_list = []
-            labels_list = []
-            image_area = pil_image.size[0] * pil_image.size[1]
+    
+    def _run_detection_candidates(self, images):
+        """
+        在已加载的OWLv2上执行批量检测, 返回阈值过滤前的全部候选框
+        (调用方负责模型驻留, 失败时返回 None)
+        
+        按 detection_config 的分块配置 (_TILING_CONFIG_KEYS 及 tile_batch_size) 把每张图像
+        拆成检测块 (多尺度/滑动窗口, 默认只有全图), 所有图像的所有检测块拼成batch前向,
+        框映射回原图坐标。置信度阈值/NMS等配置在 _select_detections 中应用, 这里不读取。
+        
+        Returns:
+            candidates: 每张图像一个字典 {'boxes', 'scores', 'labels', 'image_size', 'text_queries'}
+        """
+        # Convert to PIL Image (centralized)
+        pil_images = [self._to_pil(image) for image in images]
+        
+        try:
+            config = self.detection_config
+            tiles_per_image = [
+                plan_tiles(
+                    pil_image.size,
+                    multi_scale=config.get('multi_scale', False),
+                    scales=config.get('scales', (1.0,)),
+                    use_sliding_window=config.get('use_sliding_window', False),
+                    window_size=config.get('window_size', (640, 480)),
+                    stride=config.get('stride', 320)
+                )
+                for pil_image in pil_images
+            ]
+            tiled = any(len(tiles) > 1 for tiles in tiles_per_image)
             
-            for box, score, label_id in zip(
-                results["boxes"],
-                results["scores"],
-                results["labels"]
-            ):
-                box_np = box.cpu().numpy()
-                
-                # 检查面积
-                width = box_np[2] - box_np[0]
-                height = box_np[3] - box_np[1]
-                area = width * height
-                
-                if area < image_area * min_area_ratio:
-                    continue
-                
-                boxes_list.append(box)
-                scores_list.append(score)
-                labels_list.append(text_queries[label_id] if label_id < len(text_queries) else 'light')
+            # 展开为 (图像序号, 检测块) 列表
+            tile_refs = [
+                (i, tile)
+                for i, tiles in enumerate(tiles_per_image)
+                for tile in tiles
+            ]
+            chunk_size = config.get('tile_batch_size') if tiled else None
+            chunk_size = chunk_size or len(tile_refs)
             
-            # 使用 torchvision.ops.nms 进行 NMS 去重
-            if use_nms and len(boxes_list) > 0:
-                boxes_tensor = torch.stack(boxes_list)
-                scores_tensor = torch.stack(scores_list)
-                
-                # 应用 NMS
-                keep_indices = nms(boxes_tensor, scores_tensor, nms_threshold)
+            text_queries = self.light_prompts
+            merged = [{'boxes': [], 'scores': [], 'labels': []} for _ in pil_images]
+            for start in range(0, len(tile_refs), chunk_size):
+                chunk = tile_refs[start:start + chunk_size]
+                tile_results = self._detect_tiles(
+                    [render_tile(pil_images[i], tile) for i, tile in chunk],
+                    [tile['canvas'] for _, tile in chunk],
+                    text_queries,
+                    float('-inf')  # 保留全部候选框, 阈值在后处理时再应用
+                )
                 
-                # 根据保留的索引构建检测结果
-                for idx in keep_indices:
-                    detections.append({
-                        'box': boxes_list[idx].cpu().numpy(),
-                        'confidence': float(scores_list[idx]),
-                        'label': labels_list[idx]
-                    })
-            else:
-                # 不使用 NMS 时直接添加所有检测结果
-                for box, score, label in zip(boxes_list, scores_list, labels_list):
-                    detections.append({
-                        'box': box.cpu().numpy(),
-                        'confidence': float(score),
-                        'label': label
-                    })
+                # 检测块坐标 → 原图坐标
+                for (i, tile), results in zip(chunk, tile_results):
+                    boxes = results["boxes"]
+                    keep = slice(None)
+                    if len(tiles_per_image[i]) > 1:
+                        x, y = tile['crop'][:2]
+                        boxes = boxes + boxes.new_tensor([x, y, x, y])
+                        width, height = pil_images[i].size
+                        boxes = torch.stack([
+                            boxes[:, 0].clamp(0, width), boxes[:, 1].clamp(0, height),
+                            boxes[:, 2].clamp(0, width), boxes[:, 3].clamp(0, height)
+                        ], dim=1)
+                        # 丢弃被检测块边界截断的框和完全落在原图外 (填充区) 的框
+                        keep = ~inner_edge_mask(boxes, tile, pil_images[i].size)
+                        keep &= (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+                    merged[i]['boxes'].append(boxes[keep])
+                    merged[i]['scores'].append(results["scores"][keep])
+                    merged[i]['labels'].append(results["labels"][keep])
             
-            # 按置信度排序
-            detections = sorted(detections, key=lambda x: x['confidence'], reverse=True)
-            
-            return detections
+            # 全局后处理 (面积过滤 + NMS跨检测块去重 + 排序) 由 _select_detections 完成
+            return [
+                {
+                    **{key: torch.cat(values) for key, values in results.items()},
+                    'image_size': pil_image.size,
+                    'text_queries': list(text_queries),
+                }
+                for results, pil_image in zip(merged, pil_images)
+            ]
             
         except Exception as e:
             print(f"⚠️ 检测失败: {e}")
             import traceback
             traceback.print_exc()
-            return []
+            return None
+    
+    def _detect_tiles(self, pil_tiles, canvas_sizes, text_queries, confidence_threshold):
+        """
+        对一组检测块做一次前向
+        
+        Args:
+            pil_tiles: 检测块图像列表 (PIL Image, 尺寸可不同)
+            canvas_sizes: 每个检测块的尺寸 (width, height), 框按此尺寸还原
+            text_queries: 提示词列表
+            confidence_threshold: 置信度阈值
+        
+        Returns:
+            tile_results: post_process_object_detection 的结果列表 (检测块坐标)
+        """
+        # 准备输入 (仅图像, 文本查询嵌入走缓存)
+        with self.metrics.span('detection.processor'):
+            inputs = self.detection_processor(
+                images=pil_tiles,
+                return_tensors="pt"
+            )
+        with self.metrics.span('detection.transfer'):
+            pixel_values = inputs["pixel_values"].to(self.device)
+        
+        # 推理: 图像塔 + 分类/回归头
+        with self.metrics.span('detection.forward'), torch.no_grad():
+            query_embeds, query_mask = self._get_text_query_embeds(text_queries)
+            outputs = self._detect_with_query_embeds(pixel_values, query_embeds, query_mask)
+        
+        # 后处理
+        with self.metrics.span('detection.postprocess'):
+            target_sizes = torch.tensor([size[::-1] for size in canvas_sizes]).to(self.device)
+            # 图像处理器的方法 (transformers 5 起 Owlv2Processor 不再转发该方法)
+            return self.detection_processor.image_processor.post_process_object_detection(
+                outputs=outputs,
+                target_sizes=target_sizes,
+                threshold=confidence_threshold
+            )
+    
+    def _postprocess_detections(
+        self,
+        results,
+        image_size,
+        text_queries,
+        use_nms,
+        nms_threshold,
+        min_area_ratio
+    ):
+        """
+        单张图像的检测后处理: 面积过滤 + NMS + 排序 + 标签映射
+        
+        全部在张量上完成, 最后只做一次设备到主机的拷贝。
+        
+        Args:
+            results: post_process_object_detection 的单图结果
+            image_size: 图像尺寸 (width, height)
+            text_queries: 提示词列表
+        
+        Returns:
+            detections: list of dict with keys: box, confidence, label
+        """
+        boxes = results["boxes"]
+        scores = results["scores"]
+        label_ids = results["labels"]
+        image_area = image_size[0] * image_size[1]
+        
+        # 面积过滤 (float32面积, float64比较, 与逐框numpy计算一致)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        valid = torch.nonzero(areas.double() >= image_area * min_area_ratio).squeeze(1)
+        
+        # 使用 torchvision.ops.nms 进行 NMS 去重 (在模型所在设备上)
+        if use_nms and valid.numel() > 0:
+            keep = valid[nms(boxes[valid], scores[valid], nms_threshold)]
+        else:
+            keep = valid
+        
+        # 按置信度排序 (稳定排序, 同分时保持原顺序)
+        keep = keep[torch.argsort(scores[keep], descending=True, stable=True)]
+        
+        # 一次性拷回主机: [x1, y1, x2, y2, score, label_id]
+        packed = torch.cat([
+            boxes[keep],
+            scores[keep].unsqueeze(1),
+            label_ids[keep].unsqueeze(1).to(boxes.dtype)
+        ], dim=1).cpu().numpy()
+        
+        num_queries = len(text_queries)
+        detections = []
+        for row in packed:
+            label_id = int(row[5])
+            detections.append({
+                'box': row[:4].copy(),
+                'confidence': float(row[4]),
+                'label': text_queries[label_id] if label_id < num_queries else 'light'
+            })
+        
+        return detections
     
     def extract_features(self, image):
         """
@@ -349,33 +1469,55 @@ class LightLocalization3D:
         Returns:
             features_dict: dict with keys: cls_features, patch_features
         """
-        if not self.use_features:
-            print("⚠️ 特征模型未加载")
-            return None
+        return self._extract_features_batch([image])[0]
+    
+    def _extract_features_batch(self, images):
+        """
+        批量提取DINOv3特征 (处理器统一缩放裁剪, 可直接组batch)
         
+        Args:
+            images: 图像列表 (PIL Image或numpy数组)
+        
+        Returns:
+            features_list: 与输入一一对应的特征字典列表 (batch维为1)
+        """
+        # 按需加载, 推理期间模型不会被空闲卸载
+        with self.residency.use('features') as available:
+            if not available:
+                print("⚠️ 特征模型未加载")
+                return [None for _ in images]
+            return self._run_features_batch(images)
+    
+    def _run_features_batch(self, images):
+        """在已加载的DINOv3上执行批量特征提取 (调用方负责模型驻留)"""
         # Convert to PIL Image (centralized)
-        pil_image = self._to_pil(image)
+        pil_images = [self._to_pil(image) for image in images]
         
         try:
             # 预处理
-            inputs = self.feature_processor(images=pil_image, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            with self.metrics.span('features.processor'):
+                inputs = self.feature_processor(images=pil_images, return_tensors="pt")
+            with self.metrics.span('features.transfer'):
+                inputs = {k: v.to(self.device) for k, v in inputs.items()}
             
             # 提取特征
-            with torch.no_grad():
-                outputs = self.feature_model(**inputs)
+            with self.metrics.span('features.forward'), torch.no_grad():
+                outputs = self._forward_module('features', self.feature_model)(**inputs)
                 features = outputs.last_hidden_state
-                cls_features = features[:, 0, :]  # CLS token
-                patch_features = features[:, 1:, :]  # Patch tokens
             
-            return {
-                'cls_features': cls_features,
-                'patch_features': patch_features,
-                'full_features': features
-            }
+            with self.metrics.span('features.postprocess'):
+                features_list = []
+                for i in range(features.shape[0]):
+                    image_features = features[i:i + 1]
+                    features_list.append({
+                        'cls_features': image_features[:, 0, :],  # CLS token
+                        'patch_features': image_features[:, 1:, :],  # Patch tokens
+                        'full_features': image_features
+                    })
+            return features_list
         except Exception as e:
             print(f"⚠️ 特征提取失败: {e}")
-            return None
+            return [None for _ in images]
     
     def estimate_depth(self, image, features_dict=None):
         """
@@ -387,41 +1529,111 @@ class LightLocalization3D:
         
         Returns:
             depth_map: numpy array (H, W), 归一化深度值 [0, 1]
+                       (native_depth 模式下为 LazyDepthMap)
+        """
+        return self._estimate_depth_batch([image], [features_dict])[0]
+    
+    def _estimate_depth_batch(self, images, features_list=None):
+        """
+        批量估计深度图
+        
+        Depth Anything V2处理器保持长宽比, 不同比例的图像预处理后尺寸不同,
+        因此先按预处理尺寸分组, 每组只做一次前向。
+        
+        Args:
+            images: 图像列表 (PIL Image或numpy数组)
+            features_list: 与图像对应的DINOv3特征字典列表 (用于降级, 可选)
+        
+        Returns:
+            depth_maps: 与输入一一对应的归一化深度图列表
         """
         # Convert to PIL Image (centralized)
-        pil_image = self._to_pil(image)
+        pil_images = [self._to_pil(image) for image in images]
+        if features_list is None:
+            features_list = [None] * len(pil_images)
         
-        # 优先使用Depth Anything V2
-        if self.use_depth_anything_v2:
-            try:
-                inputs = self.depth_processor(images=pil_image, return_tensors="pt")
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                
-                with torch.no_grad():
-                    outputs = self.depth_model(**inputs)
-                    predicted_depth = outputs.predicted_depth
-                
-                # 插值到原图大小
-                depth_map = torch.nn.functional.interpolate(
-                    predicted_depth.unsqueeze(1),
-                    size=(pil_image.size[1], pil_image.size[0]),
-                    mode="bicubic",
-                    align_corners=False,
-                ).squeeze().cpu().numpy()
-                
-                # 归一化到[0, 1]
-                depth_map = (depth_map - depth_map.min()) / (depth_map.max() - depth_map.min() + 1e-8)
-                
-                return depth_map
-                
-            except Exception as e:
-                print(f"⚠️ Depth Anything V2失败,回退到DINOv3方法: {e}")
+        # 优先使用Depth Anything V2 (按需加载, 推理期间不会被空闲卸载)
+        with self.residency.use('depth') as available:
+            if available and self.use_depth_anything_v2:
+                try:
+                    return self._depth_anything_batch(pil_images)
+                except Exception as e:
+                    print(f"⚠️ Depth Anything V2失败,回退到DINOv3方法: {e}")
         
-        # 降级方案: 使用DINOv3特征估计深度
-        if not self.use_features:
+        # 降级方案: 使用DINOv3特征估计深度 (按需模式下此时才加载DINOv3)
+        if not self.residency.ensure('features'):
             print("⚠️ 特征模型未加载,无法估计深度")
-            return None
+            return [None for _ in pil_images]
+        
+        # 缺少特征的图像一次性批量提取
+        missing = [i for i, f in enumerate(features_list) if f is None]
+        if missing:
+            features_list = list(features_list)
+            extracted = self._extract_features_batch([pil_images[i] for i in missing])
+            for i, features_dict in zip(missing, extracted):
+                features_list[i] = features_dict
+        
+        return [
+            self._depth_from_features(pil_image, features_dict)
+            for pil_image, features_dict in zip(pil_images, features_list)
+        ]
+    
+    def _depth_anything_batch(self, pil_images):
+        """按预处理尺寸分组运行Depth Anything V2, 返回归一化深度图列表"""
+        with self.metrics.span('depth.processor'):
+            pixel_values = [
+                self.depth_processor(images=pil_image, return_tensors="pt")["pixel_values"]
+                for pil_image in pil_images
+            ]
+        
+        groups = {}
+        for i, pv in enumerate(pixel_values):
+            groups.setdefault(tuple(pv.shape[-2:]), []).append(i)
+        
+        depth_maps = [None] * len(pil_images)
+        for indices in groups.values():
+            with self.metrics.span('depth.transfer'):
+                batch = torch.cat([pixel_values[i] for i in indices]).to(self.device)
+            
+            with self.metrics.span('depth.forward'), torch.no_grad():
+                outputs = self._forward_module('depth', self.depth_model)(pixel_values=batch)
+                predicted_depth = outputs.predicted_depth
+            
+            for j, i in enumerate(indices):
+                size = pil_images[i].size
+                prediction = predicted_depth[j:j + 1]
+                
+                if self.native_depth:
+                    # 原生分辨率: 保留预测网格, 全分辨率图按需插值 (插值耗时计入调用方)
+                    with self.metrics.span('depth.postprocess'):
+                        prediction = prediction.cpu()
+                        native = prediction.squeeze(0).numpy()
+                        native = (native - native.min()) / (native.max() - native.min() + 1e-8)
+                    depth_maps[i] = LazyDepthMap(
+                        native, size, partial(LightLocalization3D._upsample_depth_prediction, prediction, size)
+                    )
+                else:
+                    with self.metrics.span('depth.interpolate'):
+                        depth_maps[i] = self._upsample_depth_prediction(prediction, size)
+        
+        return depth_maps
+    
+    @staticmethod
+    def _upsample_depth_prediction(prediction, size):
+        """将深度预测 (1, h, w) 插值到原图大小 (width, height) 并归一化到[0, 1]"""
+        # 插值到原图大小
+        depth_map = torch.nn.functional.interpolate(
+            prediction.unsqueeze(1),
+            size=(size[1], size[0]),
+            mode="bicubic",
+            align_corners=False,
+        ).squeeze().cpu().numpy()
         
+        # 归一化到[0, 1]
+        return (depth_map - depth_map.min()) / (depth_map.max() - depth_map.min() + 1e-8)
+    
+    def _depth_from_features(self, pil_image, features_dict):
+        """降级方案: 由DINOv3 patch特征范数估计深度图"""
         try:
             # 如果没有提供特征,则提取特征
             if features_dict is None:
@@ -445,22 +1657,31 @@ class LightLocalization3D:
             depth_map = 1.0 - depth_map  # 反转
             depth_map = (depth_map - depth_map.min()) / (depth_map.max() - depth_map.min() + 1e-8)
             
-            # 上采样到原图大小
-            depth_map_resized = cv2.resize(
-                depth_map,
-                (pil_image.size[0], pil_image.size[1]),
-                interpolation=cv2.INTER_CUBIC
-            )
-            
-            # 高斯平滑
-            depth_map_smooth = cv2.GaussianBlur(depth_map_resized, (15, 15), 0)
-            
-            return depth_map_smooth
+            if self.native_depth:
+                size = pil_image.size
+                return LazyDepthMap(
+                    depth_map, size, partial(LightLocalization3D._upsample_feature_depth, depth_map, size)
+                )
+            with self.metrics.span('depth.interpolate'):
+                return self._upsample_feature_depth(depth_map, pil_image.size)
             
         except Exception as e:
             print(f"⚠️ 深度估计失败: {e}")
             return None
     
+    @staticmethod
+    def _upsample_feature_depth(depth_map, size):
+        """将patch网格深度图上采样到原图大小 (width, height) 并高斯平滑"""
+        # 上采样到原图大小
+        depth_map_resized = cv2.resize(
+            depth_map,
+            (size[0], size[1]),
+            interpolation=cv2.INTER_CUBIC
+        )
+        
+        # 高斯平滑
+        return cv2.GaussianBlur(depth_map_resized, (15, 15), 0)
+    
     def depth_to_distance(
         self,
         depth_map,
@@ -471,8 +1692,11 @@ class LightLocalization3D:
         """
         将归一化深度值转换为实际距离 (针对室内灯具优化)
         
+        所有检测框一次性向量化计算: 标签→距离范围查表, ROI统计, 非线性映射。
+        ROI中位数和均值与逐框计算一致 (见 _roi_statistics)。
+        
         Args:
-            depth_map: 归一化深度图 [0, 1]
+            depth_map: 归一化深度图 [0, 1] (numpy数组或 LazyDepthMap)
             detections: 检测结果列表
             camera_params: 相机参数字典 (可选)
             image_size: 图像尺寸 (width, height)
@@ -486,165 +1710,311 @@ class LightLocalization3D:
         if camera_params is None:
             camera_params = {}
         
-        results = []
+        boxes = np.stack([det['box'] for det in detections]).astype(int)
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
         
-        for det in detections:
-            x1, y1, x2, y2 = det['box'].astype(int)
-            
-            # 计算检测框中心点的相对位置
-            center_y = (y1 + y2) / 2
-            if image_size:
-                rel_y = center_y / image_size[1]
-            else:
-                rel_y = center_y / depth_map.shape[0]
-            
-            # 根据灯具类型和位置智能调整距离范围
-            label = det['label'].lower()
-            
-            # 吸顶灯/吊灯 (通常在上方)
-            if any(kw in label for kw in ['ceiling', 'chandelier', 'pendant', 'hanging', 'recessed', 'downlight']):
-                if rel_y < 0.4:
-                    min_distance = 2.0
-                    max_distance = 4.5
-                else:
-                    min_distance = 1.5
-                    max_distance = 4.0
-            
-            # 壁灯 (中等高度)
-            elif any(kw in label for kw in ['wall', 'sconce']):
-                min_distance = 1.0
-                max_distance = 3.5
-            
-            # 台灯/落地灯 (较低位置)
-            elif any(kw in label for kw in ['table', 'desk', 'floor', 'standing']):
-                if rel_y > 0.6:
-                    min_distance = 0.5
-                    max_distance = 2.5
-                else:
-                    min_distance = 1.0
-                    max_distance = 3.0
-            
-            # 射灯/筒灯
-            elif any(kw in label for kw in ['spotlight', 'track', 'can', 'pot']):
-                min_distance = 1.5
-                max_distance = 4.0
-            
-            # 其他通用灯具
-            else:
-                min_distance = 0.8
-                max_distance = 4.5
-            
-            # 允许用户覆盖
-            min_distance = camera_params.get('min_distance', min_distance)
-            max_distance = camera_params.get('max_distance', max_distance)
-            
-            # 获取ROI深度值
-            x1_clip = max(0, x1)
-            y1_clip = max(0, y1)
-            x2_clip = min(depth_map.shape[1], x2)
-            y2_clip = min(depth_map.shape[0], y2)
-            
-            if x2_clip > x1_clip and y2_clip > y1_clip:
-                roi_depth = depth_map[y1_clip:y2_clip, x1_clip:x2_clip]
-                
-                # 多指标深度
-                median_depth = np.median(roi_depth)
-                mean_depth = np.mean(roi_depth)
-                combined_depth = 0.7 * median_depth + 0.3 * mean_depth
-                
-                # 非线性映射
-                if combined_depth < 0.3:
-                    distance = min_distance + combined_depth * (max_distance - min_distance) / 0.3
-                else:
-                    normalized_depth = (combined_depth - 0.3) / 0.7
-                    distance = min_distance + (max_distance - min_distance) * 0.3 + \
-                              (max_distance - min_distance) * 0.7 * (np.log1p(normalized_depth * 2) / np.log1p(2))
-                
-                # 根据检测框大小微调
-                box_area = (x2 - x1) * (y2 - y1)
-                image_area = depth_map.shape[0] * depth_map.shape[1]
-                area_ratio = box_area / image_area
-                
-                if area_ratio > 0.15:
-                    distance *= 0.85
-                elif area_ratio < 0.02:
-                    distance *= 1.15
-                
-                distance = np.clip(distance, min_distance, max_distance)
-                
-                det_copy = det.copy()
-                det_copy['distance'] = distance
-                det_copy['depth_value'] = combined_depth
-                det_copy['distance_range'] = (min_distance, max_distance)
-                det_copy['position_hint'] = 'upper' if rel_y < 0.4 else 'middle' if rel_y < 0.6 else 'lower'
-                results.append(det_copy)
+        # 计算检测框中心点的相对位置
+        center_y = (y1 + y2) / 2
+        if image_size:
+            rel_y = center_y / image_size[1]
+        else:
+            rel_y = center_y / depth_map.shape[0]
+        
+        # 根据灯具类型和位置智能调整距离范围 (查表)
+        categories = np.array([_label_distance_category(det['label']) for det in detections])
+        upper = rel_y < 0.4
+        lower = rel_y > 0.6
+        use_first = np.where(_RANGE_CONDITIONS[categories] == 1, upper,
+                             np.where(_RANGE_CONDITIONS[categories] == 2, lower, True))
+        ranges = np.where(use_first[:, None], _RANGE_TABLE[categories, 0], _RANGE_TABLE[categories, 1])
+        min_distance = ranges[:, 0]
+        max_distance = ranges[:, 1]
+        
+        # 允许用户覆盖
+        if 'min_distance' in camera_params:
+            min_distance = np.full(len(detections), camera_params['min_distance'], dtype=np.float64)
+        if 'max_distance' in camera_params:
+            max_distance = np.full(len(detections), camera_params['max_distance'], dtype=np.float64)
+        
+        # 获取ROI深度值
+        height, width = depth_map.shape[:2]
+        x1_clip = np.maximum(0, x1)
+        y1_clip = np.maximum(0, y1)
+        x2_clip = np.minimum(width, x2)
+        y2_clip = np.minimum(height, y2)
+        valid = (x2_clip > x1_clip) & (y2_clip > y1_clip)
+        
+        # 原生分辨率深度图: 把ROI映射到深度模型的输出网格上统计, 不生成全分辨率图
+        if isinstance(depth_map, LazyDepthMap):
+            stat_map = depth_map.native
+            roi_x1, roi_y1, roi_x2, roi_y2 = depth_map.map_boxes(x1_clip, y1_clip, x2_clip, y2_clip)
+        else:
+            stat_map = depth_map
+            roi_x1, roi_y1, roi_x2, roi_y2 = x1_clip, y1_clip, x2_clip, y2_clip
+        
+        # 多指标深度 (所有框批量计算, 见 _roi_statistics)
+        median_depth = np.zeros(len(detections))
+        mean_depth = np.zeros(len(detections))
+        if valid.any():
+            median_depth[valid], mean_depth[valid] = _roi_statistics(
+                stat_map, roi_x1[valid], roi_y1[valid], roi_x2[valid], roi_y2[valid]
+            )
+        combined_depth = 0.7 * median_depth + 0.3 * mean_depth
+
+        # 非线性映射
+        span = max_distance - min_distance
+        normalized_depth = (combined_depth - 0.3) / 0.7
+        distance = np.where(
+            combined_depth < 0.3,
+            min_distance + combined_depth * span / 0.3,
+            min_distance + span * 0.3 + span * 0.7 * (np.log1p(normalized_depth * 2) / np.log1p(2))
+        )
+
+        # 根据检测框大小微调
+        box_area = (x2 - x1) * (y2 - y1)
+        image_area = depth_map.shape[0] * depth_map.shape[1]
+        area_ratio = box_area / image_area
+        distance = distance * np.where(area_ratio > 0.15, 0.85, np.where(area_ratio < 0.02, 1.15, 1.0))
+        distance = np.clip(distance, min_distance, max_distance)
+
+        position_hint = np.where(upper, 'upper', np.where(rel_y < 0.6, 'middle', 'lower'))
+
+        results = []
+        for i, det in enumerate(detections):
+            det_copy = det.copy()
+            if valid[i]:
+                det_copy['distance'] = float(distance[i])
+                det_copy['depth_value'] = float(combined_depth[i])
+                det_copy['distance_range'] = (
+                    camera_params.get('min_distance', float(ranges[i, 0])),
+                    camera_params.get('max_distance', float(ranges[i, 1]))
+                )
+                det_copy['position_hint'] = str(position_hint[i])
             else:
-                det_copy = det.copy()
                 det_copy['distance'] = None
-                results.append(det_copy)
+            results.append(det_copy)
         
         return results
     
     def process_image(
         self,
         image,
-        confidence_threshold=0.15,
+        confidence_threshold=None,
         compute_depth=True,
-        compute_distance=True
+        compute_distance=True,
+        return_features=False
     ):
         """
         完整处理流程: 检测 + 特征提取 + 深度估计 + 距离计算
         
         Args:
             image: 输入图像 (numpy或PIL)
-            confidence_threshold: 检测置信度阈值
+            confidence_threshold: 检测置信度阈值 (None 取 detection_config 中的配置)
             compute_depth: 是否计算深度图
             compute_distance: 是否计算距离
+            return_features: 是否在结果中返回DINOv3特征
+                             (按需模式下, 否则DINOv3只在深度降级时运行)
         
         Returns:
             result_dict: 包含所有结果的字典
         """
-        start_time = time.time()
+        return self.process_batch(
+            [image],
+            confidence_threshold=confidence_threshold,
+            compute_depth=compute_depth,
+            compute_distance=compute_distance,
+            return_features=return_features
+        )[0]
+    
+    def process_batch(
+        self,
+        images,
+        confidence_threshold=None,
+        compute_depth=True,
+        compute_distance=True,
+        return_features=False,
+        batch_size=8
+    ):
+        """
+        批量处理流程: 每个模型对每批图像只做一次前向
+        
+        适合离线批量任务 (如大量天花板照片)。图像尺寸可以不同。
+        
+        Args:
+            images: 图像列表 (numpy或PIL)
+            confidence_threshold: 检测置信度阈值 (None 取 detection_config 中的配置)
+            compute_depth: 是否计算深度图
+            compute_distance: 是否计算距离
+            return_features: 是否在结果中返回DINOv3特征
+            batch_size: 每批图像数量
+        
+        Returns:
+            results: 与输入一一对应的结果字典列表, 格式同 process_image
+                     (timing 为所在批次各阶段耗时按图像数均摊)
+        """
+        images = list(images)
+        confidence_threshold = self._detection_thresholds(confidence_threshold)[0]
+        results = []
+        for start in range(0, len(images), batch_size):
+            results.extend(self._process_chunk(
+                images[start:start + batch_size],
+                confidence_threshold,
+                compute_depth,
+                compute_distance,
+                return_features
+            ))
+        return results
+    
+    def _run_cached_stage(self, tier, image_keys, params, num_images, compute, retain=False):
+        """
+        带结果缓存的批量阶段: 命中的图像直接取缓存, 未命中的图像一次性批量计算并写入缓存
+        
+        Args:
+            tier: 缓存层 ('detections' 或 'depth')
+            image_keys: 图像内容哈希列表 (未启用缓存时为 None)
+            params: 参与缓存键的参数元组
+            num_images: 图像数量
+            compute: 函数 (未命中的图像序号列表) -> 结果列表, 失败时返回 None 或对应项为 None
+            retain: 是否同时查询/写入最近图像保留区 (retain_last)
         
-        # 1. 检测灯具
-        detections = self.detect_lights(image, confidence_threshold)
-        detection_time = time.time() - start_time
+        Returns:
+            values: 与图像一一对应的结果列表 (失败项为 None)
+        """
+        values = [None] * num_images
+        use_cache = image_keys is not None and self.result_cache is not None
+        use_recent = image_keys is not None and retain and self._recent is not None
+        slot = (tier,) + params
+        for i in range(num_images if image_keys is not None else 0):
+            cached = self.result_cache.get(tier, (image_keys[i],) + params) if use_cache else None
+            if cached is None and use_recent:
+                cached = self._recent.get(image_keys[i], slot)
+            if cached is not None:
+                # 检测结果列表浅拷贝, 调用方修改列表不影响缓存
+                values[i] = list(cached) if isinstance(cached, list) else cached
+        
+        missing = [i for i, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+        
+        computed = compute(missing)
+        if computed is None:
+            return values
+        for i, value in zip(missing, computed):
+            values[i] = value
+            if value is None:
+                continue
+            if use_cache:
+                self.result_cache.put(tier, (image_keys[i],) + params, value)
+            if use_recent:
+                self._recent.put(image_keys[i], slot, value)
+        return values
+    
+    def _process_chunk(self, images, confidence_threshold, compute_depth, compute_distance, return_features):
+        """处理一个batch (process_batch 的内部实现)"""
+        marks = [time.perf_counter_ns()]
+        num_images = len(images)
+        image_keys = None
+        if self.result_cache is not None or self._recent is not None:
+            image_keys = [ResultCache.image_key(image) for image in images]
+        
+        # 1. 检测灯具 (缓存命中的图像跳过检测; 最近图像只改阈值时只重做后处理)
+        detection_params = (confidence_threshold,) + self._detection_cache_params()
+        batch_detections = self._run_cached_stage(
+            'detections', image_keys, detection_params, num_images,
+            lambda indices: self._try_detect_lights_batch(
+                [images[i] for i in indices], confidence_threshold,
+                image_keys=[image_keys[i] for i in indices] if image_keys is not None else None
+            )
+        )
+        batch_detections = [detections if detections is not None else [] for detections in batch_detections]
+        marks.append(time.perf_counter_ns())
         
-        # 2. 提取特征
-        features_dict = None
-        if compute_depth or self.use_features:
-            features_dict = self.extract_features(image)
-        feature_time = time.time() - start_time - detection_time
+        # 2. 提取特征 (按需模式: 仅调用方显式请求时运行, 深度降级路径会自行提取)
+        features_list = [None] * num_images
+        if self.lazy_features:
+            need_features = return_features
+        else:
+            need_features = compute_depth or self.residency.ensure('features')
+        if need_features:
+            features_list = self._extract_features_batch(images)
+        marks.append(time.perf_counter_ns())
         
-        # 3. 估计深度
-        depth_map = None
+        # 3. 估计深度 (缓存命中的图像跳过深度估计)
+        depth_maps = [None] * num_images
         if compute_depth:
-            depth_map = self.estimate_depth(image, features_dict)
-        depth_time = time.time() - start_time - detection_time - feature_time
+            depth_params = (self._model_cache_id('depth'), self.native_depth)
+            depth_maps = self._run_cached_stage(
+                'depth', image_keys, depth_params, num_images,
+                lambda indices: self._estimate_depth_batch(
+                    [images[i] for i in indices], [features_list[i] for i in indices]
+                ),
+                retain=True
+            )
+        marks.append(time.perf_counter_ns())
         
         # 4. 计算距离
-        if compute_distance and depth_map is not None:
-            if isinstance(image, np.ndarray):
-                image_size = (image.shape[1], image.shape[0])
-            else:
-                image_size = image.size
-            detections = self.depth_to_distance(depth_map, detections, image_size=image_size)
-        distance_time = time.time() - start_time - detection_time - feature_time - depth_time
+        if compute_distance:
+            for i, (image, depth_map) in enumerate(zip(images, depth_maps)):
+                if depth_map is None:
+                    continue
+                if isinstance(image, np.ndarray):
+                    image_size = (image.shape[1], image.shape[0])
+                else:
+                    image_size = image.size
+                with self.metrics.span('distance.map'):
+                    batch_detections[i] = self.depth_to_distance(
+                        depth_map, batch_detections[i], image_size=image_size
+                    )
+        marks.append(time.perf_counter_ns())
         
-        total_time = time.time() - start_time
+        # 各阶段耗时: 指标按批次记录, 结果中的 timing 按图像数均摊 (秒)
+        durations = dict(zip(
+            ('detection', 'features', 'depth', 'distance'),
+            (end - begin for begin, end in zip(marks, marks[1:]))
+        ))
+        durations['total'] = marks[-1] - marks[0]
+        for name, duration_ns in durations.items():
+            self.metrics.record(name, duration_ns)
+        self.metrics.increment('images', num_images)
+        self.metrics.increment('batches')
+        timing = {name: duration_ns / 1e9 / num_images for name, duration_ns in durations.items()}
         
-        return {
-            'detections': detections,
-            'features': features_dict,
-            'depth_map': depth_map,
-            'timing': {
-                'detection': detection_time,
-                'features': feature_time,
-                'depth': depth_time,
-                'distance': distance_time,
-                'total': total_time
+        return [
+            {
+                'detections': detections,
+                'features': features_dict,
+                'depth_map': depth_map,
+                'timing': dict(timing)
             }
-        }
+            for detections, features_dict, depth_map in zip(batch_detections, features_list, depth_maps)
+        ]
+
+
+# 测试/校准图像目录 (按顺序查找)
+TEST_IMAGE_DIRS = [
+    "data/yolo_dataset/images/val",
+    "data/custom_images",
+    "data/test"
+]
+
+
+def find_test_images(dirs=None, limit=None):
+    """
+    查找测试图像 (jpg/png)
+    
+    Args:
+        dirs: 目录列表 (默认 TEST_IMAGE_DIRS)
+        limit: 最多返回的图像数 (None 表示不限)
+    
+    Returns:
+        paths: 图像路径列表 (按目录顺序, 目录内按文件名排序)
+    """
+    paths = []
+    for test_dir in dirs or TEST_IMAGE_DIRS:
+        test_dir_path = Path(test_dir)
+        if test_dir_path.exists():
+            paths.extend(sorted(list(test_dir_path.glob("*.jpg")) + list(test_dir_path.glob("*.png"))))
+    return paths[:limit] if limit is not None else paths
 
 
 def main():
@@ -657,20 +2027,8 @@ def main():
     pipeline = LightLocalization3D()
     
     # 查找测试图像
-    test_dirs = [
-        "data/yolo_dataset/images/val",
-        "data/custom_images",
-        "data/test"
-    ]
-    
-    test_image_path = None
-    for test_dir in test_dirs:
-        test_dir_path = Path(test_dir)
-        if test_dir_path.exists():
-            images = list(test_dir_path.glob("*.jpg")) + list(test_dir_path.glob("*.png"))
-            if images:
-                test_image_path = images[0]
-                break
+    test_images = find_test_images(limit=1)
+    test_image_path = test_images[0] if test_images else None
     
     if test_image_path is None or not test_image_path.exists():
         print("⚠️ 未找到测试图像")
@@ -711,6 +2069,7 @@ def main():
     print(f"  总计: {timing['total']:.3f}s")
     print(f"  FPS: {1/timing['total']:.2f}")
     print(f"{'='*60}")
+    pipeline.metrics.report()
 
 
 if __name__ == "__main__":
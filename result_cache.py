@@ -0,0 +1,279 @@
+"""
+内容寻址结果缓存
+按 图像内容哈希 + 参数 缓存检测结果和深度图, 两个缓存层分别按字节数做LRU淘汰,
+可选持久化到磁盘 (批量任务中断后重跑时, 已完成的图像直接读取结果)
+
+用法:
+    cache = ResultCache(max_detection_mb=64, max_depth_mb=512, persist_dir="results/cache")
+    pipeline = LightLocalization3D(result_cache=cache)
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import torch
+
+TIERS = ('detections', 'depth')
+
+
+def estimate_nbytes(value):
+    """
+    估算缓存值占用的字节数 (numpy/torch 数组按数据大小, 容器递归累加)
+
+    按需生成数据的对象 (如 LazyDepthMap) 提供 max_nbytes 时按其上限计量,
+    写入缓存后才生成的数据也不会让缓存超出字节预算。
+    """
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value) + sys.getsizeof(value)
+    if hasattr(value, 'max_nbytes'):
+        return int(value.max_nbytes)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class _LRUTier:
+    """按字节数淘汰的LRU缓存层"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.bytes -= evicted_bytes
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache:
+    """
+    检测结果 / 深度图 两层内容寻址缓存
+
+    - detections 层: 键为 (图像哈希, 置信度阈值, 提示词, 检测模型, 分块配置), 值为检测结果 (不含距离)
+    - depth 层: 键为 (图像哈希, 深度模型, 深度模式), 值为深度图
+    距离由缓存的检测结果和深度图重新计算 (毫秒级), 不单独缓存。
+    """
+
+    def __init__(self, max_detection_mb=64, max_depth_mb=512, persist_dir=None):
+        """
+        Args:
+            max_detection_mb: 检测结果层的内存上限 (MB)
+            max_depth_mb: 深度图层的内存上限 (MB)
+            persist_dir: 持久化目录 (None 表示只缓存在内存中; 磁盘缓存不做淘汰)
+        """
+        self._tiers = {
+            'detections': _LRUTier(max_detection_mb * 1024 ** 2),
+            'depth': _LRUTier(max_depth_mb * 1024 ** 2),
+        }
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+        if self.persist_dir is not None:
+            for tier in TIERS:
+                (self.persist_dir / tier).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def image_key(image):
+        """
+        图像内容哈希 (像素数据 + 形状 + 类型)
+
+        Args:
+            image: numpy数组或PIL Image
+        """
+        if isinstance(image, np.ndarray):
+            data = np.ascontiguousarray(image)
+            header = f"{data.shape}|{data.dtype}"
+        else:
+            data = image.tobytes()
+            header = f"{image.size}|{image.mode}"
+        digest = hashlib.blake2b(header.encode(), digest_size=20)
+        digest.update(memoryview(data).cast('B') if isinstance(data, np.ndarray) else data)
+        return digest.hexdigest()
+
+    def get(self, tier, key):
+        """读取缓存 (内存未命中时查磁盘), 未命中返回 None"""
+        with self._lock:
+            value = self._tiers[tier].get(key)
+        if value is not None or self.persist_dir is None:
+            return value
+
+        path = self._disk_path(tier, key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ 读取磁盘缓存失败 ({path.name}): {e}")
+            return None
+        with self._lock:
+            self._tiers[tier].put(key, value)
+            self.disk_hits += 1
+        return value
+
+    def put(self, tier, key, value):
+        """写入缓存 (启用持久化时同时写入磁盘)"""
+        with self._lock:
+            self._tiers[tier].put(key, value)
+        if self.persist_dir is None:
+            return
+
+        path = self._disk_path(tier, key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 写入磁盘缓存失败 ({path.name}): {e}")
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def clear(self, disk=False):
+        """清空内存缓存 (disk=True 时同时删除磁盘缓存)"""
+        with self._lock:
+            for tier in self._tiers.values():
+                tier.clear()
+        if disk and self.persist_dir is not None:
+            for tier in TIERS:
+                for path in (self.persist_dir / tier).glob("*.pkl"):
+                    path.unlink()
+
+    def stats(self):
+        """
+        各层命中率和内存占用
+
+        Returns:
+            stats: {'detections'|'depth': {'entries', 'memory_mb', 'hits', 'misses', 'evictions'}, 'disk_hits'}
+        """
+        with self._lock:
+            report = {
+                name: {
+                    'entries': len(tier),
+                    'memory_mb': tier.bytes / 1024 ** 2,
+                    'hits': tier.hits,
+                    'misses': tier.misses,
+                    'evictions': tier.evictions,
+                }
+                for name, tier in self._tiers.items()
+            }
+        report['disk_hits'] = self.disk_hits
+        return report
+
+    def _disk_path(self, tier, key):
+        name = hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+        return self.persist_dir / tier / f"{name}.pkl"
+
+
+class RecentResults:
+    """
+    最近K张图像的中间结果 (原始候选框、深度图等), 按图像数和字节数做LRU淘汰
+
+    与 ResultCache 不同, 这里保留的是与后处理参数无关的中间结果:
+    同一张图像调整置信度阈值/NMS参数时只需重做后处理, 无需前向。
+    每张图像对应一组槽位 (slot), 槽位键包含产生该结果的模型/配置。
+    字节数按 estimate_nbytes 计量 (LazyDepthMap 按全分辨率图生成后的大小)。
+    """
+
+    def __init__(self, max_images=4, max_mb=256):
+        """
+        Args:
+            max_images: 最多保留的图像数
+            max_mb: 保留结果的内存上限 (MB), 超出时淘汰最久未使用的图像
+        """
+        self.max_images = max(1, int(max_images))
+        self.max_bytes = max_mb * 1024 ** 2
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()  # image_key → {slot: (value, nbytes)}
+        self._lock = threading.Lock()
+
+    def get(self, image_key, slot):
+        """读取某张图像某个槽位的结果, 未命中返回 None"""
+        with self._lock:
+            slots = self._images.get(image_key)
+            entry = slots.get(slot) if slots is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(image_key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, image_key, slot, value):
+        """写入结果, 超出 max_images 或 max_mb 时淘汰最久未使用的图像 (及其全部槽位)"""
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            slots = self._images.setdefault(image_key, {})
+            old = slots.pop(slot, None)
+            if old is not None:
+                self.bytes -= old[1]
+            slots[slot] = (value, nbytes)
+            self.bytes += nbytes
+            self._images.move_to_end(image_key)
+            while len(self._images) > self.max_images or self.bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.bytes -= sum(entry[1] for entry in evicted.values())
+
+    def clear(self):
+        """清空全部保留结果"""
+        with self._lock:
+            self._images.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """保留的图像数、内存占用和命中统计"""
+        with self._lock:
+            return {
+                'images': len(self._images),
+                'memory_mb': self.bytes / 1024 ** 2,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,270 @@
+"""
+会话感知的推理调度器 (Gradio 多会话共用一个流水线)
+
+- 拥有 LightLocalization3D 实例: 首次使用时在锁内创建, 多个会话同时首次访问也只加载一次
+- 基于 batching.BatchingInferenceWorker: 所有推理由一个工作线程执行, 模型前向不会交错;
+  参数相同的请求合并为一次 process_batch
+- 公平性: 每个会话按轮转取请求, 一个会话连续提交不会挤占其他会话
+- 过载保护: 每个会话和全局的排队上限, 超出时拒绝 (SchedulerOverloaded);
+  coalesce=True 的请求 (如摄像头帧) 替换同会话仍在排队的旧请求, 新旧调用方都得到新帧的结果
+
+用法:
+    scheduler = SessionScheduler(initialize_pipeline, max_batch_size=4)
+    result = scheduler.process_image(image, session_id=request.session_hash, confidence_threshold=0.15)
+
+    # 接口与 LightLocalization3D.process_image 一致的会话视图 (可传给 TrackedLocalizer 等)
+    tracker = TrackedLocalizer(scheduler.session(session_id, coalesce=True))
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from batching import BatchingInferenceWorker, _Request
+
+
+class SchedulerOverloaded(RuntimeError):
+    """调度器过载 (会话或全局排队已满), 请求被拒绝"""
+
+
+class SessionScheduler(BatchingInferenceWorker):
+    """
+    会话感知的推理调度器
+
+    合批、截止时间和取消处理沿用 BatchingInferenceWorker, 这里只替换排队策略:
+    请求项为 (会话, 图像, 推理参数), 合批键为推理参数; 每个会话一个队列, 按轮转取请求。
+    """
+
+    def __init__(
+        self,
+        pipeline_factory,
+        max_batch_size=4,
+        max_wait_ms=20.0,
+        max_pending_per_session=2,
+        max_pending_total=16,
+        session_ttl=600.0
+    ):
+        """
+        Args:
+            pipeline_factory: 创建 LightLocalization3D 的函数 (首次推理时调用一次)
+            max_batch_size: 每批最多合并的请求数
+            max_wait_ms: 最早的请求最长等待多久 (毫秒) 以凑满批次
+            max_pending_per_session: 每个会话最多排队的请求数
+            max_pending_total: 全局最多排队的请求数
+            session_ttl: 会话空闲多少秒后丢弃其状态 (session_state)
+        """
+        self._pipeline_factory = pipeline_factory
+        self._pipeline = None
+        self._pipeline_lock = threading.Lock()
+
+        self.max_pending_per_session = max(1, int(max_pending_per_session))
+        self.max_pending_total = max(1, int(max_pending_total))
+        self.session_ttl = session_ttl
+
+        # 会话 → 排队请求; 字典顺序即轮转顺序 (工作线程启动前创建)
+        self._queues = OrderedDict()
+        self._sessions = {}
+        self.rejected = 0
+        self.coalesced = 0
+
+        super().__init__(
+            self._run_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+            name="session-scheduler"
+        )
+
+    @property
+    def pipeline(self):
+        """流水线实例 (首次访问时创建, 线程安全)"""
+        if self._pipeline is None:
+            with self._pipeline_lock:
+                if self._pipeline is None:
+                    self._pipeline = self._pipeline_factory()
+        return self._pipeline
+
+    def submit(
+        self,
+        image,
+        session_id=None,
+        confidence_threshold=None,
+        compute_depth=True,
+        compute_distance=True,
+        return_features=False,
+        coalesce=False
+    ):
+        """
+        提交一张图像
+
+        Args:
+            image: 图像 (numpy或PIL)
+            session_id: 会话标识 (如 gr.Request.session_hash)
+            coalesce: 同会话有参数相同的排队请求时, 用本图像替换它 (不占用新的排队位置)
+            其余参数同 LightLocalization3D.process_image
+
+        Returns:
+            future: concurrent.futures.Future, 结果字典或推理异常
+
+        Raises:
+            SchedulerOverloaded: 会话或全局排队已满
+        """
+        params = (confidence_threshold, compute_depth, compute_distance, return_features)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            self._touch(session_id)
+            queue = self._queues.setdefault(session_id, deque())
+
+            if coalesce and queue and queue[-1].key == params:
+                request = queue[-1]
+                request.item = (session_id, image, params)
+                future = Future()
+                request.futures.append(future)
+                self.coalesced += 1
+                return future
+
+            total_pending = self._pending_count()
+            if len(queue) >= self.max_pending_per_session or total_pending >= self.max_pending_total:
+                self.rejected += 1
+                if not queue:
+                    del self._queues[session_id]
+                raise SchedulerOverloaded(
+                    f"推理队列已满 (会话 {len(queue)}/{self.max_pending_per_session}, "
+                    f"全局 {total_pending}/{self.max_pending_total})"
+                )
+
+            request = _Request((session_id, image, params), params)
+            self._enqueue(request)
+            self.requests += 1
+            self._cond.notify_all()
+            return request.futures[0]
+
+    def process_image(self, image, session_id=None, timeout=None, **kwargs):
+        """同步调用: 提交并等待结果 (参数见 submit)"""
+        return self.submit(image, session_id=session_id, **kwargs).result(timeout)
+
+    def session(self, session_id, coalesce=False):
+        """
+        会话视图: process_image 与 LightLocalization3D.process_image 接口一致
+
+        Args:
+            session_id: 会话标识
+            coalesce: 该视图提交的请求是否合并替换排队中的旧请求
+        """
+        return _SessionView(self, session_id, coalesce)
+
+    def session_state(self, session_id):
+        """
+        会话私有状态字典 (如每个会话自己的跟踪器), 会话空闲超过 session_ttl 后丢弃
+        """
+        with self._cond:
+            return self._touch(session_id)['state']
+
+    def stats(self):
+        """排队、合并、拒绝和批次统计"""
+        with self._cond:
+            return {
+                'sessions': len(self._sessions),
+                'pending': self._pending_count(),
+                'submitted': self.requests,
+                'completed': self.completed,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'mean_batch_size': self.completed / self.batches if self.batches else 0.0,
+            }
+
+    def _touch(self, session_id):
+        """更新会话活跃时间, 顺带清理空闲过期的会话 (调用方持有锁)"""
+        now = time.monotonic()
+        if self.session_ttl is not None:
+            expired = [
+                sid for sid, info in self._sessions.items()
+                if now - info['last_seen'] > self.session_ttl and not self._queues.get(sid)
+            ]
+            for sid in expired:
+                del self._sessions[sid]
+                self._queues.pop(sid, None)
+
+        info = self._sessions.setdefault(session_id, {'state': {}, 'last_seen': now})
+        info['last_seen'] = now
+        return info
+
+    # ------------------------------------------------------------------
+    # 排队策略 (覆盖 BatchingInferenceWorker, 调用方持有锁)
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, request):
+        session_id = request.item[0]
+        self._queues.setdefault(session_id, deque()).append(request)
+
+    def _peek(self):
+        """轮转顺序中第一个有请求的会话的队首"""
+        return next((queue[0] for queue in self._queues.values() if queue), None)
+
+    def _pending_count(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _matching(self, key):
+        return sum(1 for queue in self._queues.values() for request in queue if request.key == key)
+
+    def _take(self, key, limit):
+        """每轮每个会话最多取一个 (队首, 参数相同), 直到取满 limit 个或无可取请求"""
+        batch, served = [], []
+        progress = True
+        while len(batch) < limit and progress:
+            progress = False
+            for session_id, queue in self._queues.items():
+                if len(batch) >= limit:
+                    break
+                if queue and queue[0].key == key:
+                    batch.append(queue.popleft())
+                    if session_id not in served:
+                        served.append(session_id)
+                    progress = True
+
+        # 本批被服务的会话移到轮转末尾; 清理空队列
+        for session_id in served:
+            self._queues.move_to_end(session_id)
+        for session_id in [sid for sid, q in self._queues.items() if not q]:
+            del self._queues[session_id]
+        return batch
+
+    def _run_batch(self, items):
+        """工作线程: 同参数的一批图像执行一次 process_batch"""
+        confidence_threshold, compute_depth, compute_distance, return_features = items[0][2]
+        return self.pipeline.process_batch(
+            [image for _, image, _ in items],
+            confidence_threshold=confidence_threshold,
+            compute_depth=compute_depth,
+            compute_distance=compute_distance,
+            return_features=return_features,
+            batch_size=len(items)
+        )
+
+
+class _SessionView:
+    """SessionScheduler 的单会话视图"""
+
+    def __init__(self, scheduler, session_id, coalesce):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.coalesce = coalesce
+
+    def process_image(
+        self,
+        image,
+        confidence_threshold=None,
+        compute_depth=True,
+        compute_distance=True,
+        return_features=False
+    ):
+        return self.scheduler.process_image(
+            image,
+            session_id=self.session_id,
+            confidence_threshold=confidence_threshold,
+            compute_depth=compute_depth,
+            compute_distance=compute_distance,
+            return_features=return_features,
+            coalesce=self.coalesce
+        )
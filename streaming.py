@@ -0,0 +1,418 @@
+"""
+流式视频流水线
+采集、推理、渲染三个阶段分别运行在独立线程上, 互不阻塞:
+
+- 采集: 从摄像头/视频读取帧 (或由调用方 submit 推送帧, 如 Gradio 网页摄像头)
+- 推理: 有界队列只保留最新帧, 推理跟不上时丢弃过期帧, 以硬件能承受的速率运行
+- 渲染: 每个新采集的帧都叠加最近一次推理结果后发布, 画面流畅不等待推理
+
+用法:
+    stream = StreamingPipeline(pipeline, source=0, render_fn=draw)
+    with stream:
+        for packet in stream.results():
+            show(packet['output'])
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class DropStaleQueue:
+    """
+    有界队列: 满时丢弃最旧的元素 (消费者总是拿到最新数据)
+
+    close() 之后, 队列中剩余元素取完后 get() 返回 None。
+    """
+
+    def __init__(self, maxsize=1):
+        self._items = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """放入元素, 队列已满时丢弃最旧的元素, 返回是否发生丢弃"""
+        with self._cond:
+            dropped = len(self._items) >= self._maxsize
+            if dropped:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """取出最旧的元素; 超时或队列已关闭且为空时返回 None"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed, timeout=timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StreamingPipeline:
+    """
+    基于 LightLocalization3D 的流式处理流水线
+
+    每个发布的数据包 (dict):
+        frame_id: 采集帧序号
+        frame: 采集到的原始帧
+        result: 最近一次推理结果 (process_image 的返回值, 尚无结果时为 None)
+        result_frame_id: 该推理结果对应的帧序号
+        output: render_fn(frame, result_packet) 的返回值 (未提供 render_fn 时为 None)
+        latency: 该推理结果从采集到推理完成的耗时 (秒)
+        stats: 运行统计 (见 stats())
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        source=None,
+        confidence_threshold=None,
+        compute_depth=False,
+        compute_distance=True,
+        render_fn=None,
+        output_queue_size=2,
+        realtime=True
+    ):
+        """
+        Args:
+            pipeline: LightLocalization3D 实例
+            source: 摄像头编号 / 视频路径 / URL; None 表示由调用方 submit() 推送帧
+            confidence_threshold: 检测置信度阈值 (None 取流水线 detection_config 中的配置)
+            compute_depth: 是否计算深度图
+            compute_distance: 是否计算距离
+            render_fn: 渲染函数 (frame, result_packet) -> output, result_packet 可能为 None
+            output_queue_size: 发布队列长度 (消费者跟不上时丢弃旧的渲染结果)
+            realtime: 视频文件按原始帧率读取 (否则尽快读取, 由推理队列丢帧)
+        """
+        self.pipeline = pipeline
+        self.source = source
+        self.render_fn = render_fn
+        self.realtime = realtime
+        self.params = {
+            'confidence_threshold': confidence_threshold,
+            'compute_depth': compute_depth,
+            'compute_distance': compute_distance,
+        }
+
+        # 推理只处理最新帧; 发布队列供 results() 消费
+        self._infer_queue = DropStaleQueue(maxsize=1)
+        self._output_queue = DropStaleQueue(maxsize=output_queue_size)
+
+        # 渲染状态: 最新采集帧 + 最新推理结果, 任一更新都会触发渲染
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_seq = 0
+        self._result = None
+        self._result_seq = 0
+        self._latest = None
+
+        self._stop_event = threading.Event()
+        self._capture_done = threading.Event()
+        self._inference_done = threading.Event()
+        self._threads = []
+        self._capture = None
+
+        self._frames_captured = 0
+        self._frames_inferred = 0
+        self._frames_rendered = 0
+        self._start_time = None
+        self._last_error = None
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动采集/推理/渲染线程"""
+        if self._threads:
+            return self
+        if self.source is not None:
+            self._capture = cv2.VideoCapture(self.source)
+            if not self._capture.isOpened():
+                raise RuntimeError(f"无法打开视频源: {self.source}")
+
+        self._start_time = time.time()
+        targets = [('inference', self._inference_loop), ('render', self._render_loop)]
+        if self._capture is not None:
+            targets.insert(0, ('capture', self._capture_loop))
+        for name, target in targets:
+            thread = threading.Thread(target=target, name=f"stream-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✓ 流式流水线已启动 (视频源: {self.source if self.source is not None else '外部推送'})")
+        return self
+
+    def stop(self):
+        """停止所有线程并释放视频源"""
+        self._stop_event.set()
+        self._capture_done.set()
+        self._infer_queue.close()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._output_queue.close()
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop_event.is_set()
+
+    # ------------------------------------------------------------------
+    # 输入 / 输出
+    # ------------------------------------------------------------------
+
+    def submit(self, frame):
+        """推送一帧 (外部采集模式, 如 Gradio 网页摄像头回调), 立即返回帧序号"""
+        return self._publish_frame(frame)
+
+    def set_params(self, **params):
+        """更新推理参数 (confidence_threshold / compute_depth / compute_distance), 下一帧生效"""
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"未知参数: {', '.join(sorted(unknown))}")
+        self.params = {**self.params, **params}
+
+    def latest(self):
+        """最近一次发布的数据包 (不阻塞, 尚无输出时返回 None)"""
+        return self._latest
+
+    def results(self, timeout=0.5):
+        """
+        结果生成器: 按发布顺序产出数据包, 视频源结束或 stop() 后退出
+
+        Args:
+            timeout: 每次等待新数据包的超时 (秒), 用于检查是否已停止
+        """
+        while True:
+            packet = self._output_queue.get(timeout=timeout)
+            if packet is not None:
+                yield packet
+            elif self._output_queue.closed or not self._threads_alive():
+                return
+
+    def stats(self):
+        """
+        运行统计
+
+        Returns:
+            stats: 采集/推理/渲染帧数, 各阶段帧率, 丢弃的过期帧数
+        """
+        elapsed = time.time() - self._start_time if self._start_time else 0.0
+        rate = (lambda n: n / elapsed) if elapsed > 0 else (lambda n: 0.0)
+        return {
+            'frames_captured': self._frames_captured,
+            'frames_inferred': self._frames_inferred,
+            'frames_rendered': self._frames_rendered,
+            'frames_dropped': self._infer_queue.dropped,
+            'capture_fps': rate(self._frames_captured),
+            'inference_fps': rate(self._frames_inferred),
+            'render_fps': rate(self._frames_rendered),
+            'last_error': self._last_error,
+        }
+
+    # ------------------------------------------------------------------
+    # 各阶段线程
+    # ------------------------------------------------------------------
+
+    def _publish_frame(self, frame):
+        capture_time = time.time()
+        with self._cond:
+            self._frame_seq += 1
+            frame_id = self._frame_seq
+            self._frame = {'frame_id': frame_id, 'frame': frame, 'capture_time': capture_time}
+            self._frames_captured += 1
+            self._cond.notify_all()
+        self._infer_queue.put(self._frame)
+        return frame_id
+
+    def _capture_loop(self):
+        """采集线程: 读取视频源, 视频文件按原始帧率读取"""
+        frame_interval = 0.0
+        if self.realtime and isinstance(self.source, str) and not self.source.isdigit():
+            fps = self._capture.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+        next_time = time.time()
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = self._capture.read()
+                if not ret:
+                    print("⚠️ 视频源结束或读取失败")
+                    break
+                self._publish_frame(frame)
+
+                if frame_interval:
+                    next_time += frame_interval
+                    delay = next_time - time.time()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+        finally:
+            self._capture_done.set()
+            self._infer_queue.close()
+
+    def _inference_loop(self):
+        """推理线程: 总是处理最新帧, 过期帧已被队列丢弃"""
+        try:
+            while not self._stop_event.is_set():
+                packet = self._infer_queue.get(timeout=0.5)
+                if packet is None:
+                    if self._infer_queue.closed:
+                        break
+                    continue
+
+                params = self.params
+                try:
+                    result = self.pipeline.process_image(
+                        packet['frame'],
+                        confidence_threshold=params['confidence_threshold'],
+                        compute_depth=params['compute_depth'],
+                        compute_distance=params['compute_distance']
+                    )
+                except Exception as e:
+                    self._last_error = str(e)
+                    print(f"⚠️ 流式推理失败: {e}")
+                    continue
+
+                with self._cond:
+                    self._result_seq += 1
+                    self._result = {
+                        'frame_id': packet['frame_id'],
+                        'frame': packet['frame'],
+                        'result': result,
+                        'latency': time.time() - packet['capture_time'],
+                    }
+                    self._frames_inferred += 1
+                    self._cond.notify_all()
+        finally:
+            self._inference_done.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def _render_loop(self):
+        """渲染线程: 新帧或新结果到达时, 用最新帧叠加最新结果并发布"""
+        rendered = (0, 0)
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (self._frame_seq, self._result_seq) != rendered
+                    or self._stop_event.is_set()
+                    or (self._capture_done.is_set() and self._inference_done.is_set())
+                )
+                if self._stop_event.is_set() or (self._frame_seq, self._result_seq) == rendered:
+                    break
+                frame_packet, result_packet = self._frame, self._result
+                rendered = (self._frame_seq, self._result_seq)
+
+            if frame_packet is None:
+                continue
+
+            output = None
+            if self.render_fn is not None:
+                try:
+                    output = self.render_fn(frame_packet['frame'], result_packet)
+                except Exception as e:
+                    self._last_error = str(e)
+                    print(f"⚠️ 渲染失败: {e}")
+                    continue
+
+            self._frames_rendered += 1
+            packet = {
+                'frame_id': frame_packet['frame_id'],
+                'frame': frame_packet['frame'],
+                'result': result_packet['result'] if result_packet else None,
+                'result_frame_id': result_packet['frame_id'] if result_packet else None,
+                'output': output,
+                'latency': result_packet['latency'] if result_packet else None,
+                'stats': self.stats(),
+            }
+            self._latest = packet
+            self._output_queue.put(packet)
+
+        self._output_queue.close()
+
+    def _threads_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+
+def main():
+    """命令行: 实时摄像头/视频流式检测"""
+    import argparse
+    from pipeline import LightLocalization3D
+
+    parser = argparse.ArgumentParser(description="流式灯具检测")
+    parser.add_argument("--source", default="0", help="摄像头编号或视频路径")
+    parser.add_argument("--confidence", type=float, default=0.15)
+    parser.add_argument("--depth", action="store_true", help="计算深度图")
+    parser.add_argument("--show", action="store_true", help="显示窗口 (按 q 退出)")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+
+    def render(frame, result_packet):
+        output = frame.copy()
+        if result_packet is not None:
+            for det in result_packet['result']['detections']:
+                x1, y1, x2, y2 = map(int, det['box'])
+                cv2.rectangle(output, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                text = f"{det['label']} {det['confidence']:.2f}"
+                if det.get('distance'):
+                    text += f" {det['distance']:.2f}m"
+                cv2.putText(output, text, (x1, max(y1 - 5, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        return output
+
+    pipeline = LightLocalization3D(native_depth=True)
+    stream = StreamingPipeline(
+        pipeline,
+        source=source,
+        confidence_threshold=args.confidence,
+        compute_depth=args.depth,
+        render_fn=render
+    )
+
+    last_report = 0.0
+    with stream:
+        for packet in stream.results():
+            if args.show:
+                cv2.imshow("Light Detection", packet['output'])
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+            if time.time() - last_report > 2.0:
+                last_report = time.time()
+                stats = packet['stats']
+                print(f"采集 {stats['capture_fps']:.1f} FPS | 推理 {stats['inference_fps']:.1f} FPS | "
+                      f"渲染 {stats['render_fps']:.1f} FPS | 丢弃 {stats['frames_dropped']} 帧")
+
+    if args.show:
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
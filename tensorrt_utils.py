@@ -3,9 +3,15 @@ TensorRT优化工具
 为模型添加TensorRT加速支持
 """
 
+import hashlib
+import os
+import threading
+from pathlib import Path
+
 import torch
 import torch.nn as nn
 
+
 def enable_tensorrt_optimization(model, input_shape=(1, 3, 224, 224)):
     """
     为PyTorch模型启用TensorRT优化
@@ -74,6 +80,144 @@ def enable_tensorrt_optimization(model, input_shape=(1, 3, 224, 224)):
         return model
 
 
+def resolve_compile_backend(backend="auto", device="cpu"):
+    """
+    选择 torch.compile 后端
+    
+    参数:
+        backend: 'auto' (CUDA且安装了torch_tensorrt时用TensorRT, 否则inductor),
+                 'tensorrt', 'inductor' 或其他 torch.compile 后端名称
+        device: 模型所在设备
+    
+    返回:
+        torch.compile 可用的后端名称
+    """
+    if backend not in ("auto", "tensorrt"):
+        return backend
+    
+    if str(device).startswith("cuda") and torch.cuda.is_available():
+        try:
+            import torch_tensorrt  # noqa: F401  导入时注册 torch_tensorrt 后端
+            return "torch_tensorrt"
+        except ImportError:
+            if backend == "tensorrt":
+                print("⚠️ torch_tensorrt未安装,改用inductor后端")
+                print("   安装命令: pip install torch-tensorrt")
+    elif backend == "tensorrt":
+        print("⚠️ TensorRT需要CUDA,改用inductor后端 (CPU)")
+    
+    return "inductor"
+
+
+class CompiledArtifactCache:
+    """
+    torch.compile 编译产物的磁盘缓存 (进程重启后复用, 跳过重新编译/自动调优)
+    
+    - inductor: torch.compiler.save/load_cache_artifacts 打包的内核和自动调优结果,
+      按 模型 + 输入尺寸 + 精度 + 后端 + torch版本 存为一个文件;
+      inductor 自身的FX图缓存目录也放在这里 (默认在 /tmp, 容器重启后丢失)
+    - TensorRT: torch_tensorrt 的引擎缓存目录
+    
+    目录结构: <cache_dir>/v<VERSION>/{artifacts/*.bin, inductor/, tensorrt/}
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, cache_dir="models/compile_cache"):
+        """
+        参数:
+            cache_dir: 缓存根目录
+        """
+        self.root = Path(cache_dir) / f"v{self.VERSION}"
+        self.artifact_dir = self.root / "artifacts"
+        self.tensorrt_dir = self.root / "tensorrt"
+        self.artifact_dir.mkdir(parents=True, exist_ok=True)
+        self.tensorrt_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        
+        # 需在inductor首次编译前设置; 用户已指定时不覆盖
+        if "TORCHINDUCTOR_CACHE_DIR" not in os.environ:
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = str((self.root / "inductor").resolve())
+    
+    @staticmethod
+    def make_key(**parts):
+        """
+        由编译条件生成缓存键 (自动加入torch版本)
+        
+        参数:
+            parts: 影响编译产物的条件, 如 models, sizes, dtype, device, backend, mode
+        """
+        parts = {**parts, "torch": torch.__version__}
+        text = repr(sorted((k, repr(v)) for k, v in parts.items()))
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    
+    def load(self, key):
+        """加载缓存的编译产物 (在首次编译前调用), 返回是否命中"""
+        path = self.artifact_dir / f"{key}.bin"
+        if not path.exists():
+            return False
+        try:
+            torch.compiler.load_cache_artifacts(path.read_bytes())
+        except Exception as e:
+            print(f"⚠️ 编译缓存加载失败 ({path.name}): {e}")
+            return False
+        print(f"♻️ 已加载编译缓存: {path}")
+        return True
+    
+    def save(self, key):
+        """保存当前进程的全部编译产物 (覆盖同键文件), 返回是否写入"""
+        with self._lock:
+            try:
+                result = torch.compiler.save_cache_artifacts()
+            except Exception as e:
+                print(f"⚠️ 编译缓存导出失败: {e}")
+                return False
+            if result is None:
+                return False
+            
+            path = self.artifact_dir / f"{key}.bin"
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            try:
+                tmp_path.write_bytes(result[0])
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"⚠️ 编译缓存写入失败 ({path.name}): {e}")
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                return False
+            return True
+    
+    def tensorrt_options(self):
+        """torch_tensorrt 后端的引擎缓存选项 (传给 torch.compile 的 options)"""
+        return {
+            "cache_built_engines": True,
+            "reuse_cached_engines": True,
+            "engine_cache_dir": str(self.tensorrt_dir),
+        }
+
+
+def compile_module(module, backend="inductor", mode=None, dynamic=False, options=None):
+    """
+    用 torch.compile 编译模块 (惰性编译: 首次调用时按输入形状编译)
+    
+    参数:
+        module: nn.Module
+        backend: torch.compile 后端 (见 resolve_compile_backend)
+        mode: 编译模式 (None, 'reduce-overhead', 'max-autotune' 等)
+        dynamic: 是否按动态形状编译 (False 时每种输入形状单独编译, 内核最优)
+        options: 后端选项 (如 CompiledArtifactCache.tensorrt_options(); 与 mode 互斥)
+    
+    返回:
+        编译后的可调用对象 (参数与 module.forward 相同)
+    """
+    kwargs = {"backend": backend, "dynamic": dynamic}
+    if mode is not None:
+        kwargs["mode"] = mode
+    elif options:
+        kwargs["options"] = options
+    return torch.compile(module, **kwargs)
+
+
 def optimize_for_inference(model):
     """
     为推理优化模型
@@ -106,34 +250,3 @@ def optimize_for_inference(model):
     except Exception as e:
         print(f"⚠️ 推理优化失败: {e}")
         return model
-
-
-class OptimizedInference:
-    """
-    优化的推理包装器
-    
-    特性:
-    - 批处理
-    - 混合精度
-    - 异步推理
-    """
-    
-    def __init__(self, model, use_fp16=True):
-        self.model = model
-        self.use_fp16 = use_fp16
-        self.device = next(model.parameters()).device
-        
-        if use_fp16:
-            self.model = self.model.half()
-    
-    @torch.no_grad()
-    def __call__(self, x):
-        """执行优化的推理"""
-        if self.use_fp16:
-            x = x.half()
-        
-        # 使用CUDA流加速
-        with torch.cuda.stream(torch.cuda.Stream()):
-            output = self.model(x)
-        
-        return output
@@ -0,0 +1,58 @@
+"""
+测试公共夹具
+流水线运行在微型随机模型上 (benchmarks/tiny_models.py), 离线 CPU 即可运行;
+模型目录首次生成后放在系统临时目录中复用
+"""
+
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from pipeline import LightLocalization3D
+from tiny_models import build_tiny_models
+
+
+def make_image(width, height, seed=0):
+    """平滑随机图像 (BGR uint8)"""
+    rng = np.random.default_rng(seed)
+    noise = rng.random((height, width, 3), dtype=np.float32)
+    image = cv2.GaussianBlur(noise, (0, 0), sigmaX=max(width, height) / 32)
+    image = (image - image.min()) / (image.max() - image.min() + 1e-8)
+    return (image * 255).astype(np.uint8)
+
+
+@pytest.fixture(scope="session")
+def tiny_models():
+    """微型模型目录 {'detection', 'features', 'depth'}"""
+    return build_tiny_models(Path(tempfile.gettempdir()) / "light3d_tiny_models")
+
+
+@pytest.fixture(scope="session")
+def make_pipeline(tiny_models):
+    """创建微型模型流水线的工厂 (关键字参数透传给 LightLocalization3D)"""
+    def make(**kwargs):
+        options = dict(device="cpu", enable_fallback=False, lazy_features=False, amp=False)
+        options.update(kwargs)
+        return LightLocalization3D(
+            detection_model=tiny_models['detection'],
+            feature_model=tiny_models['features'],
+            depth_model=tiny_models['depth'],
+            **options
+        )
+    return make
+
+
+@pytest.fixture(scope="session")
+def pipeline(make_pipeline):
+    """共享的流水线 (测试中不要修改其配置)"""
+    return make_pipeline()
+
+
+@pytest.fixture(scope="session")
+def images():
+    """不同尺寸和长宽比的测试图像"""
+    sizes = [(160, 120), (96, 96), (200, 100), (77, 133)]
+    return [make_image(width, height, seed=i) for i, (width, height) in enumerate(sizes)]
@@ -0,0 +1,121 @@
+"""
+执行后端 (编译推理 / ONNX Runtime) 与eager的一致性, 以及编译时机
+"""
+
+import threading
+
+import numpy as np
+import pytest
+import torch
+
+import pipeline as pipeline_module
+from onnx_backend import OnnxRuntimeBackend, onnx_runtime_available
+from test_detection import assert_same_detections
+
+requires_onnx = pytest.mark.skipif(not onnx_runtime_available(), reason="需要 onnx 和 onnxruntime")
+
+
+@pytest.fixture
+def count_compiles(monkeypatch):
+    """记录 compile_module 的调用 (每次调用对应一个模型的一次编译)"""
+    calls = []
+    compile_module = pipeline_module.compile_module
+
+    def counting(module, **kwargs):
+        calls.append(module)
+        return compile_module(module, **kwargs)
+
+    monkeypatch.setattr(pipeline_module, 'compile_module', counting)
+    return calls
+
+
+def run_all_stages(localizer, images):
+    return localizer.process_batch(images, confidence_threshold=0.0, batch_size=2, return_features=True)
+
+
+def assert_same_results(expected, actual):
+    for a, b in zip(expected, actual):
+        assert_same_detections(a['detections'], b['detections'])
+        np.testing.assert_allclose(np.asarray(b['depth_map']), np.asarray(a['depth_map']), atol=1e-4)
+
+
+# eager 后端只验证编译流程 (Dynamo捕获图); inductor 生成并运行CPU内核
+@pytest.mark.parametrize("backend", ["eager", "inductor"])
+def test_compiled_matches_eager_and_compiles_each_model_once(make_pipeline, pipeline, images, count_compiles, backend):
+    compiled = make_pipeline()
+    assert compiled.enable_compiled_inference(backend=backend, warmup=False, cache_dir=None) == backend
+
+    expected = run_all_stages(pipeline, images)
+    assert_same_results(expected, run_all_stages(compiled, images))
+    assert not compiled._compile_failed, "编译失败会回退到eager, 测试不到编译路径"
+    compiles = len(count_compiles)
+    assert compiles == 3
+
+    # 再次运行不重新编译 (绑定方法每次访问都是新对象, 查找须按相等比较)
+    assert_same_results(expected, run_all_stages(compiled, images))
+    assert len(count_compiles) == compiles
+
+
+def test_lazily_loaded_models_compile_in_background(make_pipeline, images, count_compiles):
+    lazy = make_pipeline(lazy_loading=True)
+    lazy.enable_compiled_inference(backend="eager", warmup_sizes=[(96, 96)], cache_dir=None)
+    assert not count_compiles, "未加载的模型在启用时不编译"
+
+    lazy.residency.ensure('detection')
+    for thread in threading.enumerate():
+        if thread.name == 'compile-detection':
+            thread.join(timeout=120)
+    assert not lazy._background_compiling
+    assert 'detection' in lazy._compiled_forwards and len(count_compiles) == 1
+
+    # 请求直接使用后台编译好的前向
+    lazy.detect_lights(images[1], confidence_threshold=0.0)
+    assert len(count_compiles) == 1
+
+
+@requires_onnx
+@pytest.mark.parametrize("name", ["detection", "features", "depth"])
+def test_onnx_runtime_matches_pytorch(pipeline, tmp_path, name):
+    module = {
+        'detection': pipeline.detection_model.image_embedder,
+        'features': pipeline.feature_model,
+        'depth': pipeline.depth_model,
+    }[name]
+    image_size = pipeline.detection_processor.image_processor.size['height'] if name == 'detection' else 56
+    pixel_values = torch.randn(1, 3, image_size, image_size, generator=torch.Generator().manual_seed(0))
+
+    backend = OnnxRuntimeBackend(cache_dir=tmp_path)
+    backend.run(name, 'tiny', module, pixel_values)
+    batch = torch.randn(2, 3, image_size, image_size, generator=torch.Generator().manual_seed(1))
+    output = backend.run(name, 'tiny', module, batch)
+    with torch.no_grad():
+        expected = module(pixel_values=batch)[0]
+    torch.testing.assert_close(output, expected, atol=1e-4, rtol=1e-4)
+    # 导出时关闭的参数梯度已恢复
+    owner = getattr(module, '__self__', module)
+    assert all(param.requires_grad for param in owner.parameters())
+
+
+@requires_onnx
+def test_onnx_pipeline_matches_eager_without_fallback(make_pipeline, pipeline, images, tmp_path):
+    onnx = make_pipeline()
+    assert onnx.enable_onnx_runtime(cache_dir=tmp_path, warmup=False)
+
+    assert_same_results(run_all_stages(pipeline, images), run_all_stages(onnx, images))
+    assert not onnx._onnx_failed
+    assert {key[0] for key in onnx._onnx._sessions} == {'detection', 'features', 'depth'}
+
+
+@requires_onnx
+def test_onnx_exports_are_keyed_by_precision(make_pipeline, images, tmp_path):
+    onnx = make_pipeline()
+    assert onnx.enable_onnx_runtime(cache_dir=tmp_path, warmup=False)
+    onnx.detect_lights(images[0], confidence_threshold=0.0)
+    fp32_files = set(tmp_path.rglob('detection-*.onnx'))
+    assert len(fp32_files) == 1
+
+    # 量化后不复用fp32导出的文件: 重新导出INT8图, 或回退到PyTorch执行量化模型
+    assert onnx.enable_int8_quantization(['detection'])
+    onnx.detect_lights(images[0], confidence_threshold=0.0)
+    assert all(key[1][1] == 'int8' for key in onnx._onnx._sessions if key[0] == 'detection')
+    assert 'detection' in onnx._onnx_failed or set(tmp_path.rglob('detection-*.onnx')) > fp32_files
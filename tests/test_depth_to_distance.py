@@ -0,0 +1,136 @@
+"""
+depth_to_distance 与原逐框实现的一致性 (中位数精确, 均值只有浮点舍入差异),
+以及原生分辨率深度图 (LazyDepthMap) 与全分辨率深度图的距离一致性
+"""
+
+from functools import partial
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from bench_depth_to_distance import DEPTH_ATOL, assert_close, cv_smooth, make_detections, reference_depth_to_distance
+from pipeline import LazyDepthMap, LightLocalization3D, _ROI_BATCH_PIXELS, _roi_statistics
+
+LABELS = ["chandelier", "ceiling light", "wall sconce", "table lamp", "floor lamp", "spotlight", "LED panel", "light"]
+
+
+@pytest.fixture(scope="module")
+def localizer():
+    """depth_to_distance 不需要模型"""
+    return object.__new__(LightLocalization3D)
+
+
+@pytest.fixture(scope="module")
+def depth_map():
+    return cv_smooth(np.random.default_rng(0).random((480, 640), dtype=np.float32))
+
+
+def small_detections(num_boxes, height, width, seed=0):
+    """小检测框 (中位数走分组批量路径), 边长 1~48 像素"""
+    rng = np.random.default_rng(seed)
+    detections = []
+    for _ in range(num_boxes):
+        box_w, box_h = rng.integers(1, 49, size=2)
+        x1, y1 = rng.integers(0, width - box_w), rng.integers(0, height - box_h)
+        detections.append({
+            'box': np.array([x1, y1, x1 + box_w, y1 + box_h], dtype=np.float32),
+            'confidence': 0.5,
+            'label': LABELS[rng.integers(len(LABELS))]
+        })
+    return detections
+
+
+def test_small_rois_match_baseline(localizer, depth_map):
+    detections = small_detections(200, *depth_map.shape)
+    assert any(np.prod(det['box'][2:] - det['box'][:2]) <= _ROI_BATCH_PIXELS for det in detections)
+    expected = reference_depth_to_distance(depth_map, detections, image_size=(640, 480))
+    actual = localizer.depth_to_distance(depth_map, detections, image_size=(640, 480))
+    assert assert_close(expected, actual) <= DEPTH_ATOL
+
+
+@pytest.mark.parametrize("num_boxes", [1, 50, 500])
+def test_large_rois_match_baseline(localizer, depth_map, num_boxes):
+    detections = make_detections(num_boxes, 480, 640, LABELS, seed=num_boxes)
+    expected = reference_depth_to_distance(depth_map, detections, image_size=(640, 480))
+    actual = localizer.depth_to_distance(depth_map, detections, image_size=(640, 480))
+    assert assert_close(expected, actual) <= DEPTH_ATOL
+
+
+def test_camera_overrides_and_out_of_image_boxes(localizer, depth_map):
+    detections = make_detections(50, 480, 640, LABELS, seed=7) + [
+        {'box': np.array([700, 10, 760, 50], dtype=np.float32), 'confidence': 0.9, 'label': 'light'},
+        {'box': np.array([-40, -40, -1, -1], dtype=np.float32), 'confidence': 0.9, 'label': 'lamp'},
+    ]
+    overrides = {'min_distance': 1.0, 'max_distance': 5.0}
+    expected = reference_depth_to_distance(depth_map, detections, camera_params=overrides)
+    actual = localizer.depth_to_distance(depth_map, detections, camera_params=overrides)
+    assert_close(expected, actual)
+    assert actual[-1]['distance'] is None and actual[-2]['distance'] is None
+
+
+def stepped_depth(height=480, width=640):
+    """前后景阶跃的深度图 (ROI跨越边缘时中位数对少量像素敏感)"""
+    yy, xx = np.mgrid[0:height, 0:width]
+    return (0.6 * yy / height + 0.4 * (np.sin(xx / 40) * np.cos(yy / 30) > 0.3)).astype(np.float32)
+
+
+@pytest.mark.parametrize("kind", ["stepped", "noisy"])
+def test_roi_statistics_match_numpy(kind):
+    stat_map = stepped_depth() if kind == "stepped" else np.random.default_rng(3).random((480, 640), dtype=np.float32)
+    detections = make_detections(300, 480, 640, LABELS, seed=11) + small_detections(300, 480, 640, seed=12)
+    boxes = np.clip(np.stack([det['box'] for det in detections]).astype(int), 0, [640, 480, 640, 480])
+    boxes = boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+    medians, means = _roi_statistics(stat_map, boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+    expected_medians = [np.median(stat_map[y1:y2, x1:x2]) for x1, y1, x2, y2 in boxes]
+    expected_means = [stat_map[y1:y2, x1:x2].mean(dtype=np.float64) for x1, y1, x2, y2 in boxes]
+    np.testing.assert_allclose(medians, expected_medians, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(means, expected_means, rtol=0, atol=1e-6)
+
+
+def test_step_edges_match_baseline(localizer):
+    stat_map = stepped_depth()
+    detections = make_detections(300, 480, 640, LABELS, seed=11)
+    expected = reference_depth_to_distance(stat_map, detections, image_size=(640, 480))
+    actual = localizer.depth_to_distance(stat_map, detections, image_size=(640, 480))
+    assert assert_close(expected, actual) <= DEPTH_ATOL
+
+
+def lazy_depth_map(size, native_size, seed=0):
+    """平滑的原生网格深度预测 (如 Depth Anything V2 的 518 宽输出) 及其按需插值的全分辨率图"""
+    native_w, native_h = native_size
+    noise = np.random.default_rng(seed).random((native_h, native_w), dtype=np.float32)
+    prediction = torch.from_numpy(cv2.GaussianBlur(noise, (0, 0), sigmaX=native_w / 20))[None]
+    native = prediction[0].numpy()
+    native = (native - native.min()) / (native.max() - native.min() + 1e-8)
+    return LazyDepthMap(native, size, partial(LightLocalization3D._upsample_depth_prediction, prediction, size))
+
+
+def test_native_grid_distances_match_full_resolution(localizer):
+    depth_map = lazy_depth_map((1920, 1080), (518, 294))
+    detections = make_detections(200, 1080, 1920, LABELS, seed=1)
+    lazy = localizer.depth_to_distance(depth_map, detections, image_size=(1920, 1080))
+    assert not depth_map.is_materialized, "距离计算不应生成全分辨率深度图"
+
+    full = localizer.depth_to_distance(np.asarray(depth_map), detections, image_size=(1920, 1080))
+    for a, b in zip(full, lazy):
+        assert (a['distance'] is None) == (b['distance'] is None)
+        if a['distance'] is None:
+            continue
+        # ROI统计在原生网格上 (框向外取整到网格单元), 深度值只差插值误差
+        assert b['depth_value'] == pytest.approx(a['depth_value'], abs=0.01)
+        assert b['distance'] == pytest.approx(a['distance'], abs=0.05)
+        assert (b['distance_range'], b['position_hint']) == (a['distance_range'], a['position_hint'])
+
+
+def test_native_depth_pipeline_matches_full_resolution(make_pipeline, pipeline, images):
+    native = make_pipeline(native_depth=True)
+    for image in images:
+        result = native.process_image(image, confidence_threshold=0.0)
+        expected = pipeline.process_image(image, confidence_threshold=0.0)
+        depth_map = result['depth_map']
+        assert isinstance(depth_map, LazyDepthMap) and not depth_map.is_materialized
+        assert [det['distance'] is None for det in result['detections']] == \
+            [det['distance'] is None for det in expected['detections']]
+        np.testing.assert_allclose(np.asarray(depth_map), expected['depth_map'], atol=1e-6)
@@ -0,0 +1,125 @@
+"""
+detect_lights 与原实现 (文本+图像完整前向, 逐框过滤) 的一致性, 分块检测的坐标映射和配置默认值
+"""
+
+import numpy as np
+import pytest
+import torch
+from torchvision.ops import nms
+
+
+def reference_detect_lights(pipeline, image, confidence_threshold, use_nms=True, nms_threshold=0.5,
+                            min_area_ratio=0.001):
+    """原 detect_lights 实现 (文本查询缓存/批量/向量化之前的版本)"""
+    pil_image = pipeline._to_pil(image)
+    text_queries = pipeline.light_prompts
+    inputs = pipeline.detection_processor(images=pil_image, text=text_queries, return_tensors="pt")
+    with torch.no_grad():
+        outputs = pipeline.detection_model(**inputs)
+
+    target_sizes = torch.tensor([pil_image.size[::-1]])
+    results = pipeline.detection_processor.image_processor.post_process_object_detection(
+        outputs=outputs, target_sizes=target_sizes, threshold=confidence_threshold
+    )[0]
+
+    boxes, scores, labels = [], [], []
+    image_area = pil_image.size[0] * pil_image.size[1]
+    for box, score, label_id in zip(results["boxes"], results["scores"], results["labels"]):
+        box_np = box.numpy()
+        if (box_np[2] - box_np[0]) * (box_np[3] - box_np[1]) < image_area * min_area_ratio:
+            continue
+        boxes.append(box)
+        scores.append(score)
+        labels.append(text_queries[label_id] if label_id < len(text_queries) else 'light')
+
+    indices = range(len(boxes))
+    if use_nms and boxes:
+        indices = nms(torch.stack(boxes), torch.stack(scores), nms_threshold).tolist()
+    detections = [
+        {'box': boxes[i].numpy(), 'confidence': float(scores[i]), 'label': labels[i]}
+        for i in indices
+    ]
+    return sorted(detections, key=lambda x: x['confidence'], reverse=True)
+
+
+def assert_same_detections(expected, actual):
+    assert len(actual) == len(expected)
+    for a, b in zip(expected, actual):
+        assert b['label'] == a['label']
+        assert b['confidence'] == pytest.approx(a['confidence'], abs=1e-5)
+        np.testing.assert_allclose(b['box'], a['box'], atol=1e-3)
+
+
+@pytest.mark.parametrize("use_nms", [True, False])
+@pytest.mark.parametrize("confidence_threshold", [0.0, 0.1])
+def test_detect_lights_matches_baseline(pipeline, images, use_nms, confidence_threshold):
+    for image in images:
+        expected = reference_detect_lights(
+            pipeline, image, confidence_threshold, use_nms=use_nms, min_area_ratio=0
+        )
+        actual = pipeline.detect_lights(
+            image, confidence_threshold=confidence_threshold, use_nms=use_nms, min_area_ratio=0
+        )
+        assert_same_detections(expected, actual)
+
+
+def test_detect_lights_area_filter_matches_baseline(pipeline, images):
+    for image in images:
+        for min_area_ratio in (0.0005, 0.001, 0.01):
+            expected = reference_detect_lights(pipeline, image, 0.0, min_area_ratio=min_area_ratio)
+            actual = pipeline.detect_lights(image, confidence_threshold=0.0, min_area_ratio=min_area_ratio)
+            assert_same_detections(expected, actual)
+
+
+def test_detect_lights_batch_matches_single(pipeline, images):
+    batch = pipeline._detect_lights_batch(images, confidence_threshold=0.0, min_area_ratio=0)
+    for image, actual in zip(images, batch):
+        expected = pipeline.detect_lights(image, confidence_threshold=0.0, min_area_ratio=0)
+        assert_same_detections(expected, actual)
+        assert actual, "随机模型在阈值0时应有检测结果"
+
+
+def test_process_batch_matches_process_image(pipeline, images):
+    results = pipeline.process_batch(images, confidence_threshold=0.0, batch_size=3)
+    for image, result in zip(images, results):
+        expected = pipeline.process_image(image, confidence_threshold=0.0)
+        assert_same_detections(expected['detections'], result['detections'])
+        np.testing.assert_allclose(np.asarray(result['depth_map']), np.asarray(expected['depth_map']), atol=1e-4)
+        assert result['depth_map'].shape == image.shape[:2]
+
+
+def test_detection_config_supplies_default_thresholds(make_pipeline, pipeline, images):
+    configured = make_pipeline(detection_config={'confidence_threshold': 0.0, 'nms_threshold': 0.3})
+    for image in images[:2]:
+        expected = pipeline.detect_lights(image, confidence_threshold=0.0, nms_threshold=0.3)
+        assert_same_detections(expected, configured.detect_lights(image))
+        assert_same_detections(expected, configured.process_image(image, compute_depth=False)['detections'])
+
+
+def test_sliding_window_boxes_map_to_frame_and_drop_seam_cuts(make_pipeline, images, monkeypatch):
+    # 200x100 图像: 全图 + 三个 100x100 窗口 (x = 0 / 50 / 100), 灯具 [80, 20, 120, 60] 跨越 x=100 的接缝
+    tiled = make_pipeline(detection_config={'use_sliding_window': True, 'window_size': (100, 100), 'stride': 50})
+    tile_boxes = [
+        [[10, 10, 30, 30]],                    # 全图: 另一盏灯
+        [[80, 20, 100, 60], [10, 10, 30, 30]],  # 窗口 x=0: 灯具被右边界截断 (丢弃), 另一盏灯 (NMS去重)
+        [[30, 20, 70, 60]],                    # 窗口 x=50: 灯具完整
+        [[0, 20, 20, 60]],                     # 窗口 x=100: 灯具被左边界截断 (丢弃)
+    ]
+    tile_scores = [[0.9], [0.8, 0.7], [0.85], [0.8]]
+    calls = []
+
+    def fake_detect_tiles(pil_tiles, canvas_sizes, text_queries, confidence_threshold):
+        calls.append(canvas_sizes)
+        return [
+            {'boxes': torch.tensor(boxes, dtype=torch.float32), 'scores': torch.tensor(scores),
+             'labels': torch.zeros(len(boxes), dtype=torch.long)}
+            for boxes, scores in zip(tile_boxes, tile_scores)
+        ]
+
+    monkeypatch.setattr(tiled, '_detect_tiles', fake_detect_tiles)
+    detections = tiled.detect_lights(images[2], confidence_threshold=0.5)
+
+    assert images[2].shape[:2] == (100, 200)
+    assert calls == [[(200, 100), (100, 100), (100, 100), (100, 100)]]
+    np.testing.assert_allclose([det['box'] for det in detections], [[10, 10, 30, 30], [80, 20, 120, 60]])
+    assert [det['confidence'] for det in detections] == pytest.approx([0.9, 0.85])
@@ -0,0 +1,88 @@
+"""
+性能指标服务: /metrics (Prometheus 文本格式) 与 /metrics.json 的分阶段分位数
+"""
+
+import json
+import re
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from metrics import MetricsServer, StageMetrics
+
+SAMPLE = re.compile(r'^(\w+)\{stage="([^"]+)"(?:,quantile="([0-9.]+)")?\} (\S+)$')
+
+
+def fetch(server, path):
+    with urllib.request.urlopen(f"http://{server.host}:{server.port}{path}", timeout=10) as response:
+        return response.headers['Content-Type'], response.read().decode()
+
+
+def parse_stages(text, metric="light3d_stage_seconds"):
+    """解析 Prometheus 文本: {stage: {'p50', 'p95', 'p99', 'sum', 'count'}}"""
+    stages = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match is None or not match.group(1).startswith(metric):
+            continue
+        name, stage, quantile, value = match.groups()
+        key = f"p{round(float(quantile) * 100)}" if quantile else name[len(metric) + 1:]
+        stages.setdefault(stage, {})[key] = float(value)
+    return stages
+
+
+@pytest.fixture
+def server():
+    metrics = StageMetrics(window=100)
+    server = MetricsServer(metrics, port=0).start()
+    yield server
+    server.stop()
+
+
+def test_metrics_endpoints_report_stage_quantiles(server):
+    assert server.port != 0
+    durations_ms = np.arange(1, 151)  # 窗口只保留最近100个样本 (51..150ms)
+    for duration in durations_ms:
+        server.metrics.record('depth.forward', int(duration * 1e6))
+    server.metrics.record('detection.forward', int(2e6))
+    server.metrics.increment('images', 3)
+
+    content_type, text = fetch(server, '/metrics')
+    assert content_type.startswith('text/plain; version=0.0.4')
+    stages = parse_stages(text)
+    assert set(stages) == {'depth.forward', 'detection.forward'}
+    expected = np.quantile(durations_ms[-100:], (0.5, 0.95, 0.99)) / 1e3
+    depth = stages['depth.forward']
+    np.testing.assert_allclose([depth['p50'], depth['p95'], depth['p99']], expected, atol=1e-9)
+    assert depth['count'] == 150
+    assert depth['sum'] == pytest.approx(durations_ms.sum() / 1e3)
+    assert stages['detection.forward']['p99'] == pytest.approx(0.002)
+    assert 'light3d_images_total 3' in text.splitlines()
+
+    content_type, body = fetch(server, '/metrics.json')
+    assert content_type == 'application/json'
+    snapshot = json.loads(body)
+    assert snapshot['counters'] == {'images': 3}
+    for name, stats in stages.items():
+        for key in ('p50', 'p95', 'p99', 'sum', 'count'):
+            assert snapshot['stages'][name][key] == pytest.approx(stats[key], abs=1e-9)
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        fetch(server, '/missing')
+    assert error.value.code == 404
+
+
+def test_pipeline_serves_its_stage_metrics(make_pipeline, images):
+    pipeline = make_pipeline()
+    server = pipeline.start_metrics_server(port=0)
+    try:
+        assert pipeline.start_metrics_server(port=0) is server
+        pipeline.process_image(images[0], confidence_threshold=0.0)
+        stages = parse_stages(fetch(server, '/metrics')[1])
+        for name in ('detection.forward', 'depth.forward', 'distance.map'):
+            assert stages[name]['count'] == 1
+            assert 0 < stages[name]['p50'] <= stages[name]['p95'] <= stages[name]['p99']
+    finally:
+        server.stop()
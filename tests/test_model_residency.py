@@ -0,0 +1,45 @@
+"""
+模型驻留: 空闲超时后自动卸载, 下一次请求透明地重新加载
+"""
+
+import time
+
+from test_detection import assert_same_detections
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_idle_models_are_unloaded_and_reloaded_on_next_request(make_pipeline, pipeline, images, monkeypatch):
+    lazy = make_pipeline(lazy_loading=True, idle_timeout=0.2)
+    loads = []
+    load_detection_model = lazy._load_detection_model
+
+    def counting_load(*args, **kwargs):
+        loads.append(args[0])
+        return load_detection_model(*args, **kwargs)
+
+    monkeypatch.setattr(lazy, '_load_detection_model', counting_load)
+    try:
+        first = lazy.process_image(images[0], confidence_threshold=0.0)
+        assert len(loads) == 1
+
+        # 后台线程在空闲超时后卸载所有模型并释放引用
+        assert wait_until(lambda: not any(lazy.residency.is_resident(name) for name in ('detection', 'depth')))
+        assert lazy.detection_model is None and lazy.depth_model is None
+        report = lazy.model_memory_report()
+        assert report['detection']['memory_mb'] == 0 and not report['detection']['resident']
+
+        second = lazy.process_image(images[0], confidence_threshold=0.0)
+        assert len(loads) == 2
+        assert_same_detections(first['detections'], second['detections'])
+        expected = pipeline.process_image(images[0], confidence_threshold=0.0)
+        assert_same_detections(second['detections'], expected['detections'])
+    finally:
+        lazy.residency.stop_idle_reaper()
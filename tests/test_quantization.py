@@ -0,0 +1,53 @@
+"""
+动态INT8量化: 量化时机 (首次前向之前)、量化范围和内存统计
+"""
+
+import torch
+
+from model_residency import module_memory_bytes
+from test_detection import assert_same_detections
+
+
+def linear_types(module):
+    """模块中线性层的类型 (浮点 nn.Linear / 动态量化 Linear)"""
+    linear = (torch.nn.Linear, torch.ao.nn.quantized.dynamic.Linear)
+    return {type(child) for child in module.modules() if isinstance(child, linear)}
+
+
+def test_detection_quantizes_image_tower_and_heads_only(make_pipeline, pipeline, images):
+    quantized = make_pipeline()
+    fp32_bytes = module_memory_bytes(quantized.detection_model)
+    quantized.detect_lights(images[0])  # 量化前已缓存文本查询嵌入
+    (cached_embeds, _), = quantized._text_query_cache.values()
+
+    assert quantized.enable_int8_quantization(['detection'])
+    owl = quantized.detection_model.owlv2
+    assert linear_types(owl.text_model) == {torch.nn.Linear}
+    for module in (owl.vision_model, quantized.detection_model.class_head, quantized.detection_model.box_head):
+        assert linear_types(module) == {torch.ao.nn.quantized.dynamic.Linear}
+
+    # 文本塔未量化: 已缓存的嵌入仍与原模型一致
+    (query_embeds, _), = quantized._text_query_cache.values()
+    assert query_embeds is cached_embeds
+    expected, _ = pipeline._get_text_query_embeds(pipeline.light_prompts)
+    torch.testing.assert_close(query_embeds, expected)
+
+    # 内存统计包含打包的int8权重
+    parameter_bytes = sum(p.numel() * p.element_size() for p in quantized.detection_model.parameters())
+    int8_bytes = module_memory_bytes(quantized.detection_model)
+    assert parameter_bytes < int8_bytes < fp32_bytes
+
+
+def test_lazily_loaded_models_are_quantized_before_the_first_frame(make_pipeline, images):
+    lazy = make_pipeline(lazy_loading=True)
+    assert lazy.enable_int8_quantization()
+    assert not lazy.residency.is_resident('detection')
+
+    first = lazy.process_image(images[0], confidence_threshold=0.0)
+    assert all(
+        getattr(getattr(lazy, lazy._MODEL_SLOTS[name][0]), '_int8_quantized', False)
+        for name in ('detection', 'depth')
+    )
+    second = lazy.process_image(images[0], confidence_threshold=0.0)
+    assert_same_detections(first['detections'], second['detections'])
+    assert lazy.residency.memory_report()['detection']['memory_mb'] > 0
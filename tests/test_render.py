@@ -0,0 +1,77 @@
+"""
+DepthRenderer 与原先每帧用matplotlib绘制 (imshow 自动缩放 + colorbar) 的输出对比
+"""
+
+import numpy as np
+import pytest
+
+from depth_render import DepthRenderer
+
+
+def depth_in_meters(width, height, seed=0):
+    """取值不在 [0, 1] 的平滑深度图 (米)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    ramp = x / width + 0.5 * np.sin(y / height * np.pi)
+    return (2.0 + 5.0 * ramp / ramp.max() + rng.normal(0, 0.01, ramp.shape)).astype(np.float32)
+
+
+def matplotlib_render(depth_map, title='Depth Map', colorbar_label='Depth (normalized)'):
+    """原 generate_depth_image 的绘制方式 (不经过pyplot)"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 6), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    im = ax.imshow(depth_map, cmap='plasma')
+    ax.set_title(title, fontsize=14)
+    ax.axis('off')
+    fig.colorbar(im, ax=ax, label=colorbar_label)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+
+@pytest.fixture
+def renderer():
+    return DepthRenderer(title='Depth Map', colorbar_label='Depth (normalized)')
+
+
+def test_colorize_autoscales_like_imshow(renderer):
+    import matplotlib
+    from matplotlib.colors import Normalize
+
+    depth_map = depth_in_meters(64, 48)
+    expected = matplotlib.colormaps['plasma'](Normalize()(depth_map), bytes=True)[:, :, :3]
+    colored = renderer.colorize(depth_map)
+    # 只允许量化边界上的浮点误差 (相邻色表项)
+    assert np.mean(np.any(colored != expected, axis=-1)) < 0.01
+    assert np.abs(colored.astype(np.int16) - expected).max() <= 3
+
+    # 平移缩放不改变颜色; 常数图与 Normalize 一样取色表第一项
+    np.testing.assert_array_equal(renderer.colorize(depth_map * 3 - 1), colored)
+    assert (renderer.colorize(np.full((4, 4), 5.0)) == renderer.lut[0]).all()
+
+
+def test_non_finite_values_do_not_affect_the_scale(renderer):
+    depth_map = depth_in_meters(32, 24)
+    with_nan = depth_map.copy()
+    with_nan[12, 16], with_nan[12, 17] = np.nan, np.inf
+    colored = renderer.colorize(with_nan)
+    valid = np.ones(depth_map.shape, dtype=bool)
+    valid[12, 16:18] = False
+    np.testing.assert_array_equal(colored[valid], renderer.colorize(depth_map)[valid])
+    assert (colored[12, 16:18] == renderer.lut[0]).all()
+
+
+@pytest.mark.parametrize("size", [(640, 480), (320, 640)])
+def test_render_matches_matplotlib_figure(renderer, size):
+    depth_map = depth_in_meters(*size)
+    expected = matplotlib_render(depth_map)
+    image = renderer.render(depth_map)
+    assert image.shape == expected.shape
+
+    # 版式 (标题、色条、刻度) 逐像素几乎一致, 图像区域只有重采样的差异
+    diff = np.abs(image.astype(np.int16) - expected).max(axis=-1)
+    assert np.mean(diff > 8) < 0.01
+    assert diff.mean() < 1.0
@@ -0,0 +1,119 @@
+"""
+ResultCache / RecentResults 的LRU淘汰、字节预算和缓存键
+"""
+
+from functools import partial
+
+import numpy as np
+import pytest
+
+from pipeline import LazyDepthMap
+from result_cache import RecentResults, ResultCache, estimate_nbytes
+
+MB = 1024 ** 2
+
+
+def array_mb(megabytes, value=0):
+    return np.full(megabytes * MB // 4, value, dtype=np.float32)
+
+
+def lazy_depth_map(width, height):
+    native = np.random.default_rng(0).random((height // 8, width // 8), dtype=np.float32)
+    return LazyDepthMap(native, (width, height), partial(np.ones, (height, width), np.float32))
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_detection_mb=3, max_depth_mb=1)
+    for key in 'abc':
+        cache.put('detections', key, array_mb(1))
+    cache.get('detections', 'a')  # a 变为最近使用
+    cache.put('detections', 'd', array_mb(1))
+
+    assert cache.get('detections', 'b') is None
+    assert all(cache.get('detections', key) is not None for key in 'acd')
+    stats = cache.stats()['detections']
+    assert stats['entries'] == 3 and stats['evictions'] == 1
+    assert stats['memory_mb'] <= 3
+
+
+def test_tiers_have_separate_budgets_and_oversized_values_are_skipped():
+    cache = ResultCache(max_detection_mb=1, max_depth_mb=2)
+    cache.put('depth', 'x', array_mb(2))
+    cache.put('detections', 'x', array_mb(2))
+    assert cache.get('depth', 'x') is not None
+    assert cache.get('detections', 'x') is None
+    assert cache.stats()['detections']['memory_mb'] == 0
+
+
+def test_replacing_a_key_updates_the_byte_count():
+    cache = ResultCache(max_detection_mb=4)
+    cache.put('detections', 'a', array_mb(1))
+    cache.put('detections', 'a', array_mb(2, value=1))
+    assert cache.stats()['detections']['memory_mb'] == pytest.approx(2, abs=0.01)
+    assert cache.get('detections', 'a')[0] == 1
+
+
+def test_lazy_depth_maps_are_counted_at_materialized_size():
+    depth_map = lazy_depth_map(1024, 1024)
+    assert estimate_nbytes(depth_map) == depth_map.native.nbytes + 1024 * 1024 * 4
+
+    # 预算只够两张全分辨率深度图: 第三张写入时淘汰最旧的, 全部生成后也不超出预算
+    cache = ResultCache(max_depth_mb=9)
+    maps = [lazy_depth_map(1024, 1024) for _ in range(3)]
+    for i, depth_map in enumerate(maps):
+        cache.put('depth', i, depth_map)
+    assert cache.get('depth', 0) is None
+    for i in (1, 2):
+        np.asarray(cache.get('depth', i))
+    resident = sum(depth_map.nbytes for depth_map in maps[1:])
+    assert resident <= cache.stats()['depth']['memory_mb'] * MB <= 9 * MB
+
+
+def test_persisted_results_are_reloaded(tmp_path):
+    cache = ResultCache(persist_dir=tmp_path)
+    cache.put('detections', ('image', 0.1), [{'box': np.arange(4.0), 'label': 'light'}])
+
+    reloaded = ResultCache(persist_dir=tmp_path)
+    value = reloaded.get('detections', ('image', 0.1))
+    np.testing.assert_array_equal(value[0]['box'], np.arange(4.0))
+    assert reloaded.stats()['disk_hits'] == 1
+
+
+def test_cache_keys_use_the_loaded_model(make_pipeline, tiny_models):
+    lazy = make_pipeline(lazy_loading=True, result_cache=ResultCache())
+    assert not lazy.residency.is_resident('detection')
+    model_id = lazy._model_cache_id('detection')
+    assert lazy.residency.is_resident('detection')
+    assert model_id == (tiny_models['detection'], 'float32')
+
+    # 降级链加载了其他模型时, 键随实际加载的模型变化
+    lazy._resolved_models['detection'] = 'fallback-model'
+    assert lazy._model_cache_id('detection')[0] == 'fallback-model'
+    assert lazy._model_cache_id('detection', resolve=False)[0] == tiny_models['detection']
+
+
+def test_recent_results_evict_by_image_count():
+    recent = RecentResults(max_images=2)
+    for key in 'abc':
+        recent.put(key, 'candidates', array_mb(1))
+        recent.put(key, 'depth', array_mb(1))
+    assert recent.get('a', 'candidates') is None
+    assert recent.get('c', 'depth') is not None
+    assert recent.stats()['images'] == 2
+
+
+def test_recent_results_are_bounded_by_bytes():
+    # 保留4张图, 但预算只够两张全分辨率深度图 (写入时按生成后的大小计量)
+    recent = RecentResults(max_images=4, max_mb=9)
+    maps = [lazy_depth_map(1024, 1024) for _ in range(4)]
+    for i, depth_map in enumerate(maps):
+        recent.put(i, 'depth', depth_map)
+    assert [recent.get(i, 'depth') is not None for i in range(4)] == [False, False, True, True]
+    for depth_map in maps[2:]:
+        np.asarray(depth_map)
+    assert sum(depth_map.nbytes for depth_map in maps[2:]) <= recent.stats()['memory_mb'] * MB <= 9 * MB
+
+    recent.put('huge', 'depth', array_mb(10))
+    assert recent.get('huge', 'depth') is None
+    recent.clear()
+    assert recent.stats()['memory_mb'] == 0
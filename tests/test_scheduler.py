@@ -0,0 +1,150 @@
+"""
+BatchingInferenceWorker / SessionScheduler 的合批、公平性、合并和过载保护
+"""
+
+import threading
+
+import pytest
+
+from batching import BatchingInferenceWorker
+from scheduler import SchedulerOverloaded, SessionScheduler
+from test_detection import assert_same_detections
+
+
+class RecordingPipeline:
+    """记录每批的图像; 第一批阻塞到 release(), 便于在其后排队请求"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def release(self):
+        self._release.set()
+
+    def process_batch(self, images, confidence_threshold=0.15, compute_depth=True,
+                      compute_distance=True, return_features=False, batch_size=None):
+        self.started.set()
+        self._release.wait(timeout=10)
+        self.batches.append(list(images))
+        return [{'image': image, 'confidence_threshold': confidence_threshold} for image in images]
+
+
+@pytest.fixture
+def recording():
+    pipeline = RecordingPipeline()
+    scheduler = SessionScheduler(lambda: pipeline, max_batch_size=3, max_wait_ms=0,
+                                 max_pending_per_session=4, max_pending_total=8)
+    yield pipeline, scheduler
+    pipeline.release()
+    scheduler.close()
+
+
+def block_worker(pipeline, scheduler):
+    """提交一个占住工作线程的请求, 之后提交的请求都在队列中等待"""
+    future = scheduler.submit('blocker', session_id='blocker')
+    assert pipeline.started.wait(timeout=10)
+    return future
+
+
+def test_worker_batches_requests_with_the_same_key():
+    started, gate = threading.Event(), threading.Event()
+    batches = []
+
+    def batch_fn(items):
+        started.set()
+        gate.wait(timeout=10)
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    with BatchingInferenceWorker(batch_fn, max_batch_size=4, max_wait_ms=0) as worker:
+        first = worker.submit(0, key='a')
+        assert started.wait(timeout=10)
+        futures = [worker.submit(i, key='a' if i % 2 else 'b') for i in range(1, 7)]
+        gate.set()
+        assert [f.result(timeout=10) for f in [first] + futures] == [i * 10 for i in range(7)]
+    assert batches[1:] == [[1, 3, 5], [2, 4, 6]]
+    assert worker.stats()['completed'] == 7
+
+
+def test_scheduler_serves_sessions_round_robin(recording):
+    pipeline, scheduler = recording
+    blocker = block_worker(pipeline, scheduler)
+    futures = [scheduler.submit(f'a{i}', session_id='a') for i in range(4)]
+    futures += [scheduler.submit(f'b{i}', session_id='b') for i in range(2)]
+    futures += [scheduler.submit('c0', session_id='c')]
+    pipeline.release()
+
+    for future in [blocker] + futures:
+        future.result(timeout=10)
+    # 每批每个会话最多轮到一次后才轮到下一轮, 会话a连续提交不会挤占b和c
+    assert pipeline.batches[1:] == [['a0', 'b0', 'c0'], ['a1', 'b1', 'a2'], ['a3']]
+    assert scheduler.stats()['completed'] == 8
+
+
+def test_scheduler_batches_only_matching_params(recording):
+    pipeline, scheduler = recording
+    blocker = block_worker(pipeline, scheduler)
+    low = scheduler.submit('a0', session_id='a', confidence_threshold=0.1)
+    high = scheduler.submit('b0', session_id='b', confidence_threshold=0.3)
+    pipeline.release()
+    assert low.result(timeout=10)['confidence_threshold'] == 0.1
+    assert high.result(timeout=10)['confidence_threshold'] == 0.3
+    blocker.result(timeout=10)
+    assert pipeline.batches[1:] == [['a0'], ['b0']]
+
+
+def test_coalesced_requests_share_the_newest_frame(recording):
+    pipeline, scheduler = recording
+    blocker = block_worker(pipeline, scheduler)
+    view = scheduler.session('camera', coalesce=True)
+    old = scheduler.submit('frame1', session_id='camera', coalesce=True)
+    new = scheduler.submit('frame2', session_id='camera', coalesce=True)
+    pipeline.release()
+    blocker.result(timeout=10)
+    assert old.result(timeout=10)['image'] == new.result(timeout=10)['image'] == 'frame2'
+    assert view.process_image('frame3')['image'] == 'frame3'
+    stats = scheduler.stats()
+    assert stats['coalesced'] == 1 and stats['submitted'] == 3
+
+
+def test_scheduler_rejects_when_queues_are_full(recording):
+    pipeline, scheduler = recording
+    blocker = block_worker(pipeline, scheduler)
+    queued = [scheduler.submit(i, session_id='a') for i in range(4)]
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.submit('too-many', session_id='a')
+    queued += [scheduler.submit(i, session_id=f's{i}') for i in range(4)]
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.submit('too-many', session_id='new')
+    assert scheduler.stats()['rejected'] == 2
+
+    pipeline.release()
+    for future in [blocker] + queued:
+        future.result(timeout=10)
+
+
+def test_cancelled_requests_are_skipped(recording):
+    pipeline, scheduler = recording
+    blocker = block_worker(pipeline, scheduler)
+    cancelled = scheduler.submit('a0', session_id='a')
+    kept = scheduler.submit('b0', session_id='b')
+    assert cancelled.cancel()
+    pipeline.release()
+    blocker.result(timeout=10)
+    assert kept.result(timeout=10)['image'] == 'b0'
+    assert ['a0'] not in pipeline.batches
+
+
+def test_scheduler_matches_direct_pipeline(pipeline, images):
+    scheduler = SessionScheduler(lambda: pipeline, max_batch_size=4, max_wait_ms=5)
+    try:
+        futures = [
+            scheduler.submit(image, session_id=f'session-{i % 2}', confidence_threshold=0.0, compute_depth=False)
+            for i, image in enumerate(images)
+        ]
+        for image, future in zip(images, futures):
+            expected = pipeline.process_image(image, confidence_threshold=0.0, compute_depth=False)
+            assert_same_detections(expected['detections'], future.result(timeout=60)['detections'])
+    finally:
+        scheduler.close()
@@ -0,0 +1,71 @@
+"""
+StreamingPipeline / DropStaleQueue: 推理跟不上时丢弃过期帧, 总是发布最新结果
+"""
+
+import threading
+
+import numpy as np
+
+from streaming import DropStaleQueue, StreamingPipeline
+
+
+class SlowPipeline:
+    """推理阻塞到 release() 的流水线 (模拟推理远慢于采集), 记录处理过的帧"""
+
+    def __init__(self):
+        self.frames = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def release(self):
+        self._release.set()
+
+    def process_image(self, image, confidence_threshold=None, compute_depth=True, compute_distance=True):
+        self.started.set()
+        self._release.wait(timeout=10)
+        self.frames.append(int(image[0, 0]))
+        return {'detections': [], 'marker': int(image[0, 0])}
+
+
+def frame(marker):
+    return np.full((4, 4), marker, dtype=np.uint8)
+
+
+def wait_for_packet(stream, predicate, timeout=10):
+    for packet in stream.results(timeout=timeout):
+        if predicate(packet):
+            return packet
+    raise AssertionError("流水线已停止, 未发布期望的数据包")
+
+
+def test_drop_stale_queue_keeps_newest():
+    queue = DropStaleQueue(maxsize=2)
+    assert [queue.put(i) for i in range(5)] == [False, False, True, True, True]
+    assert queue.dropped == 3
+    assert [queue.get(), queue.get()] == [3, 4]
+    assert queue.get(timeout=0.01) is None
+    queue.put(5)
+    queue.close()
+    assert queue.get() == 5 and queue.get() is None
+
+
+def test_slow_inference_drops_stale_frames_and_delivers_newest():
+    pipeline = SlowPipeline()
+    stream = StreamingPipeline(pipeline, render_fn=lambda image, result: result and result['result']['marker'])
+    with stream:
+        stream.submit(frame(1))
+        assert pipeline.started.wait(timeout=10)
+        # 推理阻塞期间到达的帧只保留最新的一帧
+        for marker in range(2, 11):
+            stream.submit(frame(marker))
+        pipeline.release()
+
+        packet = wait_for_packet(stream, lambda packet: packet['result_frame_id'] == 10)
+        assert packet['result']['marker'] == 10 and packet['output'] == 10
+        assert packet['frame_id'] == 10
+
+    assert pipeline.frames == [1, 10]
+    stats = stream.stats()
+    assert stats['frames_captured'] == 10
+    assert stats['frames_inferred'] == 2
+    assert stats['frames_dropped'] == 8
@@ -0,0 +1,124 @@
+"""
+SceneChangeGate / TrackedLocalizer 的重新推理判定
+"""
+
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import make_image
+from tracking import SceneChangeGate, TrackedLocalizer, frame_thumbnail, scene_change_score
+
+
+class CountingPipeline:
+    """记录调用次数的流水线 (只测门控/跟踪逻辑, 不需要模型)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def process_image(self, image, confidence_threshold=0.15, compute_depth=True,
+                      compute_distance=True, return_features=False):
+        self.calls += 1
+        return {
+            'detections': [{'box': np.array([100, 80, 140, 120], dtype=np.float32),
+                            'confidence': 0.9, 'label': 'light', 'distance': 2.0}],
+            'depth_map': None,
+            'timing': {'total': 0.0},
+        }
+
+
+@pytest.fixture
+def scene():
+    return make_image(640, 480, seed=3)
+
+
+def with_noise(image, seed, sigma=2.0):
+    noise = np.random.default_rng(seed).normal(0, sigma, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def textured_image(width, height, seed=0):
+    """细纹理图像 (相位相关需要足够的高频内容)"""
+    noise = np.random.default_rng(seed).random((height, width, 3), dtype=np.float32)
+    return (cv2.GaussianBlur(noise, (0, 0), sigmaX=3) * 255).astype(np.uint8)
+
+
+def with_lamp_on(image, x=300, y=200, size=20):
+    """画面中一小块区域变亮 (约 0.1% 的面积)"""
+    changed = image.copy()
+    changed[y:y + size, x:x + size] = 255
+    return changed
+
+
+def test_gate_reuses_result_for_unchanged_and_noisy_frames(scene):
+    gate = SceneChangeGate(CountingPipeline())
+    assert gate.process_image(scene)['scene_gate']['hit'] is False
+    for seed in range(3):
+        result = gate.process_image(with_noise(scene, seed))
+        assert result['scene_gate']['hit'] is True
+    assert gate.pipeline.calls == 1
+
+
+def test_gate_detects_localized_change(scene):
+    gate = SceneChangeGate(CountingPipeline())
+    gate.process_image(scene)
+    changed = with_lamp_on(scene)
+
+    # 全图平均差异几乎为零, 分块最大值明显超过阈值
+    reference, _ = frame_thumbnail(scene, gate.thumbnail_width)
+    current, _ = frame_thumbnail(changed, gate.thumbnail_width)
+    assert scene_change_score(reference, current) < 0.01
+    assert scene_change_score(reference, current, block_size=gate.block_size) > gate.threshold
+
+    result = gate.process_image(changed)
+    assert result['scene_gate']['hit'] is False
+    assert gate.pipeline.calls == 2
+
+
+def test_gate_expires_cached_result(scene):
+    gate = SceneChangeGate(CountingPipeline(), max_age=0.01)
+    gate.process_image(scene)
+    time.sleep(0.02)
+    assert gate.process_image(scene)['scene_gate']['hit'] is False
+    assert SceneChangeGate(CountingPipeline()).max_age is not None
+
+
+def test_gate_reruns_when_params_change(scene):
+    gate = SceneChangeGate(CountingPipeline())
+    gate.process_image(scene, confidence_threshold=0.15)
+    assert gate.process_image(scene, confidence_threshold=0.3)['scene_gate']['hit'] is False
+
+
+def test_tracker_shifts_boxes_between_keyframes():
+    background = textured_image(700, 520, seed=5)
+    tracker = TrackedLocalizer(CountingPipeline(), detect_every=3)
+
+    first = tracker.process_image(background[20:500, 20:660], compute_depth=False)
+    assert first['tracking']['keyframe'] and first['tracking']['reason'] == 'first_frame'
+
+    # 画面内容左移 8 像素 (摄像头右移)
+    moved = tracker.process_image(background[20:500, 28:668], compute_depth=False)
+    assert not moved['tracking']['keyframe']
+    dx, dy = moved['tracking']['shift']
+    assert dx == pytest.approx(-8, abs=1.5) and dy == pytest.approx(0, abs=1.5)
+    np.testing.assert_allclose(moved['detections'][0]['box'], [100 + dx, 80 + dy, 140 + dx, 120 + dy], atol=1e-3)
+    assert moved['detections'][0]['distance'] == 2.0
+
+    tracker.process_image(background[20:500, 28:668], compute_depth=False)
+    interval = tracker.process_image(background[20:500, 28:668], compute_depth=False)
+    assert interval['tracking']['reason'] == 'interval'
+    assert tracker.pipeline.calls == 2
+
+
+def test_tracker_redetects_on_scene_change_and_depth_request(scene):
+    tracker = TrackedLocalizer(CountingPipeline(), detect_every=100)
+    tracker.process_image(scene, compute_depth=False)
+    assert not tracker.process_image(with_noise(scene, 0), compute_depth=False)['tracking']['keyframe']
+
+    changed = tracker.process_image(255 - scene, compute_depth=False)
+    assert changed['tracking']['reason'] in ('scene_change', 'track_lost')
+
+    assert tracker.process_image(255 - scene, compute_depth=True)['tracking']['reason'] == 'depth_requested'
+    assert tracker.stats()['detector_calls'] == 3
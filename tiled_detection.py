@@ -0,0 +1,145 @@
+"""
+分块/多尺度检测的几何工具
+把一张图像拆成若干检测块 (全图 + 放大窗口 + 缩小画布 + 滑动窗口),
+检测后把各块的检测框映射回原图坐标
+
+OWLv2 处理器会把输入填充为正方形再缩放到固定分辨率, 因此:
+- 放大 (scale > 1): 用 1/scale 大小的窗口平铺原图, 小灯具在输入中变大
+- 缩小 (scale < 1): 把原图放在 1/scale 大小的画布左上角, 大灯具完整落在输入中
+- 滑动窗口: 固定大小窗口按步长平铺, 针对超密集场景
+"""
+
+import numpy as np
+from PIL import Image
+
+# OWLv2 处理器的填充色 (归一化前 0.5 灰)
+PAD_COLOR = (128, 128, 128)
+
+
+def _axis_starts(length, window, stride):
+    """一维窗口起点: 按步长平铺, 最后一个窗口贴齐边缘"""
+    if window >= length:
+        return [0]
+    starts = list(range(0, length - window + 1, stride))
+    if starts[-1] != length - window:
+        starts.append(length - window)
+    return starts
+
+
+def sliding_window_tiles(image_size, window_size, stride):
+    """
+    覆盖整幅图像的滑动窗口
+
+    Args:
+        image_size: 图像尺寸 (width, height)
+        window_size: 窗口尺寸 (width, height)
+        stride: 步长 (像素), 或 (stride_x, stride_y)
+
+    Returns:
+        tiles: [(x, y, w, h), ...]
+    """
+    width, height = image_size
+    win_w, win_h = min(int(window_size[0]), width), min(int(window_size[1]), height)
+    stride_x, stride_y = (stride, stride) if np.isscalar(stride) else stride
+    return [
+        (x, y, win_w, win_h)
+        for y in _axis_starts(height, win_h, max(1, int(stride_y)))
+        for x in _axis_starts(width, win_w, max(1, int(stride_x)))
+    ]
+
+
+def plan_tiles(
+    image_size,
+    multi_scale=False,
+    scales=(1.0,),
+    use_sliding_window=False,
+    window_size=(640, 480),
+    stride=320
+):
+    """
+    规划一张图像的所有检测块
+
+    Args:
+        image_size: 图像尺寸 (width, height)
+        multi_scale: 是否启用多尺度检测
+        scales: 尺度列表 (>1 放大, <1 缩小, 1 为全图)
+        use_sliding_window: 是否启用滑动窗口
+        window_size: 滑动窗口尺寸 (width, height)
+        stride: 滑动窗口步长
+
+    Returns:
+        tiles: [{'crop': (x, y, w, h), 'canvas': (width, height)}, ...]
+               第一个总是全图; canvas 大于 crop 时在右下方填充
+    """
+    width, height = image_size
+    full = (0, 0, width, height)
+    tiles = [{'crop': full, 'canvas': (width, height)}]
+    seen = {(full, (width, height))}
+
+    def add(crop, canvas):
+        key = (tuple(int(v) for v in crop), tuple(int(v) for v in canvas))
+        if key not in seen:
+            seen.add(key)
+            tiles.append({'crop': key[0], 'canvas': key[1]})
+
+    if multi_scale:
+        for scale in scales:
+            if scale > 1.0:
+                # 放大: 1/scale 大小的窗口, 50% 重叠
+                win = (max(1, round(width / scale)), max(1, round(height / scale)))
+                stride_xy = (max(1, win[0] // 2), max(1, win[1] // 2))
+                for crop in sliding_window_tiles(image_size, win, stride_xy):
+                    add(crop, crop[2:])
+            elif scale < 1.0:
+                # 缩小: 原图放在更大的画布上
+                add(full, (round(width / scale), round(height / scale)))
+
+    if use_sliding_window:
+        for crop in sliding_window_tiles(image_size, window_size, stride):
+            add(crop, crop[2:])
+
+    return tiles
+
+
+def render_tile(pil_image, tile):
+    """裁剪检测块, 需要时填充到画布大小"""
+    x, y, w, h = tile['crop']
+    canvas_w, canvas_h = tile['canvas']
+    if (x, y, w, h) == (0, 0) + pil_image.size and (canvas_w, canvas_h) == (w, h):
+        return pil_image
+    crop = pil_image.crop((x, y, x + w, y + h))
+    if (canvas_w, canvas_h) == (w, h):
+        return crop
+    canvas = Image.new(pil_image.mode, (canvas_w, canvas_h), PAD_COLOR[:len(pil_image.getbands())])
+    canvas.paste(crop, (0, 0))
+    return canvas
+
+
+def inner_edge_mask(boxes, tile, image_size, margin=2.0):
+    """
+    标记贴着检测块内部边界 (非原图边界) 的框
+
+    相邻窗口互相重叠, 被窗口边界截断的灯具在邻近窗口 (或全图) 中是完整的,
+    截断的框丢弃即可, 避免全局NMS后残留半个框。
+
+    Args:
+        boxes: [N, 4] 原图坐标的框 (torch.Tensor)
+        tile: plan_tiles 返回的检测块
+        image_size: 原图尺寸 (width, height)
+        margin: 判定贴边的距离 (像素)
+
+    Returns:
+        mask: [N] bool, True 表示框贴着内部边界
+    """
+    x, y, w, h = tile['crop']
+    width, height = image_size
+    mask = boxes.new_zeros(boxes.shape[0], dtype=bool)
+    if x > 0:
+        mask |= boxes[:, 0] <= x + margin
+    if y > 0:
+        mask |= boxes[:, 1] <= y + margin
+    if x + w < width:
+        mask |= boxes[:, 2] >= x + w - margin
+    if y + h < height:
+        mask |= boxes[:, 3] >= y + h - margin
+    return mask
@@ -0,0 +1,357 @@
+"""
+帧间检测复用 (固定监控摄像头)
+灯具不会移动, 相邻帧的检测结果几乎相同: 只在关键帧运行完整检测,
+中间帧用全局位移跟踪 (相位相关) 平移检测框, 标签/置信度/距离直接沿用
+
+触发重新检测的条件:
+- 距上次检测已过 detect_every 帧
+- 场景变化 (缩略图平均差异) 超过阈值, 或跟踪置信度过低
+- 图像尺寸或推理参数变化, 或调用方需要的深度图在关键帧结果中不存在
+
+SceneChangeGate 是更简单的门控: 画面与上次推理的帧基本相同时直接返回上次结果
+(适合定时采样的静态场景监控)。它比较缩略图各小块的平均差异并取最大值,
+单盏灯开关这类局部变化也能触发重新推理; 缓存结果最多复用 max_age 秒
+
+用法:
+    tracker = TrackedLocalizer(pipeline, detect_every=10)
+    result = tracker.process_image(frame, confidence_threshold=0.15)
+    result['tracking']  # {'keyframe', 'reason', 'shift', 'scene_change', ...}
+
+    gate = SceneChangeGate(pipeline, threshold=0.03, max_age=30)
+    result = gate.process_image(frame)
+    result['scene_gate']  # {'hit', 'scene_change'}
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def frame_thumbnail(frame, width=160):
+    """
+    生成灰度缩略图 (场景变化检测和位移估计用)
+
+    Args:
+        frame: numpy 图像 (H, W, 3) 或 (H, W), 或 PIL Image
+        width: 缩略图宽度
+
+    Returns:
+        (thumbnail, scale): float32 灰度图 [0, 1], 缩放比例 (缩略图/原图)
+    """
+    frame = np.asarray(frame)
+    full_height, full_width = frame.shape[:2]
+    
+    # 大图先隔行隔列抽样 (保留至少2倍于缩略图的分辨率供区域平均), 避免全分辨率灰度转换
+    step = max(1, full_width // (2 * width))
+    if step > 1:
+        frame = np.ascontiguousarray(frame[::step, ::step])
+    
+    if frame.ndim == 3:
+        gray = cv2.cvtColor(frame[:, :, :3], cv2.COLOR_RGB2GRAY)
+    else:
+        gray = frame
+    scale = min(1.0, width / full_width)
+    size = (max(1, round(full_width * scale)), max(1, round(full_height * scale)))
+    thumbnail = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.float32) / 255.0, scale
+
+
+def scene_change_score(reference, current, shift=(0.0, 0.0), block_size=None):
+    """
+    两张缩略图的场景变化程度 (补偿全局位移后的绝对差, 0 表示完全相同)
+
+    Args:
+        reference: 参考缩略图
+        current: 当前缩略图
+        shift: current 相对 reference 的位移 (dx, dy), 单位为缩略图像素
+        block_size: None 返回全图平均绝对差; 否则按 block_size 像素分块求平均后取最大值
+            (局部变化不会被大面积未变化区域平均掉, 单像素噪声仍在块内平均)
+    """
+    if abs(shift[0]) >= 0.5 or abs(shift[1]) >= 0.5:
+        matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+        reference = cv2.warpAffine(
+            reference, matrix, (reference.shape[1], reference.shape[0]),
+            borderMode=cv2.BORDER_REPLICATE
+        )
+    difference = np.abs(current - reference)
+    if block_size is None:
+        return float(np.mean(difference))
+    height, width = difference.shape[:2]
+    blocks = (max(1, round(width / block_size)), max(1, round(height / block_size)))
+    return float(cv2.resize(difference, blocks, interpolation=cv2.INTER_AREA).max())
+
+
+class TrackedLocalizer:
+    """
+    在 LightLocalization3D 之上的跟踪层
+
+    process_image 与 LightLocalization3D.process_image 接口一致, 可直接替换
+    (如传给 StreamingPipeline)。返回结果额外包含 'tracking' 字段。
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        detect_every=10,
+        scene_change_threshold=0.08,
+        min_track_response=0.2,
+        thumbnail_width=160
+    ):
+        """
+        Args:
+            pipeline: LightLocalization3D 实例
+            detect_every: 每隔多少帧强制重新检测 (1 表示每帧检测)
+            scene_change_threshold: 场景变化阈值 (缩略图平均绝对差, 值域 [0, 1])
+            min_track_response: 相位相关响应低于此值视为跟踪失败, 重新检测
+            thumbnail_width: 缩略图宽度 (越小越快, 越大位移估计越精确)
+        """
+        self.pipeline = pipeline
+        self.detect_every = max(1, int(detect_every))
+        self.scene_change_threshold = scene_change_threshold
+        self.min_track_response = min_track_response
+        self.thumbnail_width = thumbnail_width
+
+        self._lock = threading.Lock()
+        self._keyframe = None
+        self.detector_calls = 0
+        self.tracked_frames = 0
+
+    def reset(self):
+        """丢弃关键帧, 下一帧重新检测"""
+        with self._lock:
+            self._keyframe = None
+
+    def stats(self):
+        """检测/跟踪帧数统计"""
+        total = self.detector_calls + self.tracked_frames
+        return {
+            'detector_calls': self.detector_calls,
+            'tracked_frames': self.tracked_frames,
+            'detector_ratio': self.detector_calls / total if total else 0.0,
+        }
+
+    def process_image(
+        self,
+        image,
+        confidence_threshold=None,
+        compute_depth=True,
+        compute_distance=True,
+        return_features=False
+    ):
+        """
+        处理一帧: 关键帧运行完整流水线, 其余帧跟踪平移上一关键帧的结果
+
+        Args:
+            同 LightLocalization3D.process_image
+
+        Returns:
+            result_dict: 同 process_image, 另含 'tracking':
+                keyframe: 本帧是否运行了完整检测
+                reason: 重新检测的原因 (跟踪帧为 None)
+                frames_since_detection: 距关键帧的帧数
+                shift: 相对关键帧的全局位移 (dx, dy), 原图像素
+                scene_change: 相对关键帧的场景变化程度
+        """
+        with self._lock:
+            start_time = time.time()
+            frame = self._to_array(image)
+            thumbnail, scale = frame_thumbnail(frame, self.thumbnail_width)
+            params = (confidence_threshold, compute_distance, return_features)
+
+            shift = (0.0, 0.0)
+            score = 0.0
+            reason = self._redetect_reason(frame, thumbnail, params, compute_depth)
+            if reason is None:
+                shift, response = cv2.phaseCorrelate(
+                    self._keyframe['thumbnail'].astype(np.float64),
+                    thumbnail.astype(np.float64)
+                )
+                score = scene_change_score(self._keyframe['thumbnail'], thumbnail, shift)
+                if response < self.min_track_response:
+                    reason = 'track_lost'
+                elif score > self.scene_change_threshold:
+                    reason = 'scene_change'
+
+            if reason is not None:
+                result = self.pipeline.process_image(
+                    image,
+                    confidence_threshold=confidence_threshold,
+                    compute_depth=compute_depth,
+                    compute_distance=compute_distance,
+                    return_features=return_features
+                )
+                self._keyframe = {
+                    'result': result,
+                    'thumbnail': thumbnail,
+                    'shape': frame.shape[:2],
+                    'params': params,
+                    'frames_since': 0,
+                }
+                self.detector_calls += 1
+                return {**result, 'tracking': self._tracking_info(True, reason, (0.0, 0.0), 0.0)}
+
+            # 跟踪帧: 平移关键帧检测框
+            self._keyframe['frames_since'] += 1
+            self.tracked_frames += 1
+            offset = (shift[0] / scale, shift[1] / scale)
+            keyframe_result = self._keyframe['result']
+            detections = self._shift_detections(keyframe_result['detections'], offset, frame.shape[:2])
+
+            elapsed = time.time() - start_time
+            return {
+                **keyframe_result,
+                'detections': detections,
+                'depth_map': keyframe_result.get('depth_map') if compute_depth else None,
+                'timing': {'detection': 0.0, 'features': 0.0, 'depth': 0.0, 'distance': 0.0,
+                           'tracking': elapsed, 'total': elapsed},
+                'tracking': self._tracking_info(False, None, offset, score),
+            }
+
+    def _redetect_reason(self, frame, thumbnail, params, compute_depth):
+        """无需相位相关即可判定的重新检测原因 (None 表示可以尝试跟踪)"""
+        keyframe = self._keyframe
+        if keyframe is None:
+            return 'first_frame'
+        if keyframe['shape'] != frame.shape[:2] or keyframe['thumbnail'].shape != thumbnail.shape:
+            return 'size_changed'
+        if keyframe['params'] != params:
+            return 'params_changed'
+        if compute_depth and keyframe['result'].get('depth_map') is None:
+            return 'depth_requested'
+        if keyframe['frames_since'] + 1 >= self.detect_every:
+            return 'interval'
+        return None
+
+    def _tracking_info(self, keyframe, reason, shift, score):
+        return {
+            'keyframe': keyframe,
+            'reason': reason,
+            'frames_since_detection': self._keyframe['frames_since'],
+            'shift': (float(shift[0]), float(shift[1])),
+            'scene_change': score,
+        }
+
+    @staticmethod
+    def _shift_detections(detections, offset, shape):
+        """平移检测框并裁剪到图像范围, 完全移出画面的框丢弃"""
+        height, width = shape
+        dx, dy = offset
+        shifted = []
+        for det in detections:
+            box = det['box'] + np.array([dx, dy, dx, dy], dtype=det['box'].dtype)
+            box = np.clip(box, 0, [width, height, width, height]).astype(det['box'].dtype)
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            shifted.append({**det, 'box': box})
+        return shifted
+
+    @staticmethod
+    def _to_array(image):
+        if isinstance(image, np.ndarray):
+            return image
+        return np.asarray(image)
+
+
+class SceneChangeGate:
+    """
+    场景变化门控: 画面基本不变时直接返回上次推理结果
+
+    与上次 *实际推理* 的帧比较 (而非上一帧), 缓慢变化累积超过阈值后也会重新推理。
+    变化程度取缩略图各小块平均差异的最大值, 画面局部变化 (如一盏灯开关) 即可触发;
+    缓存结果超过 max_age 秒后无论画面是否变化都重新推理。
+    process_image 与 LightLocalization3D.process_image 接口一致,
+    返回结果额外包含 'scene_gate' 字段。
+    """
+
+    def __init__(self, pipeline, threshold=0.03, thumbnail_width=64, block_size=4, max_age=30.0):
+        """
+        Args:
+            pipeline: LightLocalization3D 实例 (或任何提供 process_image 的对象)
+            threshold: 灵敏度, 缩略图各小块平均绝对差的最大值低于此值视为未变化
+                (值域 [0, 1], 越小越灵敏)
+            thumbnail_width: 比较用缩略图宽度
+            block_size: 分块边长 (缩略图像素), 默认 64 像素宽的缩略图分为 16 列
+            max_age: 缓存结果最长复用时间 (秒), None 表示不限 (静态画面将永远复用旧结果)
+        """
+        self.pipeline = pipeline
+        self.threshold = threshold
+        self.thumbnail_width = thumbnail_width
+        self.block_size = block_size
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._cached = None
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        """丢弃缓存结果, 下一帧重新推理"""
+        with self._lock:
+            self._cached = None
+
+    def stats(self):
+        """命中/未命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def process_image(
+        self,
+        image,
+        confidence_threshold=None,
+        compute_depth=True,
+        compute_distance=True,
+        return_features=False
+    ):
+        """
+        处理一帧: 画面未变化时返回缓存结果, 否则运行完整流水线
+
+        Returns:
+            result_dict: 同 process_image, 另含 'scene_gate':
+                hit: 是否直接返回了缓存结果
+                scene_change: 相对上次推理帧的变化程度 (首帧或参数变化时为 None)
+        """
+        with self._lock:
+            start_time = time.time()
+            thumbnail, _ = frame_thumbnail(image, self.thumbnail_width)
+            params = (confidence_threshold, compute_depth, compute_distance, return_features)
+
+            score = None
+            cached = self._cached
+            if (
+                cached is not None
+                and cached['params'] == params
+                and cached['thumbnail'].shape == thumbnail.shape
+                and (self.max_age is None or start_time - cached['time'] <= self.max_age)
+            ):
+                score = scene_change_score(cached['thumbnail'], thumbnail, block_size=self.block_size)
+                if score <= self.threshold:
+                    self.hits += 1
+                    elapsed = time.time() - start_time
+                    return {
+                        **cached['result'],
+                        'timing': {'detection': 0.0, 'features': 0.0, 'depth': 0.0, 'distance': 0.0,
+                                   'scene_gate': elapsed, 'total': elapsed},
+                        'scene_gate': {'hit': True, 'scene_change': score},
+                    }
+
+            self.misses += 1
+            result = self.pipeline.process_image(
+                image,
+                confidence_threshold=confidence_threshold,
+                compute_depth=compute_depth,
+                compute_distance=compute_distance,
+                return_features=return_features
+            )
+            self._cached = {
+                'result': result,
+                'thumbnail': thumbnail,
+                'params': params,
+                'time': start_time,
+            }
+            return {**result, 'scene_gate': {'hit': False, 'scene_change': score}}